@@ -0,0 +1,477 @@
+"""Offline bulk scoring of admissions and stored ECGs, sharded over a process pool.
+
+    python batch_score.py admissions --features master_features.csv --model disease_model.pkl \\
+        --output scores/admissions --db medical_chatbot.db
+    python batch_score.py ecg --input ptbxl/records100 ecg_images/ --model ecg_disease_detector.h5 \\
+        --output scores/ecg --db medical_chatbot.db
+
+Inputs are read as streams and cut into fixed-size shards: chunks of
+``--shard-size`` rows of a master_features.csv-style table, or ``--shard-size``
+WFDB records / ECG images in directory order. Workers load the model once
+(through the model registry) and score one shard per task. At most two shards
+per worker are in flight, so memory stays bounded however large the input is.
+
+Each finished shard is written as its own part file (part-00042.parquet, or
+.csv without pyarrow), then with ``--db`` to the predictions (admissions) or
+analysis_results (ECGs) table in one transaction, and only then recorded in
+``checkpoint.json`` in the output directory. ``--resume`` skips recorded
+shards. A shard scored twice (crash between writing and checkpointing)
+replaces its part file and its rows instead of duplicating them.
+
+With ``--thresholds disease_thresholds.json`` (from forest_tuning.py) each
+label uses its tuned threshold instead of ``--threshold``.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+
+from warmup import is_installed
+
+DEFAULT_SHARD_SIZE = {'admissions': 256, 'ecg': 64}
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff')
+STAGES = ['read', 'encode', 'predict', 'features', 'write', 'db', 'checkpoint']
+
+# Per-worker state, set once by the pool initializer
+_worker = {}
+
+
+def _limit_threads():
+    """One compute thread per worker process; the pool provides the parallelism"""
+    for name in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'TF_NUM_INTRAOP_THREADS',
+                 'TF_NUM_INTEROP_THREADS'):
+        os.environ.setdefault(name, "1")
+
+
+# Admissions
+
+def admission_shards(csv_path, shard_size):
+    """Yield (shard_id, DataFrame chunk) from a master_features.csv-style table"""
+    from feature_table import read_dtypes
+
+    columns = pd.read_csv(csv_path, nrows=0).columns
+    reader = pd.read_csv(csv_path, dtype=read_dtypes(columns), chunksize=shard_size)
+    for shard_id, chunk in enumerate(reader):
+        yield shard_id, chunk
+
+
+def encode_admissions(frame, feature_names, means=None):
+    """Encode a chunk the way the disease model was trained (dummies, mean imputation)
+
+    Dummy columns of categories absent from the chunk are 0; other missing
+    values take ``means`` (feature name -> training mean).
+    """
+    from disease_dataset import NON_FEATURE_COLUMNS
+
+    categorical = [c for c in frame.columns if c not in NON_FEATURE_COLUMNS
+                   and (isinstance(frame[c].dtype, pd.CategoricalDtype) or frame[c].dtype == object)]
+    X = pd.get_dummies(frame.drop(columns=[c for c in NON_FEATURE_COLUMNS if c in frame.columns]),
+                       columns=categorical)
+    X = X.reindex(columns=feature_names).astype(np.float64)
+    dummies = [name for name in feature_names if any(name.startswith(f"{c}_") for c in categorical)]
+    X[dummies] = X[dummies].fillna(0.0)
+    if means is not None:
+        X = X.fillna(means)
+    return X
+
+
+def load_training_reference(args, feature_names, n_labels, tuning=None):
+    """(ICD-9 codes of the model's outputs, training imputer mean per feature)
+
+    A forest_tuning.py artifact carries both; otherwise they are re-derived
+    from the training CSVs like Merged_signals.ipynb. --labels overrides the
+    codes.
+    """
+    if tuning is not None and 'imputer_means' in tuning:
+        codes, means = list(tuning['labels']), pd.Series(tuning['imputer_means'], dtype=np.float64)
+    else:
+        from disease_dataset import imputer_means, load_training_data
+        min_label_count = tuning['data']['min_label_count'] if tuning is not None else 30
+        _, _, mlb, merged = load_training_data(args.features, args.diagnoses, min_label_count=min_label_count)
+        codes, means = list(mlb.classes_), imputer_means(merged)
+    if args.labels:
+        with open(args.labels, 'r') as f:
+            codes = json.load(f)
+    if len(codes) != n_labels:
+        print(f"✗ {len(codes)} label codes for {n_labels} model outputs; using output numbers")
+        codes = [f"label_{j}" for j in range(n_labels)]
+    missing = [name for name in feature_names if name not in means.index]
+    if missing:
+        print(f"✗ No training mean for {len(missing)} model features (e.g. {missing[0]}); imputing 0")
+    return codes, means.reindex(feature_names).fillna(0.0)
+
+
+def load_icd9_names(path):
+    if not path or not os.path.exists(path):
+        return {}
+    icd9_df = pd.read_csv(path, sep="\t", encoding='latin-1')
+    icd9_df.columns = icd9_df.columns.str.strip()
+    codes = icd9_df["DIAGNOSIS CODE"].astype(str).str.strip()
+    return dict(zip(codes, icd9_df["LONG DESCRIPTION"]))
+
+
+def prepare_admissions(args):
+    """Compile the forest and collect what workers need: (forest, means, codes, names)"""
+    from forest_inference import FlatForest, load_thresholds
+    from model_registry import registry
+
+    # joblib (the notebook's joblib.dump) whatever the extension; joblib also reads plain pickles
+    registry.register(args.model, args.model, 'joblib')
+    forest = FlatForest.from_sklearn(registry.get(args.model), thresholds=args.threshold)
+    if forest.feature_names is None:
+        raise SystemExit("✗ The disease model was not fitted on a DataFrame; its feature order is unknown")
+    tuning = None
+    if args.thresholds:
+        # Per-label thresholds from forest_tuning.py, only for the model they were tuned with
+        tuning = registry.get(args.thresholds)
+        try:
+            forest.set_thresholds(load_thresholds(tuning, forest.n_labels, args.model))
+        except ValueError as e:
+            raise SystemExit(f"✗ {e}")
+    codes, means = load_training_reference(args, forest.feature_names, forest.n_labels, tuning)
+    return forest, means, codes, load_icd9_names(args.icd9)
+
+
+def _init_admissions(forest, means, codes, names):
+    _limit_threads()
+    _worker.update(forest=forest, means=means, codes=codes, names=names)
+
+
+def score_admissions(shard_id, frame):
+    """Worker task: (shard_id, result rows, stage seconds)"""
+    timings = {}
+    start = time.perf_counter()
+    X = encode_admissions(frame, _worker['forest'].feature_names, _worker['means'])
+    timings['encode'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    proba, predicted = _worker['forest'].predict(X)
+    timings['predict'] = time.perf_counter() - start
+
+    codes, names = _worker['codes'], _worker['names']
+    labels = [[codes[j] for j in np.flatnonzero(row)] for row in predicted]
+    rows = pd.DataFrame({
+        'hadm_id': frame['hadm_id'].to_numpy(),
+        'predicted_codes': ["; ".join(row) for row in labels],
+        'predicted_diseases': ["; ".join(names.get(code, f"ICD9-{code}") for code in row) for row in labels],
+        'max_probability': proba.max(axis=1),
+    })
+    probabilities = pd.DataFrame(proba, columns=[f"p_{code}" for code in codes])
+    return shard_id, pd.concat([rows, probabilities], axis=1), timings
+
+
+def admission_db_rows(run_id, rows):
+    predictions = [{
+        'prediction_id': f"{run_id}:{row.hadm_id}",
+        'prediction_type': 'disease',
+        'prediction_data': json.dumps({'hadm_id': int(row.hadm_id), 'codes': row.predicted_codes,
+                                       'diseases': row.predicted_diseases}),
+        'confidence': float(row.max_probability),
+    } for row in rows.itertuples()]
+    return predictions, ()
+
+
+# ECGs
+
+def ecg_paths(inputs):
+    """Yield WFDB record paths (without extension) and ECG image paths, directory by directory in sorted order"""
+    for root_dir in inputs:
+        for dir_path, dir_names, file_names in os.walk(root_dir):
+            dir_names.sort()
+            for name in sorted(file_names):
+                base, extension = os.path.splitext(name)
+                if extension == '.hea':
+                    yield os.path.join(dir_path, base)
+                elif extension.lower() in IMAGE_EXTENSIONS:
+                    yield os.path.join(dir_path, name)
+
+
+def ecg_shards(inputs, shard_size):
+    """Yield (shard_id, [paths]) in discovery order"""
+    shard, shard_id = [], 0
+    for path in ecg_paths(inputs):
+        shard.append(path)
+        if len(shard) == shard_size:
+            yield shard_id, shard
+            shard, shard_id = [], shard_id + 1
+    if shard:
+        yield shard_id, shard
+
+
+def _init_ecg(model_path):
+    _limit_threads()
+    from ecg_digitizer import ECGDigitizer
+    from model_registry import registry
+
+    _worker['model'] = registry.get(model_path)
+    for name, artifact in (('scaler', 'scaler.pkl'), ('label_encoder', 'label_encoder.pkl')):
+        _worker[name] = registry.get(artifact) if os.path.exists(artifact) else None
+    _worker['digitizer'] = ECGDigitizer(sampling_rate=100, duration=10.0)
+
+
+def read_ecg(path):
+    """(1000, 12) signal of a WFDB record or ECG image, or None"""
+    from ecg_loader import read_record
+
+    if path.lower().endswith(IMAGE_EXTENSIONS):
+        try:
+            return _worker['digitizer'].digitize_file(path)
+        except Exception:
+            return None
+    return read_record((path, 100, 1000, 12))
+
+
+def score_ecgs(shard_id, paths):
+    """Worker task: (shard_id, result rows, stage seconds)"""
+    from ecg_features import extract_features, heart_rate_label, quality_label, rhythm_label
+    from ecg_loader import scale_signals
+
+    timings = {}
+    start = time.perf_counter()
+    signals = [read_ecg(path) for path in paths]
+    loaded = np.array([signal is not None for signal in signals])
+    batch = np.stack([signal for signal in signals if signal is not None]) if loaded.any() \
+        else np.zeros((0, 1000, 12), dtype=np.float32)
+    timings['read'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    scaled = scale_signals(_worker['scaler'], batch) if _worker['scaler'] is not None and len(batch) else batch
+    timings['encode'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    probs = _worker['model'].predict(scaled, batch_size=len(scaled), verbose=0) if len(scaled) else np.zeros((0, 1))
+    timings['predict'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    features = extract_features(batch) if len(batch) else []
+    timings['features'] = time.perf_counter() - start
+
+    encoder = _worker['label_encoder']
+    classes = list(encoder.classes_) if encoder is not None else [f"CLASS_{j}" for j in range(probs.shape[1])]
+    rows = []
+    k = 0
+    for path, ok in zip(paths, loaded):
+        row = {'record': path, 'source': 'image' if path.lower().endswith(IMAGE_EXTENSIONS) else 'wfdb',
+               'loaded': bool(ok), 'code': None, 'confidence': np.nan, 'heart_rate': None, 'rhythm': None,
+               'quality': None, 'probabilities': None}
+        if ok:
+            predicted = int(np.argmax(probs[k]))
+            row.update(code=classes[predicted], confidence=float(probs[k][predicted]),
+                       heart_rate=str(heart_rate_label(features[k])), rhythm=rhythm_label(features[k]),
+                       quality=quality_label(features[k]),
+                       probabilities=json.dumps({code: round(float(p), 4) for code, p in zip(classes, probs[k])}))
+            k += 1
+        rows.append(row)
+    return shard_id, pd.DataFrame(rows), timings
+
+
+def ecg_db_rows(run_id, rows):
+    # Keyed on the full path: records with the same file name in different --input directories
+    # must not replace each other's row
+    results = [{
+        'patient_id': os.path.abspath(row.record),
+        'analysis_type': 'ecg',
+        'results': json.dumps({'record': os.path.basename(row.record), 'code': row.code, 'heart_rate': row.heart_rate,
+                               'rhythm': row.rhythm, 'quality': row.quality,
+                               'probabilities': json.loads(row.probabilities)}),
+        'confidence_score': row.confidence,
+    } for row in rows.itertuples() if row.loaded]
+    return (), results
+
+
+# Output, checkpoint and the driver loop
+
+def write_part(rows, output_dir, shard_id, fmt):
+    """Write one shard's rows atomically as part-NNNNN.<fmt>"""
+    path = os.path.join(output_dir, f"part-{shard_id:05d}.{fmt}")
+    tmp_path = path + ".tmp"
+    if fmt == 'parquet':
+        rows.to_parquet(tmp_path, index=False)
+    else:
+        rows.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    return path
+
+
+class Checkpoint:
+    """Completed shards and running totals of a run, rewritten atomically after every shard"""
+
+    def __init__(self, path, config, resume=False):
+        self.path = path
+        self.config = config
+        state = None
+        if resume and os.path.exists(path):
+            with open(path, 'r') as f:
+                state = json.load(f)
+            if state['config'] != config:
+                raise SystemExit(f"✗ {path} was written with different settings; rerun without --resume")
+        state = state or {'run_id': f"batch-{config['kind']}-{time.strftime('%Y%m%d-%H%M%S')}", 'completed': [],
+                          'rows': 0, 'timings': {}}
+        self.run_id = state['run_id']
+        self.completed = set(state['completed'])
+        self.rows = state['rows']
+        self.timings = defaultdict(float, state['timings'])
+
+    def mark(self, shard_id, n_rows, timings):
+        self.completed.add(shard_id)
+        self.rows += n_rows
+        for stage, seconds in timings.items():
+            self.timings[stage] += seconds
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'run_id': self.run_id, 'config': self.config, 'completed': sorted(self.completed),
+                       'rows': self.rows, 'timings': self.timings}, f)
+        os.replace(tmp_path, self.path)
+
+
+def run(shards, score, initializer, initargs, db_rows, args, config):
+    """Score every shard not in the checkpoint; returns a summary dict"""
+    os.makedirs(args.output, exist_ok=True)
+    checkpoint = Checkpoint(os.path.join(args.output, "checkpoint.json"), config, resume=args.resume)
+    db = None
+    if args.db:
+        from chat_database import ChatDatabase
+        db = ChatDatabase(args.db)
+
+    timings = defaultdict(float)
+    rows_scored = skipped = failed = submitted = 0
+    start = time.perf_counter()
+
+    def finish(future):
+        nonlocal rows_scored, failed
+        try:
+            shard_id, rows, shard_timings = future.result()
+        except Exception as e:
+            failed += 1
+            print(f"✗ Shard {future.shard_id} failed: {e}")
+            return
+        shard_timings = dict(shard_timings, read=shard_timings.get('read', 0.0) + future.read_seconds)
+        stage_start = time.perf_counter()
+        write_part(rows, args.output, shard_id, args.format)
+        shard_timings['write'] = time.perf_counter() - stage_start
+        if db is not None:
+            stage_start = time.perf_counter()
+            predictions, analysis_results = db_rows(checkpoint.run_id, rows)
+            db.save_batch_results(checkpoint.run_id, predictions, analysis_results)
+            shard_timings['db'] = time.perf_counter() - stage_start
+        stage_start = time.perf_counter()
+        checkpoint.mark(shard_id, len(rows), shard_timings)
+        shard_timings['checkpoint'] = time.perf_counter() - stage_start
+        for stage, seconds in shard_timings.items():
+            timings[stage] += seconds
+        rows_scored += len(rows)
+        elapsed = time.perf_counter() - start
+        print(f"✓ Shard {shard_id}: {len(rows)} rows ({rows_scored / elapsed:.0f} rows/s overall)")
+
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=initializer, initargs=initargs) as pool:
+        pending = set()
+        shard_iter = iter(shards)
+        while True:
+            read_start = time.perf_counter()
+            shard_id, payload = next(shard_iter, (None, None))
+            read_seconds = time.perf_counter() - read_start
+            if shard_id is None:
+                break
+            if shard_id in checkpoint.completed:
+                skipped += 1
+                continue
+            if args.max_shards is not None and submitted >= args.max_shards:
+                break
+            while len(pending) >= 2 * args.workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    finish(future)
+            future = pool.submit(score, shard_id, payload)
+            future.shard_id, future.read_seconds = shard_id, read_seconds
+            pending.add(future)
+            submitted += 1
+        for future in wait(pending).done:
+            finish(future)
+
+    if db is not None:
+        db.close()
+    return {
+        'run_id': checkpoint.run_id,
+        'rows': rows_scored,
+        'shards': submitted - failed,
+        'skipped': skipped,
+        'failed': failed,
+        'seconds': time.perf_counter() - start,
+        'timings': dict(timings),
+    }
+
+
+def print_summary(summary):
+    rate = summary['rows'] / summary['seconds'] if summary['seconds'] else 0.0
+    print()
+    print(f"Run {summary['run_id']}: {summary['rows']} rows in {summary['shards']} shards "
+          f"({summary['skipped']} skipped from the checkpoint, {summary['failed']} failed) "
+          f"in {summary['seconds']:.1f}s, {rate:.1f} rows/s")
+    total = sum(summary['timings'].values()) or 1.0
+    print(f"{'STAGE':<11} {'SECONDS':>8} {'MS/ROW':>8} {'SHARE':>6}")
+    for stage in STAGES:
+        seconds = summary['timings'].get(stage)
+        if seconds is None:
+            continue
+        print(f"{stage:<11} {seconds:>8.2f} {seconds * 1000 / max(summary['rows'], 1):>8.2f} "
+              f"{seconds / total:>6.0%}")
+    print("(worker stages are summed over all workers)")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk offline scoring of admissions and ECG archives")
+    parser.add_argument("kind", choices=["admissions", "ecg"])
+    parser.add_argument("--features", default="master_features.csv", help="Admissions table to score")
+    parser.add_argument("--diagnoses", default="DIAGNOSES_ICD.csv",
+                        help="With --features, re-derives the model's label codes and training means")
+    parser.add_argument("--labels", help="JSON list of the disease model's ICD-9 codes, in output order")
+    parser.add_argument("--icd9", default="icd9.txt", help="ICD-9 descriptions")
+    parser.add_argument("--threshold", type=float, default=0.3)
+    parser.add_argument("--thresholds", help="tuning.json / disease_thresholds.json from forest_tuning.py: "
+                                             "per-label thresholds and label codes, instead of --threshold")
+    parser.add_argument("--input", nargs="+", help="WFDB / ECG image directories")
+    parser.add_argument("--model", help="Model path (default: disease_model.pkl / ecg_disease_detector.h5)")
+    parser.add_argument("--output", required=True, help="Directory for part files and checkpoint.json")
+    parser.add_argument("--format", choices=["parquet", "csv"],
+                        default="parquet" if is_installed('pyarrow') else "csv")
+    parser.add_argument("--db", help="Also write results to this medical_chatbot.db")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--shard-size", type=int, help="Rows or records per shard (default: 256 / 64)")
+    parser.add_argument("--resume", action="store_true", help="Skip shards recorded in the checkpoint")
+    parser.add_argument("--max-shards", type=int, help="Stop after scoring this many shards (resume later)")
+    args = parser.parse_args(argv)
+    args.shard_size = args.shard_size or DEFAULT_SHARD_SIZE[args.kind]
+    if args.kind == 'ecg' and not args.input:
+        parser.error("ecg scoring needs --input directories")
+    if args.format == 'parquet' and not is_installed('pyarrow'):
+        parser.error("Parquet output needs pyarrow (pip install pyarrow); use --format csv")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.kind == 'admissions':
+        args.model = args.model or "disease_model.pkl"
+        config = {'kind': 'admissions', 'input': os.path.abspath(args.features), 'model': os.path.abspath(args.model),
+                  'shard_size': args.shard_size, 'threshold': args.threshold,
+                  'thresholds': args.thresholds and os.path.abspath(args.thresholds), 'format': args.format}
+        summary = run(admission_shards(args.features, args.shard_size), score_admissions, _init_admissions,
+                      prepare_admissions(args), admission_db_rows, args, config)
+    else:
+        args.model = args.model or "ecg_disease_detector.h5"
+        config = {'kind': 'ecg', 'input': [os.path.abspath(path) for path in args.input],
+                  'model': os.path.abspath(args.model), 'shard_size': args.shard_size, 'format': args.format}
+        summary = run(ecg_shards(args.input, args.shard_size), score_ecgs, _init_ecg, (args.model,),
+                      ecg_db_rows, args, config)
+    print_summary(summary)
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
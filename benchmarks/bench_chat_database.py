@@ -0,0 +1,134 @@
+"""Load test for the chat persistence layer (p50/p99 read and write latency).
+
+Builds a throwaway copy of the medical_chatbot.db schema, fills it with
+``--rows`` messages (plus proportional lab results and predictions), then runs
+concurrent reader and writer threads against it. ``--schema-version 1`` runs
+the same load without the secondary indexes for comparison.
+
+    python benchmarks/bench_chat_database.py --rows 100000
+    python benchmarks/bench_chat_database.py --rows 1000000 --schema-version 1
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import threading
+
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+from chat_database import ChatDatabase, new_id, _insert_many
+
+MESSAGES_PER_CONVERSATION = 10
+CONVERSATIONS_PER_PATIENT = 5
+LAB_NAMES = ['glucose', 'creatinine', 'ALT', 'AST', 'white_blood_cells', 'hemoglobin', 'sodium']
+
+
+def populate(db, n_messages, batch_size=10000):
+    """Fill the database with synthetic patients, conversations, messages, labs and predictions"""
+    n_conversations = max(1, n_messages // MESSAGES_PER_CONVERSATION)
+    n_patients = max(1, n_conversations // CONVERSATIONS_PER_PATIENT)
+    patients = [new_id() for _ in range(n_patients)]
+    conversations = [(new_id(), random.choice(patients)) for _ in range(n_conversations)]
+
+    with db.transaction() as conn:
+        _insert_many(conn, "patients", ("patient_id", "name"), [(p, f"Patient {i}") for i, p in enumerate(patients)])
+        _insert_many(conn, "conversations", ("conversation_id", "patient_id"), conversations)
+
+    for start in range(0, n_messages, batch_size):
+        messages, labs, predictions = [], [], []
+        for i in range(start, min(start + batch_size, n_messages)):
+            conversation_id, patient_id = conversations[i % n_conversations]
+            messages.append((new_id(), conversation_id, 'user' if i % 2 == 0 else 'assistant', "x" * 200))
+            if i % 2 == 0:
+                labs.append((new_id(), patient_id, random.choice(LAB_NAMES), random.uniform(0, 200), "mg/dL", None))
+            if i % 4 == 0:
+                predictions.append((new_id(), conversation_id, "disease", '{"name": "Hypertension"}', 0.7))
+        with db.transaction() as conn:
+            _insert_many(conn, "messages", ("message_id", "conversation_id", "role", "content"), messages)
+            _insert_many(conn, "lab_results", ("result_id", "patient_id", "test_name", "value", "unit",
+                                               "reference_range"), labs)
+            _insert_many(conn, "predictions", ("prediction_id", "conversation_id", "prediction_type",
+                                               "prediction_data", "confidence"), predictions)
+
+    return conversations
+
+
+def run_load(db, conversations, n_readers, n_writers, duration):
+    """Run reader/writer threads for ``duration`` seconds, returning latencies in ms"""
+    read_latencies, write_latencies = [], []
+    stop = time.perf_counter() + duration
+
+    def reader():
+        latencies = []
+        while time.perf_counter() < stop:
+            conversation_id, patient_id = random.choice(conversations)
+            start = time.perf_counter()
+            db.get_conversation_history(conversation_id)
+            db.get_patient_labs(patient_id)
+            latencies.append((time.perf_counter() - start) * 1000)
+        read_latencies.extend(latencies)
+
+    def writer():
+        latencies = []
+        while time.perf_counter() < stop:
+            conversation_id, patient_id = random.choice(conversations)
+            start = time.perf_counter()
+            db.save_turn(
+                conversation_id, patient_id,
+                messages=[{'role': 'user', 'content': "I have chest pain"},
+                          {'role': 'assistant', 'content': "y" * 500}],
+                predictions=[{'prediction_type': 'disease', 'prediction_data': '{}', 'confidence': 0.5}],
+                lab_results=[{'test_name': name, 'value': 1.0, 'unit': 'mg/dL'} for name in LAB_NAMES],
+            )
+            latencies.append((time.perf_counter() - start) * 1000)
+        write_latencies.extend(latencies)
+
+    threads = [threading.Thread(target=reader) for _ in range(n_readers)]
+    threads += [threading.Thread(target=writer) for _ in range(n_writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return np.array(read_latencies), np.array(write_latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the chat SQLite persistence layer")
+    parser.add_argument("--rows", type=int, default=100000, help="Messages to preload")
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds of load")
+    parser.add_argument("--schema-version", type=int, default=None,
+                        help="Migrate only up to this version (1 = no secondary indexes)")
+    args = parser.parse_args()
+
+    random.seed(42)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "load_test.db")
+        db = ChatDatabase(db_path, **({'target_version': args.schema_version} if args.schema_version else {}))
+
+        start = time.perf_counter()
+        conversations = populate(db, args.rows)
+        print(f"Preloaded {args.rows} messages in {time.perf_counter() - start:.1f}s "
+              f"({os.path.getsize(db_path) / 2**20:.0f} MB, schema version {db.version})")
+
+        reads, writes = run_load(db, conversations, args.readers, args.writers, args.duration)
+        db.close()
+
+    print("Chat database load test")
+    print("=" * 60)
+    print(f"{'OPERATION':<22} {'OPS/S':>8} {'P50 (ms)':>9} {'P99 (ms)':>9}")
+    for name, latencies in [("read (history + labs)", reads), ("write (save_turn)", writes)]:
+        if len(latencies) == 0:
+            print(f"{name:<22} {'-':>8}")
+            continue
+        print(f"{name:<22} {len(latencies) / args.duration:>8.0f} "
+              f"{np.percentile(latencies, 50):>9.2f} {np.percentile(latencies, 99):>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Time to first byte of /chat (whole JSON) vs /chat/stream (server-sent events).
+
+Runs the ChatPipeline app against the stub Ollama server (llm_stub.py) with
+llama2-on-CPU-like timings: ``--first-token-delay`` of prompt evaluation,
+then one token every ``--token-delay`` seconds. For each concurrency level it
+reports, from the client's point of view:
+
+- TTFB:        first response byte (the whole JSON for /chat, the predictions event for /chat/stream)
+- FIRST TOKEN: first report token (/chat/stream only)
+- TOTAL:       complete report
+
+A second table measures the LLM client alone against a zero-delay stub: a
+pooled keep-alive OllamaClient vs a new HTTP client per report.
+
+    python benchmarks/bench_chat_streaming.py --concurrency 1 4 --requests 8
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+import httpx
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+from chat_pipeline import ChatPipeline, create_app
+from llm_client import OllamaClient
+from llm_stub import BackgroundServer, StubLLMServer
+from load_chat import PAYLOAD, synthetic_tabular
+
+
+async def timed_chat(http, url):
+    start = time.perf_counter()
+    response = await http.post(url, json=PAYLOAD)
+    response.json()
+    elapsed = (time.perf_counter() - start) * 1000
+    return elapsed, None, elapsed
+
+
+async def timed_stream(http, url):
+    start = time.perf_counter()
+    ttfb = first_token = None
+    async with http.stream("POST", url, json=PAYLOAD) as response:
+        event = None
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                now = (time.perf_counter() - start) * 1000
+                if ttfb is None:
+                    ttfb = now
+                if event == 'token' and first_token is None:
+                    first_token = now
+                if event == 'done':
+                    json.loads(line[len("data: "):])
+    return ttfb, first_token, (time.perf_counter() - start) * 1000
+
+
+async def run_load(call, url, concurrency, requests):
+    """``concurrency`` clients each make ``requests`` sequential calls; returns an (n, 3) ms array"""
+    results = []
+
+    async def client(http):
+        for _ in range(requests):
+            results.append(await call(http, url))
+
+    async with httpx.AsyncClient(timeout=300.0, limits=httpx.Limits(max_connections=concurrency)) as http:
+        await asyncio.gather(*(client(http) for _ in range(concurrency)))
+    return np.array(results, dtype=float)
+
+
+async def connection_reuse(url, requests):
+    """Mean ms per short report: pooled keep-alive client vs a new client per report"""
+    pooled = OllamaClient(url, model="stub")
+    await pooled.generate("warm up")
+    start = time.perf_counter()
+    for _ in range(requests):
+        await pooled.generate("report")
+    pooled_ms = (time.perf_counter() - start) * 1000 / requests
+    await pooled.aclose()
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        fresh = OllamaClient(url, model="stub")
+        await fresh.generate("report")
+        await fresh.aclose()
+    fresh_ms = (time.perf_counter() - start) * 1000 / requests
+    return pooled_ms, fresh_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark streaming /chat time to first byte")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--requests", type=int, default=4, help="Requests per client")
+    parser.add_argument("--slots", type=int, default=2, help="Concurrent LLM generations")
+    parser.add_argument("--first-token-delay", type=float, default=1.5, help="Stub prompt evaluation seconds")
+    parser.add_argument("--token-delay", type=float, default=0.05, help="Stub seconds per token")
+    args = parser.parse_args()
+
+    with StubLLMServer(first_token_delay=args.first_token_delay, token_delay=args.token_delay) as llm_server:
+        llm = OllamaClient(llm_server.url, model="stub", max_concurrent=args.slots, max_waiting=256,
+                           slot_timeout=300.0)
+        pipeline = ChatPipeline(tabular=synthetic_tabular, llm=llm)
+        with BackgroundServer(create_app(pipeline)) as chat_server:
+            print(f"/chat vs /chat/stream: stub LLM with {args.first_token_delay:.1f}s to first token, "
+                  f"{args.token_delay * 1000:.0f} ms/token, {args.slots} generation slots")
+            print("=" * 78)
+            print(f"{'ENDPOINT':<13} {'CLIENTS':>7} {'TTFB P50':>9} {'TTFB P99':>9} {'1ST TOKEN P50':>14} "
+                  f"{'TOTAL P50':>10} {'TOTAL P99':>10}")
+            for concurrency in args.concurrency:
+                for name, call in (("/chat", timed_chat), ("/chat/stream", timed_stream)):
+                    results = asyncio.run(run_load(call, chat_server.url + name, concurrency, args.requests))
+                    first_token = f"{np.percentile(results[:, 1], 50):.0f}" if name != "/chat" else "-"
+                    print(f"{name:<13} {concurrency:>7} {np.percentile(results[:, 0], 50):>9.0f} "
+                          f"{np.percentile(results[:, 0], 99):>9.0f} {first_token:>14} "
+                          f"{np.percentile(results[:, 2], 50):>10.0f} {np.percentile(results[:, 2], 99):>10.0f}")
+            print("(milliseconds)")
+
+    with StubLLMServer(first_token_delay=0.0, token_delay=0.0) as llm_server:
+        pooled_ms, fresh_ms = asyncio.run(connection_reuse(llm_server.url, 200))
+        stats = llm_server.stats()
+    print()
+    print("LLM client, 200 short reports against a zero-delay stub")
+    print(f"{'CLIENT':<24} {'MS/REPORT':>10}")
+    print(f"{'pooled keep-alive':<24} {pooled_ms:>10.2f}")
+    print(f"{'new client per report':<24} {fresh_ms:>10.2f}")
+    print(f"({stats['requests']} requests over {stats['connections']} connections)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Per-turn cost as a conversation grows: full history vs the bounded context manager.
+
+Plays one long conversation against a throwaway medical_chatbot.db, turn by
+turn, in two modes:
+
+- full history: the client resends every message, the backend re-reads the
+  conversation from the messages table and puts all of it in the prompt
+- context:      the client sends the new message, the backend loads the
+                conversation's context row (window + summary, no memory
+                cache, so every turn hits the database) and updates it
+
+Backend time covers loading, prompt building and saving the turn. The LLM
+prefill estimate converts prompt tokens (~4 characters each) with
+``--prefill-tokens-per-s``, a CPU llama2-7B ballpark.
+
+    python benchmarks/bench_conversation_context.py --turns 500
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+from chat_database import ChatDatabase
+from conversation_context import ContextManager
+
+SYMPTOMS = ["chest pain", "shortness of breath", "a headache", "dizziness", "swollen ankles", "fatigue"]
+
+
+def turn_messages(i, rng):
+    user = (f"Since yesterday I also have {rng.choice(SYMPTOMS)}. My glucose this morning was {rng.integers(90, 180)} "
+            f"and my blood pressure {rng.integers(110, 170)}/{rng.integers(70, 100)}. Should I be worried?")
+    assistant = ("Based on the model findings, " + " ".join(rng.choice(
+        ["your", "values", "suggest", "monitoring", "blood", "pressure", "and", "glucose", "closely", "with",
+         "follow-up", "tests", "a", "clinician", "should", "review"], 110)) + ".")
+    return [{'role': 'user', 'content': user}, {'role': 'assistant', 'content': assistant}]
+
+
+def prompt_tokens(text):
+    return len(text) // 4
+
+
+async def play(db, mode, turns, checkpoints, seed=0):
+    """Per-turn (backend ms, prompt tokens, request body bytes), averaged over a few turns before each checkpoint"""
+    rng = np.random.default_rng(seed)
+    manager = ContextManager(db, cache_entries=0)
+    conversation_id = f"bench-{mode}"
+    history, rows = [], []
+    for turn in range(1, turns + 1):
+        messages = turn_messages(turn, rng)
+        request_messages = history + messages[:1] if mode == "full" else messages[:1]
+        body_bytes = len(json.dumps({'conversation_id': conversation_id, 'messages': request_messages}))
+
+        start = time.perf_counter()
+        if mode == "full":
+            stored = db.get_conversation_history(conversation_id)
+            prompt = "\n".join(f"{m['role']}: {m['content']}" for m in stored) + f"\nuser: {messages[0]['content']}"
+            db.save_turn(conversation_id, messages=messages)
+        else:
+            context = manager.load(conversation_id)
+            prompt = context.render() + f"\nuser: {messages[0]['content']}"
+            await manager.update(context, messages)
+            db.save_turns([{'conversation_id': conversation_id, 'messages': messages, 'context': context.state()}])
+        elapsed = (time.perf_counter() - start) * 1000
+
+        history += messages
+        rows.append((elapsed, prompt_tokens(prompt), body_bytes))
+    rows = np.array(rows, dtype=float)
+    return {checkpoint: rows[max(0, checkpoint - 5):checkpoint].mean(axis=0) for checkpoint in checkpoints}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-turn cost of growing conversations")
+    parser.add_argument("--turns", type=int, default=500)
+    parser.add_argument("--prefill-tokens-per-s", type=float, default=50.0)
+    args = parser.parse_args()
+    checkpoints = [c for c in (10, 50, 100, 200, 300, 400, 500, 1000) if c <= args.turns] or [args.turns]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = ChatDatabase(os.path.join(tmp_dir, "medical_chatbot.db"))
+        results = {mode: asyncio.run(play(db, mode, args.turns, checkpoints)) for mode in ("full", "context")}
+        db.close()
+
+    print()
+    print(f"Per-turn cost over a {args.turns}-turn conversation (mean of the 5 turns up to each point)")
+    print("=" * 86)
+    print(f"{'TURN':>5} | {'BACKEND (ms)':>20} | {'PROMPT (tokens)':>20} | {'EST. PREFILL (s)':>18} | {'BODY (KB)':>12}")
+    print(f"{'':>5} | {'full':>9} {'context':>10} | {'full':>9} {'context':>10} | {'full':>8} {'context':>9} | "
+          f"{'full':>5} {'context':>6}")
+    for checkpoint in checkpoints:
+        full, context = results['full'][checkpoint], results['context'][checkpoint]
+        print(f"{checkpoint:>5} | {full[0]:>9.2f} {context[0]:>10.2f} | {full[1]:>9.0f} {context[1]:>10.0f} | "
+              f"{full[1] / args.prefill_tokens_per_s:>8.1f} {context[1] / args.prefill_tokens_per_s:>9.1f} | "
+              f"{full[2] / 1024:>5.0f} {context[2] / 1024:>6.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Micro-benchmark for ECG image digitization (ms/image).
+
+Times the digitizer on the sample images shipped with the repo and on
+synthetic 12-lead printouts, for which the true signal is known and the
+tracing fidelity can be reported too.
+
+    python benchmarks/bench_ecg_digitizer.py --repeat 20
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ecg_digitizer import ECGDigitizer
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_IMAGES = ['processed_ocr_image.png', 'chatbot.jpg']
+
+
+def synthetic_signal(seed, n_samples=1000, n_leads=12, sampling_rate=100):
+    """Generate a rough 12-lead ECG with QRS spikes, in mV"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(n_samples) / sampling_rate
+    heart_rate = rng.uniform(55, 110)
+    phase = (t * heart_rate / 60) % 1.0
+    beat = np.exp(-((phase - 0.3) / 0.015) ** 2) - 0.2 * np.exp(-((phase - 0.6) / 0.06) ** 2)
+    gains = rng.uniform(0.5, 1.5, n_leads)
+    return (beat[:, None] * gains[None, :]).astype(np.float32)
+
+
+def render_printout(signal, px_per_mm=4, paper_speed=25.0, gain=10.0, strip_mm=25):
+    """Draw a signal as a stacked 12x1 printout on a light grid"""
+    n_samples, n_leads = signal.shape
+    width = int(n_samples / 100 * paper_speed * px_per_mm)
+    height = n_leads * strip_mm * px_per_mm
+    img = np.full((height, width), 255, dtype=np.uint8)
+
+    # Light 1 mm / darker 5 mm grid, as on a scanned printout
+    img[::px_per_mm, :] = 225
+    img[:, ::px_per_mm] = 225
+    img[::5 * px_per_mm, :] = 200
+    img[:, ::5 * px_per_mm] = 200
+
+    x = np.linspace(0, width - 1, n_samples)
+    for lead in range(n_leads):
+        baseline = (lead + 0.6) * strip_mm * px_per_mm
+        y = baseline - signal[:, lead] * gain * px_per_mm
+        points = np.stack([x, y], axis=1).astype(np.int32)
+        cv2.polylines(img, [points], False, 0, 1)
+
+    return img
+
+
+def legacy_process(image_path):
+    """The previous process_ecg_image: squash the whole page to (1000, 12)"""
+    img = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+    img = cv2.resize(img, (1000, 12)).astype(np.float32)
+    img = (img - img.mean()) / img.std()
+    return img.T
+
+
+def time_per_image(fn, paths, repeat):
+    """Return mean ms/image of fn over paths"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for path in paths:
+            fn(path)
+    return (time.perf_counter() - start) * 1000 / (repeat * len(paths))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ECG image digitization")
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--synthetic', type=int, default=8, help="Number of synthetic printouts")
+    args = parser.parse_args()
+
+    digitizer = ECGDigitizer()
+    samples = [os.path.join(REPO_DIR, name) for name in SAMPLE_IMAGES
+               if os.path.exists(os.path.join(REPO_DIR, name))]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        truths, synthetic = [], []
+        for i in range(args.synthetic):
+            signal = synthetic_signal(i)
+            path = os.path.join(tmp_dir, f"synthetic_{i}.png")
+            cv2.imwrite(path, render_printout(signal))
+            truths.append(signal)
+            synthetic.append(path)
+
+        print("ECG image digitization benchmark")
+        print("=" * 60)
+        for name, paths in [('repo samples', samples), ('synthetic printouts', synthetic)]:
+            if not paths:
+                continue
+            legacy_ms = time_per_image(legacy_process, paths, args.repeat)
+            new_ms = time_per_image(digitizer.digitize_file, paths, args.repeat)
+            print(f"{name:<22} legacy resize: {legacy_ms:7.2f} ms/image   digitizer: {new_ms:7.2f} ms/image")
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            signals, ok = digitizer.digitize_batch(synthetic)
+        batch_ms = (time.perf_counter() - start) * 1000 / (args.repeat * len(synthetic))
+        print(f"{'synthetic (batch)':<22} digitize_batch: {batch_ms:7.2f} ms/image")
+
+        # Fidelity: mean per-lead correlation with the signal that was drawn
+        correlations = [
+            np.corrcoef(signals[i][:, lead], truths[i][:, lead])[0, 1]
+            for i in range(len(synthetic)) for lead in range(12)
+        ]
+        print(f"Mean lead correlation with ground truth: {np.nanmean(correlations):.3f}")
+
+
+if __name__ == "__main__":
+    main()
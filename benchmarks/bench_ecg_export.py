@@ -0,0 +1,173 @@
+"""Trade-offs of the compact ECG model exports: accuracy parity, latency, size and memory.
+
+Exports the Keras CNN-LSTM to TFLite as float32, float16, dynamic-range and
+full-int8 artifacts and compares them with the Keras model on a held-out split.
+
+    python benchmarks/bench_ecg_export.py --model ecg_disease_detector.h5 --signals X_test.npy --labels y_test.npy
+    python benchmarks/bench_ecg_export.py            # trains the architecture briefly on synthetic ECGs
+
+``--signals`` are scaled (N, 1000, 12) signals and ``--labels`` their encoded
+classes. Without ``--model`` the ECGDiseaseDetector.build_model architecture
+is trained for a few epochs on synthetic ECGs so that accuracy is meaningful.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+from ecg_export import TFLiteModel, export_tflite, parity_report
+
+QUANTIZATIONS = {'float32': None, 'float16': 'float16', 'dynamic': 'dynamic', 'int8': 'int8'}
+
+
+def build_model(input_shape, num_classes):
+    """Same layers as ECGDiseaseDetector.build_model in ECG_Disease_Detection.ipynb"""
+    import tensorflow as tf
+    from tensorflow.keras.models import Sequential
+    from tensorflow.keras.layers import Conv1D, MaxPooling1D, LSTM, Dense, Dropout, BatchNormalization, Input
+
+    model = Sequential([
+        Input(shape=input_shape),
+        Conv1D(filters=64, kernel_size=7, activation='relu', padding='same'),
+        BatchNormalization(),
+        MaxPooling1D(pool_size=2),
+        Dropout(0.2),
+        Conv1D(filters=128, kernel_size=5, activation='relu', padding='same'),
+        BatchNormalization(),
+        MaxPooling1D(pool_size=2),
+        Dropout(0.2),
+        Conv1D(filters=256, kernel_size=3, activation='relu', padding='same'),
+        BatchNormalization(),
+        MaxPooling1D(pool_size=2),
+        Dropout(0.3),
+        LSTM(128, return_sequences=True, dropout=0.3, recurrent_dropout=0.3),
+        LSTM(64, dropout=0.3, recurrent_dropout=0.3),
+        Dense(128, activation='relu'),
+        BatchNormalization(),
+        Dropout(0.5),
+        Dense(64, activation='relu'),
+        Dropout(0.3),
+        Dense(num_classes, activation='softmax'),
+    ])
+    model.compile(optimizer=tf.keras.optimizers.Adam(learning_rate=0.001),
+                  loss='sparse_categorical_crossentropy', metrics=['accuracy'])
+    return model
+
+
+def synthetic_ecgs(n, num_classes=5, n_samples=1000, n_leads=12, sampling_rate=100, seed=0):
+    """Standardized 12-lead ECGs whose rate, QRS width and ST level depend on the class"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(n_samples) / sampling_rate
+    y = rng.integers(0, num_classes, n)
+    X = np.empty((n, n_samples, n_leads), dtype=np.float32)
+    for i, label in enumerate(y):
+        heart_rate = 50 + 20 * label + rng.normal(0, 5)
+        qrs_width = 0.012 + 0.004 * (label % 3)
+        st_level = 0.15 * (label - 2)
+        phase = (t * heart_rate / 60 + rng.random()) % 1.0
+        beat = (np.exp(-((phase - 0.3) / qrs_width) ** 2) + st_level * ((phase > 0.33) & (phase < 0.45))
+                + 0.2 * np.exp(-((phase - 0.6) / 0.05) ** 2))
+        gains = rng.uniform(0.5, 1.5, n_leads)
+        X[i] = beat[:, None] * gains[None, :] + rng.normal(0, 0.05, (n_samples, n_leads))
+    X = (X - X.mean(axis=1, keepdims=True)) / (X.std(axis=1, keepdims=True) + 1e-6)
+    return X, y
+
+
+def measure_memory(path):
+    """Resident MB of a fresh process after loading ``path`` and predicting once"""
+    code = (
+        "import sys, json, numpy as np\n"
+        f"sys.path.insert(0, {REPO_DIR!r})\n"
+        "from model_registry import registry, resident_memory\n"
+        "before = resident_memory()\n"
+        f"model = registry.get({path!r})\n"
+        "model.predict(np.zeros((1, 1000, 12), dtype=np.float32), verbose=0)\n"
+        "print(json.dumps([before, resident_memory()]))\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    try:
+        before, after = json.loads(result.stdout.strip().splitlines()[-1])
+        return after / 2**20, (after - before) / 2**20
+    except (IndexError, ValueError, TypeError):
+        return None, None
+
+
+def single_sample_latency(model, X, repeat):
+    """p50 / p99 ms of one-signal predict calls (the /chat case)"""
+    model.predict(X[:1], verbose=0)
+    latencies = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        model.predict(X[i % len(X)][None], verbose=0)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark compact ECG model exports")
+    parser.add_argument("--model", help="Trained Keras model (.h5/.keras)")
+    parser.add_argument("--signals", help="Held-out scaled signals (.npy, shape (N, 1000, 12))")
+    parser.add_argument("--labels", help="Held-out encoded labels (.npy)")
+    parser.add_argument("--samples", type=int, default=1000, help="Synthetic signals when no --signals")
+    parser.add_argument("--epochs", type=int, default=6, help="Training epochs when no --model")
+    parser.add_argument("--repeat", type=int, default=50, help="Single-sample latency measurements")
+    args = parser.parse_args()
+    if args.signals and not args.model:
+        parser.error("--signals needs --model (there is nothing to train on)")
+
+    import tensorflow as tf
+
+    if args.signals:
+        X_test = np.load(args.signals).astype(np.float32)
+        y_test = np.load(args.labels) if args.labels else None
+        X_train = X_test
+    else:
+        X, y = synthetic_ecgs(args.samples)
+        split = int(0.8 * len(X))
+        X_train, y_train, X_test, y_test = X[:split], y[:split], X[split:], y[split:]
+
+    if args.model:
+        model = tf.keras.models.load_model(args.model, compile=False)
+    else:
+        print(f"Training the ECG CNN-LSTM on {len(X_train)} synthetic signals for {args.epochs} epochs...")
+        model = build_model(X_train.shape[1:], int(y_train.max()) + 1)
+        model.fit(X_train, y_train, epochs=args.epochs, batch_size=32, verbose=0)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        keras_path = os.path.join(tmp_dir, "ecg_disease_detector.h5")
+        model.save(keras_path)
+
+        paths, export_seconds = {}, {}
+        for name, quantization in QUANTIZATIONS.items():
+            paths[name] = os.path.join(tmp_dir, f"ecg_disease_detector_{name}.tflite")
+            start = time.perf_counter()
+            export_tflite(model, paths[name], quantization, representative_data=X_train)
+            export_seconds[name] = time.perf_counter() - start
+
+        candidates = {name: TFLiteModel(path) for name, path in paths.items()}
+        print()
+        parity_report(model, candidates, X_test, y_test)
+
+        print()
+        print(f"{'MODEL':<12} {'SIZE (MB)':>10} {'P50 (ms)':>9} {'P99 (ms)':>9} {'RSS (MB)':>9} {'LOAD (MB)':>10}")
+        for name, instance in [('keras', model)] + list(candidates.items()):
+            path = keras_path if name == 'keras' else paths[name]
+            p50, p99 = single_sample_latency(instance, X_test, args.repeat)
+            rss, delta = measure_memory(path)
+            fmt = lambda value: f"{value:.0f}" if value is not None else "n/a"
+            print(f"{name:<12} {os.path.getsize(path) / 2**20:>10.2f} {p50:>9.2f} {p99:>9.2f} "
+                  f"{fmt(rss):>9} {fmt(delta):>10}")
+
+        print()
+        print("Export time: " + ", ".join(f"{name} {seconds:.1f}s" for name, seconds in export_seconds.items()))
+
+
+if __name__ == "__main__":
+    main()
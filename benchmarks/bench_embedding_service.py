@@ -0,0 +1,164 @@
+"""Embedding throughput for /chat-like traffic: direct encoder vs batching vs batching + cache.
+
+``--clients`` threads each embed a stream of symptom phrases drawn from a
+Zipf distribution over a phrase vocabulary. The phrases come with casing,
+whitespace and punctuation variants, the way users type them. Three modes:
+
+- direct:  every request calls the encoder itself
+- batched: EmbeddingService without a cache (cross-request batching and
+           sharing of in-flight encodes only)
+- cached:  EmbeddingService with the memory + disk cache (second run reads
+           from the disk tier of a fresh service, as after a restart)
+
+    python benchmarks/bench_embedding_service.py --clients 16 --requests 50
+    python benchmarks/bench_embedding_service.py --encoder minilm     # needs sentence-transformers
+
+Without sentence-transformers the encoder is a Keras stand-in with
+MiniLM's width (384-d, two self-attention blocks), so per-call overhead and
+per-token cost are of the same kind.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+from embedding_service import EmbeddingService, SentenceEncoder
+
+SYMPTOMS = ["chest pain", "shortness of breath", "fever", "cough", "fatigue", "headache", "dizziness",
+            "nausea", "palpitations", "swollen ankles", "abdominal pain", "rash", "back pain", "chills",
+            "sore throat", "vomiting", "blurred vision", "frequent urination", "weight loss", "night sweats"]
+
+
+def symptom_phrases(n_phrases, seed=0):
+    rng = np.random.default_rng(seed)
+    phrases = set()
+    while len(phrases) < n_phrases:
+        phrases.add(" and ".join(rng.choice(SYMPTOMS, rng.integers(1, 4), replace=False)))
+    return sorted(phrases)
+
+
+def request_stream(phrases, n_requests, zipf=1.2, seed=0):
+    """Zipf-distributed phrase requests with typing variants"""
+    rng = np.random.default_rng(seed)
+    ranks = np.minimum(rng.zipf(zipf, n_requests), len(phrases)) - 1
+    variants = [str.lower, str.capitalize, str.upper, lambda p: p + ".", lambda p: "  " + p.replace(" ", "  ")]
+    return [variants[rng.integers(len(variants))](phrases[rank]) for rank in ranks]
+
+
+def keras_encoder(dim=384, vocab=30522, max_tokens=32):
+    """MiniLM-width stand-in: hashed tokens, two attention blocks, mean pooling"""
+    import tensorflow as tf
+    from tensorflow.keras import layers
+
+    tokens = layers.Input(shape=(max_tokens,), dtype='int32')
+    x = layers.Embedding(vocab, dim)(tokens)
+    for _ in range(2):
+        x = layers.LayerNormalization()(x + layers.MultiHeadAttention(num_heads=12, key_dim=dim // 12)(x, x))
+        x = layers.LayerNormalization()(x + layers.Dense(dim)(layers.Dense(4 * dim, activation='gelu')(x)))
+    model = tf.keras.Model(tokens, layers.GlobalAveragePooling1D()(x))
+
+    def encode(texts):
+        ids = np.zeros((len(texts), max_tokens), dtype=np.int32)
+        for i, text in enumerate(texts):
+            words = [hash(word) % vocab for word in text.lower().split()][:max_tokens]
+            ids[i, :len(words)] = words
+        return model.predict(ids, batch_size=len(texts), verbose=0)
+
+    encode.version = f"keras-standin-{dim}d"
+    return encode
+
+
+def run_clients(embed, streams):
+    """Each client embeds its stream one request at a time; returns (req/s, latencies in ms)"""
+    latencies = []
+    lock = threading.Lock()
+
+    def client(stream):
+        mine = []
+        for text in stream:
+            start = time.perf_counter()
+            embed(text)
+            mine.append((time.perf_counter() - start) * 1000)
+        with lock:
+            latencies.extend(mine)
+
+    threads = [threading.Thread(target=client, args=(stream,)) for stream in streams]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(latencies) / (time.perf_counter() - start), np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the cached, batched embedding service")
+    parser.add_argument("--clients", type=int, default=16, help="Concurrent callers")
+    parser.add_argument("--requests", type=int, default=50, help="Phrases per client")
+    parser.add_argument("--phrases", type=int, default=300, help="Distinct symptom phrases")
+    parser.add_argument("--encoder", choices=["keras", "minilm"], default="keras")
+    parser.add_argument("--max-batch-size", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    encoder = SentenceEncoder() if args.encoder == "minilm" else keras_encoder()
+    encoder(["warm up"])
+    phrases = symptom_phrases(args.phrases)
+    streams = [request_stream(phrases, args.requests, seed=i) for i in range(args.clients)]
+    service_args = dict(max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms)
+
+    print(f"Embedding {args.clients} clients x {args.requests} requests over {args.phrases} phrases "
+          f"({len({text for stream in streams for text in stream})} distinct strings)")
+    print("=" * 72)
+    print(f"{'MODE':<14} {'REQ/S':>8} {'P50 (ms)':>9} {'P99 (ms)':>9} {'HIT RATE':>9} {'ENCODED':>8} {'CALLS':>6}")
+
+    calls = []
+
+    def counted(texts):
+        calls.append(len(texts))
+        return encoder(texts)
+
+    def report(mode, throughput, latencies, hit_rate):
+        print(f"{mode:<14} {throughput:>8.1f} {np.percentile(latencies, 50):>9.1f} {np.percentile(latencies, 99):>9.1f} "
+              f"{hit_rate:>9} {sum(calls):>8} {len(calls):>6}")
+        calls.clear()
+
+    throughput, latencies = run_clients(lambda text: counted([text])[0], streams)
+    report("direct", throughput, latencies, "-")
+
+    batched = EmbeddingService(counted, encoder.version, cache_dir=None, memory_entries=0, **service_args)
+    throughput, latencies = run_clients(batched.encode, streams)
+    report("batched", throughput, latencies, "-")
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cached = EmbeddingService(counted, encoder.version, cache_dir=cache_dir, **service_args)
+        throughput, latencies = run_clients(cached.encode, streams)
+        stats = cached.stats()
+        report("cached", throughput, latencies, f"{stats['hit_rate']:.1%}")
+        print(f"{'':<14} encode p50 {stats['encode_p50_ms']:.1f} ms / p99 {stats['encode_p99_ms']:.1f} ms per call, "
+              f"{stats['encode_ms_per_text']:.2f} ms per text, mean batch {stats['batching']['mean_batch_size']:.1f}")
+
+        restarted = EmbeddingService(counted, encoder.version, cache_dir=cache_dir, **service_args)
+        throughput, latencies = run_clients(restarted.encode, streams)
+        report("cached (disk)", throughput, latencies, f"{restarted.stats()['hit_rate']:.1%}")
+
+        disk_bytes = sum(os.path.getsize(os.path.join(cache_dir, name)) for name in os.listdir(cache_dir))
+        entries = max(1, cached.stats()['disk_entries'])
+        print()
+        print(f"Disk tier: {entries} entries, {disk_bytes / 1024:.0f} KiB "
+              f"({disk_bytes // entries} B/entry vs {4 * cached.dim + 16} B as float32)")
+
+    exact = np.asarray(encoder(phrases[:100]), dtype=np.float32)
+    rounded = exact.astype(np.float16).astype(np.float32)
+    cosine = (exact * rounded).sum(1) / np.linalg.norm(exact, axis=1) / np.linalg.norm(rounded, axis=1)
+    print(f"float16 storage: min cosine similarity to float32 {cosine.min():.6f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Load time and memory: pd.read_csv vs the typed columnar cache of master_features.csv.
+
+Each measurement runs in a fresh process so resident memory is not shared
+between methods. ``--rows`` tiles master_features.csv to a larger synthetic
+table to show how both paths scale.
+
+    python benchmarks/bench_feature_table.py --rows 200000
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import multiprocessing
+
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+from feature_table import open_table
+from model_registry import resident_memory
+
+
+def load_read_csv(csv_path, cache_dir):
+    return pd.read_csv(csv_path)
+
+
+def load_cached_frame(csv_path, cache_dir):
+    return open_table(csv_path, cache_dir).to_frame()
+
+
+def load_cached_table(csv_path, cache_dir):
+    # Memory-mapped columns only, without building a DataFrame
+    table = open_table(csv_path, cache_dir)
+    return [table.column(name) for name in table.columns if table.schema[name]['kind'] in ('float', 'integer')]
+
+
+METHODS = {
+    'pd.read_csv': load_read_csv,
+    'cache -> DataFrame': load_cached_frame,
+    'cache (memmap)': load_cached_table,
+}
+
+
+def measure(method, csv_path, cache_dir, queue):
+    """Run one load in this process and report (seconds, RSS growth in bytes)"""
+    rss_before = resident_memory()
+    start = time.perf_counter()
+    result = METHODS[method](csv_path, cache_dir)
+    seconds = time.perf_counter() - start
+    queue.put((seconds, resident_memory() - rss_before))
+    del result
+
+
+def run_isolated(method, csv_path, cache_dir):
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    process = ctx.Process(target=measure, args=(method, csv_path, cache_dir, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark master_features loading")
+    parser.add_argument("--rows", type=int, default=0, help="Tile the CSV to this many rows (0 = as shipped)")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = os.path.join(REPO_DIR, "master_features.csv")
+        if args.rows:
+            df = pd.read_csv(csv_path)
+            df = pd.concat([df] * (args.rows // len(df) + 1), ignore_index=True).iloc[:args.rows]
+            csv_path = os.path.join(tmp_dir, "master_features.csv")
+            df.to_csv(csv_path, index=False)
+        cache_dir = os.path.join(tmp_dir, "features_cache")
+
+        start = time.perf_counter()
+        open_table(csv_path, cache_dir)
+        build_seconds = time.perf_counter() - start
+
+        rows = sum(1 for _ in open(csv_path)) - 1
+        print("master_features load benchmark")
+        print(f"{rows} rows, CSV {os.path.getsize(csv_path) / 2**20:.1f} MB, one-time cache build {build_seconds:.2f}s")
+        print("=" * 60)
+        print(f"{'METHOD':<20} {'LOAD (ms)':>10} {'RSS (MB)':>9}")
+        for method in METHODS:
+            results = [run_isolated(method, csv_path, cache_dir) for _ in range(args.repeat)]
+            seconds = min(r[0] for r in results)
+            rss = min(r[1] for r in results)
+            print(f"{method:<20} {seconds * 1000:>10.1f} {rss / 2**20:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
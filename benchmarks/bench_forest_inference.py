@@ -0,0 +1,63 @@
+"""Latency benchmark: sklearn RandomForest vs the compiled FlatForest.
+
+Trains the Merged_signals.ipynb disease model on master_features.csv and
+times single-row (the /chat case) and batch prediction, including the 0.3
+per-label thresholding.
+
+    python benchmarks/bench_forest_inference.py --repeat 200
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+from disease_dataset import load_training_data, threshold_predictions
+from forest_inference import FlatForest
+
+
+def sklearn_predict(model, X):
+    """The notebook's Step 8: predict_proba, then threshold label by label"""
+    return threshold_predictions(model.predict_proba(X), 0.3)
+
+
+def time_call(func, X, repeat):
+    """Return the mean milliseconds per call"""
+    func(X)  # Warm-up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(X)
+    return (time.perf_counter() - start) * 1000 / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark RandomForest inference")
+    parser.add_argument("--repeat", type=int, default=100, help="Timed calls per measurement")
+    parser.add_argument("--n-estimators", type=int, default=100)
+    args = parser.parse_args()
+
+    X, y, mlb, _ = load_training_data(
+        os.path.join(REPO_DIR, "master_features.csv"), os.path.join(REPO_DIR, "DIAGNOSES_ICD.csv"))
+    model = RandomForestClassifier(n_estimators=args.n_estimators, class_weight="balanced", random_state=42)
+    model.fit(X, y)
+    forest = FlatForest.from_sklearn(model)
+
+    X_values = X.to_numpy()
+    print("RandomForest inference benchmark")
+    print(f"{args.n_estimators} trees, {len(mlb.classes_)} labels, {X.shape[1]} features")
+    print("=" * 60)
+    print(f"{'BATCH':>6} {'SKLEARN (ms)':>13} {'FLAT (ms)':>10} {'SPEEDUP':>8}")
+    for batch_size in [1, 8, 32, 128, 1024]:
+        rows = X.iloc[np.arange(batch_size) % len(X)]
+        rows_values = X_values[np.arange(batch_size) % len(X)]
+        sklearn_ms = time_call(lambda r: sklearn_predict(model, r), rows, args.repeat)
+        flat_ms = time_call(forest.predict, rows_values, args.repeat)
+        print(f"{batch_size:>6} {sklearn_ms:>13.3f} {flat_ms:>10.3f} {sklearn_ms / flat_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""Recall vs latency of the knowledge index types, chunk lookup cost and incremental updates.
+
+    python benchmarks/bench_knowledge_index.py                      # 100k synthetic 384-d chunks
+    python benchmarks/bench_knowledge_index.py --chunks 20000 --dim 768
+
+Embeddings are synthetic: clustered unit vectors, similar to sentence
+embeddings of topic-grouped medical text. Ground truth for recall@k is exact
+inner-product search.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+from knowledge_index import KnowledgeIndex
+
+
+def clustered_embeddings(n, dim, n_clusters=200, spread=0.35, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, n_clusters, n)] + spread * rng.normal(size=(n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def synthetic_chunks(n, seed=0):
+    rng = np.random.default_rng(seed)
+    words = ["fever", "cough", "fatigue", "rash", "nausea", "infection", "chronic", "acute", "treatment",
+             "symptoms", "diagnosis", "pain", "inflammation", "blood", "pressure", "glucose", "heart"]
+    texts = [" ".join(rng.choice(words, 60)) for _ in range(n)]
+    metadata = [{'disease': f"disease_{i % 500}", 'source': "synthetic", 'chunk': i} for i in range(n)]
+    return texts, metadata
+
+
+def recall_at_k(ids, truth):
+    return np.mean([len(set(row) & set(true_row)) / len(true_row) for row, true_row in zip(ids, truth)])
+
+
+def time_queries(index, queries, k):
+    """Recall ids and ms/query for one-query-at-a-time search (the /chat case)"""
+    index.search_vectors(queries[:1], k)
+    ids = []
+    start = time.perf_counter()
+    for query in queries:
+        ids.append(index.search_vectors(query[None], k)[1][0])
+    return np.array(ids), (time.perf_counter() - start) * 1000 / len(queries)
+
+
+def measure_open(code):
+    """Seconds and resident MB added by running ``code`` in a fresh process (numpy already imported)"""
+    script = (
+        "import sys, time, json\n"
+        f"sys.path.insert(0, {REPO_DIR!r})\n"
+        "import numpy\n"
+        "from model_registry import resident_memory\n"
+        "before = resident_memory()\n"
+        "start = time.perf_counter()\n"
+        f"{code}\n"
+        "print(json.dumps([time.perf_counter() - start, (resident_memory() - before) / 2**20]))\n"
+    )
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True)
+    try:
+        return json.loads(result.stdout.strip().splitlines()[-1])
+    except (IndexError, ValueError):
+        print(result.stderr)
+        return None, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the disease knowledge index")
+    parser.add_argument("--chunks", type=int, default=100000, help="Number of chunks")
+    parser.add_argument("--dim", type=int, default=384, help="Embedding dimension")
+    parser.add_argument("--queries", type=int, default=500, help="Number of queries")
+    parser.add_argument("--k", type=int, default=10, help="Results per query")
+    args = parser.parse_args()
+
+    import faiss
+
+    vectors = clustered_embeddings(args.chunks + args.queries, args.dim)
+    vectors, queries = vectors[:args.chunks], vectors[args.chunks:]
+    texts, metadata = synthetic_chunks(args.chunks)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        print(f"Building indexes over {args.chunks} chunks ({args.dim}-d)...")
+        indexes, build_seconds = {}, {}
+        for index_type in ('flat', 'ivf', 'hnsw'):
+            start = time.perf_counter()
+            index = KnowledgeIndex(os.path.join(tmp_dir, index_type), dim=args.dim, index_type=index_type)
+            index.add(texts, metadata, embeddings=vectors)  # IVF trains on the first large enough add
+            index.save()
+            build_seconds[index_type] = time.perf_counter() - start
+            indexes[index_type] = index
+
+        truth, flat_ms = time_queries(indexes['flat'], queries, args.k)
+
+        print()
+        print(f"Recall@{args.k} vs latency ({args.queries} single queries)")
+        print(f"{'INDEX':<8} {'PARAM':<14} {'RECALL':>8} {'MS/QUERY':>9} {'SPEEDUP':>8}")
+        print(f"{'flat':<8} {'exact':<14} {1.0:>8.3f} {flat_ms:>9.3f} {1.0:>7.1f}x")
+        for nprobe in (1, 4, 16, 64):
+            indexes['ivf'].set_search_params(nprobe=nprobe)
+            ids, ms = time_queries(indexes['ivf'], queries, args.k)
+            print(f"{'ivf':<8} {f'nprobe={nprobe}':<14} {recall_at_k(ids, truth):>8.3f} {ms:>9.3f} {flat_ms / ms:>7.1f}x")
+        for ef_search in (16, 32, 64, 128, 256):
+            indexes['hnsw'].set_search_params(ef_search=ef_search)
+            ids, ms = time_queries(indexes['hnsw'], queries, args.k)
+            print(f"{'hnsw':<8} {f'ef={ef_search}':<14} {recall_at_k(ids, truth):>8.3f} {ms:>9.3f} {flat_ms / ms:>7.1f}x")
+        print("Build: " + ", ".join(f"{name} {seconds:.1f}s" for name, seconds in build_seconds.items()))
+
+        # Batched queries: one search call for many queries amortizes per-call overhead
+        indexes['hnsw'].set_search_params(ef_search=64)
+        start = time.perf_counter()
+        indexes['hnsw'].search_vectors(queries, args.k)
+        print(f"HNSW batched: {(time.perf_counter() - start) * 1000 / len(queries):.3f} ms/query")
+
+        # Legacy JSON chunks + metadata vs the memory-mapped chunk store
+        json_dir = os.path.join(tmp_dir, "legacy")
+        os.makedirs(json_dir)
+        with open(os.path.join(json_dir, "disease_chunks.json"), 'w') as f:
+            json.dump(texts, f)
+        with open(os.path.join(json_dir, "disease_metadata.json"), 'w') as f:
+            json.dump(metadata, f)
+        legacy_seconds, legacy_mb = measure_open(
+            "import json\n"
+            f"chunks = json.load(open({os.path.join(json_dir, 'disease_chunks.json')!r}))\n"
+            f"metadata = json.load(open({os.path.join(json_dir, 'disease_metadata.json')!r}))\n"
+            "hit = (chunks[12345 % len(chunks)], metadata[12345 % len(metadata)])"
+        )
+        store_seconds, store_mb = measure_open(
+            "from knowledge_index import ChunkStore\n"
+            f"store = ChunkStore({os.path.join(tmp_dir, 'flat', 'chunks')!r})\n"
+            "hit = store.get(12345 % len(store))"
+        )
+        print()
+        print(f"Chunk lookup after opening ({args.chunks} chunks, fresh process)")
+        print(f"{'FORMAT':<22} {'OPEN (ms)':>10} {'RSS (MB)':>9}")
+        for name, seconds, mb in (('JSON', legacy_seconds, legacy_mb), ('ChunkStore (mmap)', store_seconds, store_mb)):
+            if seconds is not None:
+                print(f"{name:<22} {seconds * 1000:>10.1f} {mb:>9.1f}")
+
+        store = indexes['flat'].store
+        lookup_ids = np.random.default_rng(1).integers(0, args.chunks, 2000)
+        start = time.perf_counter()
+        for chunk_id in lookup_ids:
+            store.get(chunk_id)
+        print(f"ChunkStore.get: {(time.perf_counter() - start) * 1e6 / len(lookup_ids):.1f} µs/chunk")
+
+        # Incremental updates vs rebuilding from scratch
+        new_vectors = clustered_embeddings(1000, args.dim, seed=1)
+        new_texts, new_metadata = synthetic_chunks(1000, seed=1)
+        print()
+        print("Adding 1000 chunks and deleting 1000 chunks")
+        print(f"{'INDEX':<8} {'ADD (ms)':>9} {'DELETE (ms)':>12} {'REBUILD (ms)':>13}")
+        for index_type, index in indexes.items():
+            start = time.perf_counter()
+            index.add(new_texts, new_metadata, embeddings=new_vectors)
+            add_ms = (time.perf_counter() - start) * 1000
+            start = time.perf_counter()
+            index.delete(np.arange(1000))
+            delete_ms = (time.perf_counter() - start) * 1000
+            start = time.perf_counter()
+            index.rebuild()
+            rebuild_ms = (time.perf_counter() - start) * 1000
+            print(f"{index_type:<8} {add_ms:>9.1f} {delete_ms:>12.1f} {rebuild_ms:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Throughput benchmark: concurrent single-sample inference, direct vs MicroBatcher.
+
+``--clients`` threads each send single-sample requests, the way concurrent
+/chat requests reach the models. In direct mode each thread calls the model
+itself. In batched mode the calls go through a MicroBatcher. Two models are
+measured: a CNN-LSTM shaped like the ECG_Disease_Detection.ipynb model
+(input (1000, 12)) and the sklearn RandomForest trained on master_features.csv.
+
+    python benchmarks/bench_micro_batching.py --clients 32 --requests 20
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+from micro_batching import MicroBatcher
+
+
+def build_ecg_model(num_classes=5):
+    """A smaller CNN-LSTM with the ECG model's layer layout and input shape"""
+    from tensorflow.keras.models import Sequential
+    from tensorflow.keras.layers import Conv1D, MaxPooling1D, LSTM, Dense, Input
+
+    model = Sequential([
+        Input(shape=(1000, 12)),
+        Conv1D(filters=32, kernel_size=7, activation='relu', padding='same'),
+        MaxPooling1D(pool_size=4),
+        Conv1D(filters=64, kernel_size=5, activation='relu', padding='same'),
+        MaxPooling1D(pool_size=4),
+        LSTM(32),
+        Dense(32, activation='relu'),
+        Dense(num_classes, activation='softmax'),
+    ])
+    return model, np.random.default_rng(0).normal(size=(256, 1000, 12)).astype(np.float32)
+
+
+def build_forest():
+    """The Merged_signals.ipynb RandomForest, returning a batch -> (n, n_labels) function"""
+    from sklearn.ensemble import RandomForestClassifier
+    from disease_dataset import load_training_data
+
+    X, y, mlb, _ = load_training_data()
+    X = X.to_numpy(dtype=float)
+    model = RandomForestClassifier(n_estimators=100, random_state=42).fit(X, y)
+
+    def predict_batch(batch):
+        probs = model.predict_proba(batch)
+        return np.stack([p[:, list(c).index(1)] if 1 in c else np.zeros(len(batch))
+                         for p, c in zip(probs, model.classes_)], axis=1)
+
+    return predict_batch, X
+
+
+def run_clients(call, samples, n_clients, n_requests):
+    """Each client sends ``n_requests`` single-sample calls; returns (req/s, latencies in ms)"""
+    latencies = []
+    lock = threading.Lock()
+
+    def client(offset):
+        mine = []
+        for i in range(n_requests):
+            sample = samples[(offset + i) % len(samples)]
+            start = time.perf_counter()
+            call(sample)
+            mine.append((time.perf_counter() - start) * 1000)
+        with lock:
+            latencies.extend(mine)
+
+    threads = [threading.Thread(target=client, args=(i * n_requests,)) for i in range(n_clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return len(latencies) / elapsed, np.array(latencies)
+
+
+def compare(name, predict_batch, samples, args):
+    predict_batch(samples[:1])  # Warm-up (graph tracing, sklearn validation)
+    batcher = MicroBatcher(predict_batch, max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms,
+                           name=name)
+    modes = [
+        ("direct", lambda sample: predict_batch(sample[None])[0]),
+        ("batched", batcher.predict),
+    ]
+    rows = []
+    for mode, call in modes:
+        throughput, latencies = run_clients(call, samples, args.clients, args.requests)
+        rows.append((mode, throughput, latencies))
+        print(f"{name:<8} {mode:<8} {throughput:>8.1f} {np.percentile(latencies, 50):>9.1f} "
+              f"{np.percentile(latencies, 99):>9.1f}")
+
+    stats = batcher.stats()
+    print(f"{'':<8} speedup {rows[1][1] / rows[0][1]:.1f}x, mean batch {stats['mean_batch_size']:.1f}, "
+          f"queue delay p50 {stats['queue_delay_p50_ms']:.1f} ms / p99 {stats['queue_delay_p99_ms']:.1f} ms")
+    print(f"{'':<8} batch sizes {stats['batch_sizes']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark micro-batched model inference")
+    parser.add_argument("--clients", type=int, default=32, help="Concurrent callers")
+    parser.add_argument("--requests", type=int, default=20, help="Single-sample calls per client")
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--models", nargs="+", default=["ecg", "forest"], choices=["ecg", "forest"])
+    args = parser.parse_args()
+
+    print(f"Micro-batching: {args.clients} clients x {args.requests} requests, "
+          f"max batch {args.max_batch_size}, max wait {args.max_wait_ms:.0f} ms")
+    print("=" * 60)
+    print(f"{'MODEL':<8} {'MODE':<8} {'REQ/S':>8} {'P50 (ms)':>9} {'P99 (ms)':>9}")
+
+    if "ecg" in args.models:
+        model, samples = build_ecg_model()
+        compare("ecg", lambda batch: model.predict(batch, batch_size=len(batch), verbose=0), samples, args)
+    if "forest" in args.models:
+        predict_batch, samples = build_forest()
+        compare("forest", predict_batch, samples, args)
+
+
+if __name__ == "__main__":
+    main()
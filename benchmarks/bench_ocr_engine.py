@@ -0,0 +1,174 @@
+"""Benchmark for lab-sheet OCR: serial per-request Tesseract vs OCREngine.
+
+Renders a corpus of synthetic lab sheets (known values) into a temporary
+directory and replays uploads where ``--reupload`` of the requests are scans
+seen before. The serial baseline OCRs the whole page with pytesseract and
+searches the text once per analyte spelling. OCREngine uses the warm worker
+pool, region splitting and the content-hash cache. The text parsers are
+also timed on their own, which needs no Tesseract install.
+
+    python benchmarks/bench_ocr_engine.py --sheets 20 --requests 60
+"""
+import os
+import re
+import sys
+import time
+import argparse
+import tempfile
+
+import cv2
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+from ocr_engine import ANALYTES, OCREngine, parse_lab_values
+
+# (row label, canonical name, unit, low, high) drawn on every synthetic sheet
+SHEET_ROWS = [
+    ("White Blood Cell Count", 'white_blood_cells', "x10^9/L", 3.0, 15.0),
+    ("Red Blood Cell Count", 'red_blood_cells', "x10^12/L", 3.5, 6.5),
+    ("Hemoglobin", 'hemoglobin', "g/dL", 9.0, 18.0),
+    ("Hematocrit", 'hematocrit', "%", 30.0, 55.0),
+    ("Platelet Count", 'platelets', "x10^9/L", 100, 450),
+    ("Glucose", 'glucose', "mg/dL", 60, 300),
+    ("Creatinine", 'creatinine', "mg/dL", 0.4, 3.0),
+    ("Urea", 'urea', "mg/dL", 10, 60),
+    ("Sodium", 'sodium', "mmol/L", 128, 150),
+    ("Potassium", 'potassium', "mmol/L", 3.0, 6.0),
+    ("Cholesterol", 'cholesterol', "mg/dL", 120, 300),
+    ("Alanine Aminotransferase (ALT)", 'ALT', "U/L", 5, 120),
+    ("Aspartate Aminotransferase (AST)", 'AST', "U/L", 5, 120),
+    ("Bilirubin", 'bilirubin', "mg/dL", 0.2, 3.0),
+    ("Albumin", 'albumin', "g/dL", 2.5, 5.5),
+    ("Thyroid Stimulating Hormone", 'TSH', "uIU/mL", 0.3, 6.0),
+]
+
+
+def render_sheet(seed, width=1240, row_height=70):
+    """Draw a lab sheet like processed_ocr_image.png; returns (BGR image, true values)"""
+    rng = np.random.default_rng(seed)
+    height = 260 + row_height * len(SHEET_ROWS) + 200
+    img = np.full((height, width, 3), 255, dtype=np.uint8)
+    font = cv2.FONT_HERSHEY_SIMPLEX
+
+    cv2.putText(img, "Blood Test Result", (60, 110), font, 1.6, (150, 120, 40), 3, cv2.LINE_AA)
+    cv2.putText(img, f"Patient ID: {seed:06d}", (60, 180), font, 0.9, (0, 0, 0), 2, cv2.LINE_AA)
+    for x, header in [(60, "TEST"), (620, "RESULT"), (800, "UNIT"), (1000, "RANGE")]:
+        cv2.putText(img, header, (x, 240), font, 0.8, (0, 0, 0), 2, cv2.LINE_AA)
+
+    truth = {}
+    for i, (label, name, unit, low, high) in enumerate(SHEET_ROWS):
+        value = round(float(rng.uniform(low, high)), 1)
+        truth[name] = value
+        y = 320 + i * row_height
+        for x, text in [(60, label), (620, f"{value:g}"), (800, unit), (1000, f"{low:g} - {high:g}")]:
+            cv2.putText(img, text, (x, y), font, 0.8, (0, 0, 0), 2, cv2.LINE_AA)
+    return img, truth
+
+
+def legacy_parse(text):
+    """Search the text once per analyte spelling"""
+    values = {}
+    for name, labels in ANALYTES.items():
+        for label in labels:
+            match = re.search(rf"{label}\s*[:]?\s*(\d+\.?\d*)", text, re.IGNORECASE)
+            if match:
+                values[name] = {'value': float(match.group(1)), 'unit': ''}
+                break
+    return values
+
+
+def legacy_process(path):
+    """OCR the whole preprocessed page in the request, no reuse"""
+    import pytesseract
+    gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    text = pytesseract.image_to_string(OCREngine.preprocess(gray), config="--psm 6")
+    return {'text': text, 'lab_values': legacy_parse(text)}
+
+
+def accuracy(results, truths):
+    """Share of true values read back exactly"""
+    correct = total = 0
+    for result, truth in zip(results, truths):
+        for name, value in truth.items():
+            total += 1
+            correct += abs(result['lab_values'].get(name, {}).get('value', np.nan) - value) < 1e-6
+    return correct / total
+
+
+def bench_parsers(repeat):
+    text = "\n".join(f"{label} {(low + high) / 2:g} {unit} {low:g} - {high:g} Normal"
+                     for label, _, unit, low, high in SHEET_ROWS) * 3
+    print(f"{'PARSER':<26} {'MS/PAGE':>10}")
+    for name, parse in [("per-analyte re.search", legacy_parse), ("single-pass pattern", parse_lab_values)]:
+        parse(text)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            parse(text)
+        print(f"{name:<26} {(time.perf_counter() - start) * 1000 / repeat:>10.3f}")
+
+
+def tesseract_available():
+    try:
+        import pytesseract
+        pytesseract.get_tesseract_version()
+        return True
+    except Exception:
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark lab-sheet OCR")
+    parser.add_argument("--sheets", type=int, default=20, help="Distinct synthetic lab sheets")
+    parser.add_argument("--requests", type=int, default=60, help="Uploads to replay")
+    parser.add_argument("--reupload", type=float, default=0.5, help="Share of uploads repeating an earlier scan")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--parse-repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    print("Lab-sheet OCR benchmark")
+    print("=" * 60)
+    bench_parsers(args.parse_repeat)
+    print()
+
+    if not tesseract_available():
+        print("✗ Tesseract OCR / pytesseract not installed; skipping the OCR comparison")
+        return
+
+    rng = np.random.default_rng(42)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths, truths = [], []
+        for i in range(args.sheets):
+            img, truth = render_sheet(i)
+            paths.append(os.path.join(tmp_dir, f"sheet_{i:03d}.png"))
+            cv2.imwrite(paths[-1], img)
+            truths.append(truth)
+
+        # Fresh sheets in order, with re-uploads of already seen ones mixed in
+        uploads, next_new = [], 0
+        for _ in range(args.requests):
+            if next_new < args.sheets and (next_new == 0 or rng.random() >= args.reupload):
+                uploads.append(next_new)
+                next_new += 1
+            else:
+                uploads.append(int(rng.integers(0, next_new)))
+
+        engine = OCREngine(workers=args.workers, cache_dir=os.path.join(tmp_dir, "ocr_cache"))
+        engine.warm_up()
+
+        print(f"{len(uploads)} uploads of {next_new} distinct sheets, {engine.workers} OCR workers")
+        print(f"{'PATH':<12} {'MS/UPLOAD':>10} {'P99 (ms)':>9} {'ACCURACY':>9}")
+        for name, process in [("serial", legacy_process), ("OCREngine", engine.process)]:
+            latencies, results = [], []
+            for i in uploads:
+                start = time.perf_counter()
+                results.append(process(paths[i]))
+                latencies.append((time.perf_counter() - start) * 1000)
+            print(f"{name:<12} {np.mean(latencies):>10.1f} {np.percentile(latencies, 99):>9.1f} "
+                  f"{accuracy(results, [truths[i] for i in uploads]):>9.1%}")
+        print(f"OCREngine stats: {engine.stats()}")
+        engine.shutdown()
+
+
+if __name__ == "__main__":
+    main()
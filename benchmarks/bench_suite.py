@@ -0,0 +1,554 @@
+"""Benchmark suite for the whole prediction stack, with a JSON history and a regression check.
+
+Runs offline: stand-in models (an untrained CNN-LSTM shaped like the ECG
+model, the disease RandomForest trained on master_features.csv, Tesseract
+replaced by the sheet text) and an in-process /chat app, so no server,
+model files, Tesseract or Ollama are needed. Each scenario runs in a fresh
+process, so its peak RSS is its own:
+
+- ecg_preprocess: fit_signal, scale_signals and extract_features on one record (analyze_ecg)
+- ecg_digitize:   ECGDigitizer on a printout PNG (process_ecg_image)
+- ecg_inference:  one record through model.predict (analyze_ecg)
+- ecg_batch:      32 records per predict call (batch_test)
+- forest_single:  FlatForest on one admission (the /chat case)
+- forest_batch:   FlatForest on 256 admissions
+- ocr_parse:      parse_lab_values on a lab sheet's text
+- ocr_image:      OCREngine.process on a lab sheet PNG, recognition stubbed, cache off
+- sqlite_write:   ChatDatabase.save_turn
+- sqlite_read:    get_conversation_history on a 50k-message database
+- chat_c1/c8/c32: POST /chat (test_chatbot.py payload plus a 12-lead ECG) through
+                  ChatPipeline with the ECG, forest and SQLite stages, 1/8/32 clients
+
+Every run is appended to ``--history`` (benchmarks/history.json by default,
+gitignored since baselines are per host) with p50/p95/p99 latency,
+throughput (items per second) and peak RSS per scenario, then compared with
+the median of the last ``--baseline-runs`` runs on this host: p50/p95
+latency or peak RSS higher, or throughput lower, by more than
+``--threshold`` is a regression and the suite exits with 1. ``--profile
+DIR`` writes a cProfile dump of each scenario's timed part (main thread
+only: /chat stage pools show up as waiting) and ``--flamegraph`` renders
+SVGs with flameprof.
+Profiled runs are only compared with profiled runs.
+
+    python benchmarks/bench_suite.py
+    python benchmarks/bench_suite.py --scenarios forest chat --quick --profile profiles --flamegraph
+"""
+import os
+import sys
+import json
+import time
+import pstats
+import asyncio
+import cProfile
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import multiprocessing
+from queue import Empty
+from datetime import datetime, timezone
+from contextlib import contextmanager
+
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from model_registry import resident_memory
+
+DEFAULT_HISTORY = os.path.join(REPO_DIR, "benchmarks", "history.json")
+SCENARIO_TIMEOUT = 1800  # seconds
+# Metrics checked against the baseline and the direction that is worse
+CHECKED_METRICS = {'p50_ms': 1, 'p95_ms': 1, 'peak_rss_mb': 1, 'throughput': -1}
+
+
+class Recorder:
+    """Times the measured part of a scenario, under cProfile when profiling"""
+
+    def __init__(self, profiler=None):
+        self.profiler = profiler
+        self.latencies = []
+        self.wall = 0.0
+
+    @contextmanager
+    def measuring(self):
+        if self.profiler is not None:
+            self.profiler.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.wall += time.perf_counter() - start
+            if self.profiler is not None:
+                self.profiler.disable()
+
+    def calls(self, op, iterations, warmup=3):
+        """Time ``op(i)`` for i in range(iterations) after a few untimed calls"""
+        for i in range(warmup):
+            op(i)
+        with self.measuring():
+            for i in range(iterations):
+                start = time.perf_counter()
+                op(i)
+                self.latencies.append(time.perf_counter() - start)
+
+
+class PeakMemory:
+    """Samples resident memory on a background thread and keeps the maximum"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = resident_memory() or 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, resident_memory() or 0)
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return max(self.peak, resident_memory() or 0)
+
+
+def ecg_model():
+    from bench_micro_batching import build_ecg_model
+
+    return build_ecg_model()
+
+
+def ecg_scaler(samples):
+    from sklearn.preprocessing import StandardScaler
+
+    return StandardScaler().fit(samples.reshape(-1, samples.shape[-1]))
+
+
+def disease_forest():
+    """FlatForest of the Merged_signals.ipynb model; returns (forest, X, label names)"""
+    from sklearn.ensemble import RandomForestClassifier
+    from disease_dataset import load_training_data
+    from forest_inference import FlatForest
+
+    X, y, mlb, _ = load_training_data(os.path.join(REPO_DIR, "master_features.csv"),
+                                      os.path.join(REPO_DIR, "DIAGNOSES_ICD.csv"))
+    model = RandomForestClassifier(n_estimators=100, random_state=42).fit(X, y)
+    return FlatForest.from_sklearn(model), X.to_numpy(dtype=float), [str(c) for c in mlb.classes_]
+
+
+def sheet_text():
+    from bench_ocr_engine import SHEET_ROWS
+
+    return "\n".join(f"{label} {(low + high) / 2:g} {unit} {low:g} - {high:g}"
+                     for label, _, unit, low, high in SHEET_ROWS)
+
+
+def bench_ecg_preprocess(recorder, iterations):
+    from ecg_loader import fit_signal, scale_signals
+    from ecg_features import extract_features
+    from bench_ecg_digitizer import synthetic_signal
+
+    records = [synthetic_signal(seed, n_samples=1200) for seed in range(16)]
+    scaler = ecg_scaler(np.stack(records))
+
+    def op(i):
+        signal = fit_signal(records[i % len(records)], 1000)
+        scale_signals(scaler, signal[None])
+        extract_features(signal[None])
+
+    recorder.calls(op, iterations)
+    return 1
+
+
+def bench_ecg_digitize(recorder, iterations):
+    import cv2
+    from ecg_digitizer import ECGDigitizer
+    from bench_ecg_digitizer import synthetic_signal, render_printout
+
+    digitizer = ECGDigitizer(sampling_rate=100, duration=10.0)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = []
+        for seed in range(8):
+            paths.append(os.path.join(tmp_dir, f"ecg_{seed}.png"))
+            cv2.imwrite(paths[-1], render_printout(synthetic_signal(seed)))
+        recorder.calls(lambda i: digitizer.digitize_file(paths[i % len(paths)]), iterations)
+    return 1
+
+
+def bench_ecg_inference(recorder, iterations):
+    model, samples = ecg_model()
+    recorder.calls(lambda i: model.predict(samples[i % len(samples)][None], verbose=0), iterations)
+    return 1
+
+
+def bench_ecg_batch(recorder, iterations, batch_size=32):
+    model, samples = ecg_model()
+    batches = [samples[start:start + batch_size] for start in range(0, len(samples), batch_size)]
+    recorder.calls(lambda i: model.predict(batches[i % len(batches)], batch_size=batch_size, verbose=0), iterations)
+    return batch_size
+
+
+def bench_forest_single(recorder, iterations):
+    forest, X, _ = disease_forest()
+    recorder.calls(lambda i: forest.predict(X[i % len(X)][None]), iterations)
+    return 1
+
+
+def bench_forest_batch(recorder, iterations, batch_size=256):
+    forest, X, _ = disease_forest()
+    X = np.resize(X, (batch_size * 4, X.shape[1]))
+    recorder.calls(lambda i: forest.predict(X[(i % 4) * batch_size:(i % 4 + 1) * batch_size]), iterations)
+    return batch_size
+
+
+def bench_ocr_parse(recorder, iterations):
+    from ocr_engine import parse_lab_values
+
+    text = sheet_text()
+    recorder.calls(lambda i: parse_lab_values(text), iterations)
+    return 1
+
+
+def bench_ocr_image(recorder, iterations):
+    import cv2
+    from ocr_engine import OCREngine
+    from bench_ocr_engine import render_sheet
+
+    text = sheet_text()
+
+    class StubOCREngine(OCREngine):
+        def _recognize_region(self, region):
+            return text
+
+    engine = StubOCREngine(workers=1, cache_dir=None, memory_entries=0)
+    uploads = [cv2.imencode(".png", render_sheet(seed)[0])[1].tobytes() for seed in range(8)]
+    recorder.calls(lambda i: engine.process(uploads[i % len(uploads)]), iterations)
+    engine.shutdown()
+    return 1
+
+
+def turn(i):
+    return {
+        'conversation_id': f"bench-{i % 50}",
+        'messages': [{'role': 'user', 'content': "I have chest pain and shortness of breath for 3 days."},
+                     {'role': 'assistant', 'content': "- Hypertension (72.0% confidence)"}],
+        'predictions': [{'prediction_type': "Hypertension", 'prediction_data': "Elevated blood pressure",
+                         'confidence': 0.72}],
+    }
+
+
+def bench_sqlite_write(recorder, iterations):
+    from chat_database import ChatDatabase
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = ChatDatabase(os.path.join(tmp_dir, "medical_chatbot.db"))
+        recorder.calls(lambda i: db.save_turn(**turn(i)), iterations)
+        db.close()
+    return 1
+
+
+def bench_sqlite_read(recorder, iterations):
+    from chat_database import ChatDatabase
+    from bench_chat_database import populate
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = ChatDatabase(os.path.join(tmp_dir, "medical_chatbot.db"))
+        conversations = populate(db, 50000)
+        recorder.calls(lambda i: db.get_conversation_history(conversations[i * 7919 % len(conversations)][0],
+                                                             limit=20), iterations)
+        db.close()
+    return 1
+
+
+def bench_chat(recorder, iterations, concurrency):
+    import httpx
+    from load_chat import PAYLOAD
+    from bench_ecg_digitizer import synthetic_signal
+    from chat_database import ChatDatabase
+    from chat_pipeline import ChatPipeline, create_app
+
+    model, samples = ecg_model()
+    scaler = ecg_scaler(samples)
+    forest, X, labels = disease_forest()
+
+    def ecg(signal):
+        from ecg_loader import scale_signals
+        probs = model.predict(scale_signals(scaler, np.asarray(signal, dtype=np.float32)[None]), verbose=0)[0]
+        return {'name': f"ECG class {int(probs.argmax())}", 'probability': float(probs.max()), 'summary': "ECG"}
+
+    def tabular(patient_data):
+        proba, _ = forest.predict(X[hash(patient_data.get('symptoms_text')) % len(X)][None])
+        top = np.argsort(proba[0])[::-1][:3]
+        return [{'name': f"ICD-9 {labels[j]}", 'probability': float(proba[0, j]), 'summary': "RandomForest"}
+                for j in top]
+
+    payload = dict(PAYLOAD, patient_data=dict(PAYLOAD['patient_data'],
+                                              ecg_signal=synthetic_signal(0).round(3).tolist()))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = ChatDatabase(os.path.join(tmp_dir, "medical_chatbot.db"))
+        pipeline = ChatPipeline(ecg=ecg, tabular=tabular, save_turns=db.save_turns, max_pending=concurrency * 2)
+        app = create_app(pipeline)
+
+        async def run():
+            async with app.router.lifespan_context(app):
+                transport = httpx.ASGITransport(app=app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60.0) as http:
+                    async def client(n_requests, latencies):
+                        for _ in range(n_requests):
+                            start = time.perf_counter()
+                            response = await http.post("/chat", json=payload)
+                            response.raise_for_status()
+                            latencies.append(time.perf_counter() - start)
+
+                    await asyncio.gather(*(client(2, []) for _ in range(concurrency)))
+                    with recorder.measuring():
+                        await asyncio.gather(*(client(iterations // concurrency, recorder.latencies)
+                                               for _ in range(concurrency)))
+
+        asyncio.run(run())
+        db.close()
+    return 1
+
+
+# name -> (function, iterations, extra arguments)
+SCENARIOS = {
+    'ecg_preprocess': (bench_ecg_preprocess, 300, {}),
+    'ecg_digitize': (bench_ecg_digitize, 60, {}),
+    'ecg_inference': (bench_ecg_inference, 100, {}),
+    'ecg_batch': (bench_ecg_batch, 20, {}),
+    'forest_single': (bench_forest_single, 1000, {}),
+    'forest_batch': (bench_forest_batch, 100, {}),
+    'ocr_parse': (bench_ocr_parse, 2000, {}),
+    'ocr_image': (bench_ocr_image, 60, {}),
+    'sqlite_write': (bench_sqlite_write, 500, {}),
+    'sqlite_read': (bench_sqlite_read, 1000, {}),
+    'chat_c1': (bench_chat, 100, {'concurrency': 1}),
+    'chat_c8': (bench_chat, 200, {'concurrency': 8}),
+    'chat_c32': (bench_chat, 320, {'concurrency': 32}),
+}
+
+
+def summarize(latencies, wall, items_per_op, peak_rss):
+    latencies = np.array(latencies) * 1000
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        'operations': len(latencies),
+        'p50_ms': float(p50),
+        'p95_ms': float(p95),
+        'p99_ms': float(p99),
+        'throughput': len(latencies) * items_per_op / wall,
+        'peak_rss_mb': peak_rss / 2 ** 20,
+    }
+
+
+def measure(name, iterations, profile_path, queue):
+    """Run one scenario in this process and report its summary"""
+    import logging
+    os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+    logging.getLogger("tensorflow").setLevel(logging.ERROR)
+
+    memory = PeakMemory()
+    func, _, kwargs = SCENARIOS[name]
+    profiler = cProfile.Profile() if profile_path else None
+    recorder = Recorder(profiler)
+    try:
+        items_per_op = func(recorder, iterations, **kwargs)
+    except Exception as e:
+        memory.stop()
+        queue.put({'error': f"{type(e).__name__}: {e}"})
+        return
+    if profiler is not None:
+        profiler.dump_stats(profile_path)
+    queue.put(summarize(recorder.latencies, recorder.wall, items_per_op, memory.stop()))
+
+
+def run_isolated(name, iterations, profile_path=None):
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    process = ctx.Process(target=measure, args=(name, iterations, profile_path, queue))
+    process.start()
+    deadline = time.monotonic() + SCENARIO_TIMEOUT
+    result = None
+    while result is None:
+        try:
+            result = queue.get(timeout=1)
+        except Empty:
+            # A crashed scenario never puts a result; stop waiting once its process is gone
+            if not process.is_alive():
+                try:
+                    result = queue.get(timeout=1)
+                except Empty:
+                    result = {'error': f"no result (exit code {process.exitcode})"}
+            elif time.monotonic() > deadline:
+                process.terminate()
+                result = {'error': f"no result after {SCENARIO_TIMEOUT} s"}
+    process.join()
+    return result
+
+
+def render_flamegraph(profile_path):
+    """Write an SVG next to the .prof with flameprof; returns its path or None"""
+    from warmup import is_installed
+    if not is_installed("flameprof"):
+        return None
+    svg_path = profile_path[:-len(".prof")] + ".svg"
+    with open(svg_path, 'w') as f:
+        subprocess.run([sys.executable, "-m", "flameprof", profile_path], stdout=f, check=True)
+    return svg_path
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
+
+def save_history(path, history):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(history, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def baseline(history, run, n_runs):
+    """Median of each scenario metric over the last ``n_runs`` comparable runs"""
+    # cProfile slows the timed code down: profiled runs are only compared with each other
+    comparable = [past for past in history
+                  if all(past.get(key) == run[key] for key in ('host', 'quick', 'profiled'))]
+    medians = {}
+    for name in run['results']:
+        past = [r['results'][name] for r in comparable if 'error' not in r['results'].get(name, {'error': 1})]
+        past = past[-n_runs:]
+        if past:
+            medians[name] = {metric: float(np.median([p[metric] for p in past])) for metric in CHECKED_METRICS}
+            medians[name]['runs'] = len(past)
+    return medians
+
+
+def regressions(results, medians, threshold):
+    """[(scenario, metric, baseline, value, relative change)] beyond the threshold"""
+    found = []
+    for name, result in results.items():
+        if 'error' in result or name not in medians:
+            continue
+        for metric, worse in CHECKED_METRICS.items():
+            base = medians[name][metric]
+            if base > 0:
+                change = (result[metric] - base) / base
+                if change * worse > threshold:
+                    found.append((name, metric, base, result[metric], change))
+    return found
+
+
+def print_profile(profile_path, top=8):
+    """The ``top`` functions by cumulative time"""
+    stats = pstats.Stats(profile_path).stats
+    width = 70
+    for func, (_, calls, _, cumulative, _) in sorted(stats.items(), key=lambda kv: -kv[1][3])[:top]:
+        where = f"{os.path.basename(func[0])}:{func[1]}({func[2]})"
+        print(f"      {where[-width:]:<{width}} {calls:>8} {cumulative * 1000:>10.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark suite with history and regression check")
+    parser.add_argument("--scenarios", nargs="+", help="Scenario names or prefixes (default: all)")
+    parser.add_argument("--quick", action="store_true", help="A fifth of the iterations (compared only with quick runs)")
+    parser.add_argument("--history", default=DEFAULT_HISTORY, help="JSON file the runs are appended to")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed relative regression")
+    parser.add_argument("--baseline-runs", type=int, default=5, help="Past runs the baseline median is taken over")
+    parser.add_argument("--no-record", action="store_true", help="Compare without appending this run")
+    parser.add_argument("--profile", metavar="DIR", help="Save a cProfile dump per scenario")
+    parser.add_argument("--flamegraph", action="store_true", help="Also render SVG flame graphs (needs flameprof)")
+    parser.add_argument("--list", action="store_true", help="List the scenarios and exit")
+    args = parser.parse_args()
+
+    if args.list:
+        for name, (func, iterations, kwargs) in SCENARIOS.items():
+            print(f"{name:<16} {iterations:>6} iterations")
+        return 0
+
+    names = [name for name in SCENARIOS
+             if not args.scenarios or any(name.startswith(prefix) for prefix in args.scenarios)]
+    if not names:
+        print(f"✗ No scenario matches {args.scenarios}; see --list")
+        return 2
+    if args.profile:
+        os.makedirs(args.profile, exist_ok=True)
+
+    run = {
+        'time': datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        'commit': git_commit(),
+        'host': platform.node(),
+        'cpus': os.cpu_count(),
+        'python': platform.python_version(),
+        'quick': args.quick,
+        'profiled': bool(args.profile),
+        'results': {},
+    }
+    history = load_history(args.history)
+
+    print(f"Benchmark suite: {len(names)} scenarios{' (quick)' if args.quick else ''}, "
+          f"commit {run['commit']}, {run['cpus']} CPUs")
+    print("=" * 92)
+    print(f"{'SCENARIO':<16} {'OPS':>6} | {'P50 MS':>9} {'P95 MS':>9} {'P99 MS':>9} | {'ITEMS/S':>10} | "
+          f"{'PEAK RSS':>9} | {'TIME':>6}")
+    for name in names:
+        _, iterations, _ = SCENARIOS[name]
+        if args.quick:
+            iterations = max(10, iterations // 5)
+        profile_path = os.path.join(args.profile, f"{name}.prof") if args.profile else None
+        start = time.perf_counter()
+        result = run_isolated(name, iterations, profile_path)
+        run['results'][name] = result
+        if 'error' in result:
+            print(f"{name:<16} ✗ {result['error']}")
+            continue
+        print(f"{name:<16} {result['operations']:>6} | {result['p50_ms']:>9.3f} {result['p95_ms']:>9.3f} "
+              f"{result['p99_ms']:>9.3f} | {result['throughput']:>10.1f} | {result['peak_rss_mb']:>6.0f} MB | "
+              f"{time.perf_counter() - start:>5.1f}s")
+        if profile_path:
+            print_profile(profile_path)
+            if args.flamegraph:
+                svg_path = render_flamegraph(profile_path)
+                print(f"      ✓ Flame graph: {svg_path}" if svg_path
+                      else "      ✗ flameprof is not installed (pip install flameprof); the .prof opens in snakeviz")
+
+    medians = baseline(history, run, args.baseline_runs)
+    found = regressions(run['results'], medians, args.threshold)
+    failed = [name for name, result in run['results'].items() if 'error' in result]
+    if not args.no_record:
+        history.append(run)
+        save_history(args.history, history)
+        print(f"\n✓ Run recorded in {args.history} ({len(history)} runs)")
+
+    if not medians:
+        print("No earlier comparable runs on this host; this run is the baseline")
+    for name, metric, base, value, change in found:
+        print(f"✗ {name} {metric}: {base:.3f} -> {value:.3f} ({change:+.0%}, "
+              f"median of {medians[name]['runs']} runs)")
+    if failed:
+        print(f"✗ {len(failed)} scenarios failed: {', '.join(failed)}")
+    if found or failed:
+        return 1
+    if medians:
+        print(f"✓ No regressions beyond {args.threshold:.0%} against the median of the last "
+              f"{args.baseline_runs} runs")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,189 @@
+"""Load generator for /chat based on the test_chatbot.py payload.
+
+Against a running server:
+
+    python benchmarks/load_chat.py --url http://localhost:8000/chat --concurrency 32
+
+Without ``--url`` it starts two local servers with the same synthetic
+workload (CPU-bound OCR on a fraction of requests, tabular inference on all
+of them) and compares the inline handler, where stages run on the event loop,
+with the async ChatPipeline.
+"""
+import os
+import sys
+import time
+import socket
+import asyncio
+import argparse
+import multiprocessing
+
+import httpx
+import numpy as np
+import uvicorn
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+from chat_pipeline import ChatPipeline, create_app, default_response
+
+PAYLOAD = {
+    "messages": [
+        {"role": "user", "content": "I have chest pain and shortness of breath for 3 days."}
+    ],
+    "patient_data": {
+        "lab_results": {
+            "glucose": 130,
+            "blood_pressure_systolic": 145,
+            "blood_pressure_diastolic": 95,
+            "ALT": 45,
+            "AST": 38,
+            "creatinine": 1.1,
+            "white_blood_cells": 9.5
+        },
+        "signals": {
+            "heart_rate": 88,
+            "respiratory_rate": 18,
+            "temperature": 37.2,
+            "oxygen_saturation": 97
+        },
+        "symptoms_text": "I have chest pain and shortness of breath for 3 days."
+    }
+}
+
+
+def busy(seconds):
+    """Hold the CPU (and the GIL) for ``seconds``"""
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def synthetic_ocr(image):
+    busy(0.2)
+    return {'text': "Blood Test Result", 'image': image}
+
+
+def synthetic_tabular(patient_data):
+    # ~5 ms of numpy work; like sklearn/TensorFlow it releases the GIL while computing
+    matrix = np.ones((180, 180))
+    for _ in range(4):
+        matrix = matrix @ matrix / 180
+    return [{'name': "Hypertension", 'probability': 0.72, 'summary': "Elevated blood pressure"}]
+
+
+def inline_app():
+    """The current shape: every stage runs directly in the async handler"""
+    from fastapi import FastAPI, Request
+    app = FastAPI()
+
+    @app.post("/chat")
+    async def chat(request: Request):
+        body = await request.json()
+        results = {'ocr': [synthetic_ocr(image) for image in body.get('images') or []],
+                   'tabular': synthetic_tabular(body.get('patient_data') or {})}
+        return default_response(body, results)
+
+    return app
+
+
+def pipeline_app():
+    return create_app(ChatPipeline(ocr=synthetic_ocr, tabular=synthetic_tabular, ocr_workers=2, max_pending=64))
+
+
+APPS = {'inline': inline_app, 'pipeline': pipeline_app}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run_server(factory, port):
+    uvicorn.run(APPS[factory](), host="127.0.0.1", port=port, log_level="warning")
+
+
+def serve(factory):
+    """Run an app in its own process so the load generator does not share its GIL
+
+    Returns (process, url) once the port accepts connections.
+    """
+    port = free_port()
+    process = multiprocessing.Process(target=run_server, args=(factory, port))
+    process.start()
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.1)
+    return process, f"http://127.0.0.1:{port}/chat"
+
+
+async def generate_load(url, concurrency, duration, ocr_fraction, seed=42):
+    """Send requests from ``concurrency`` clients for ``duration`` seconds
+
+    Returns (latencies in ms, was_ocr flags, status codes).
+    """
+    rng = np.random.default_rng(seed)
+    latencies, with_ocr, statuses = [], [], []
+    stop = time.perf_counter() + duration
+
+    async def client(http):
+        while time.perf_counter() < stop:
+            payload = dict(PAYLOAD)
+            ocr = rng.random() < ocr_fraction
+            if ocr:
+                payload['images'] = ["processed_ocr_image.png"]
+            start = time.perf_counter()
+            try:
+                response = await http.post(url, json=payload)
+                statuses.append(response.status_code)
+            except httpx.HTTPError:
+                statuses.append(0)
+            latencies.append((time.perf_counter() - start) * 1000)
+            with_ocr.append(ocr)
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(timeout=60.0, limits=limits) as http:
+        await asyncio.gather(*(client(http) for _ in range(concurrency)))
+    return np.array(latencies), np.array(with_ocr, dtype=bool), np.array(statuses)
+
+
+def report(name, latencies, with_ocr, statuses, duration):
+    ok = statuses == 200
+    plain = latencies[~with_ocr & ok]
+    print(f"{name:<10} {ok.sum() / duration:>8.1f} {np.percentile(latencies[ok], 50):>9.1f} "
+          f"{np.percentile(latencies[ok], 99):>9.1f} "
+          f"{np.percentile(plain, 99) if len(plain) else float('nan'):>15.1f} {(~ok).sum():>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator for the /chat endpoint")
+    parser.add_argument("--url", help="Target an already running server instead of the local comparison")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--ocr-fraction", type=float, default=0.05, help="Share of requests with an OCR upload")
+    args = parser.parse_args()
+
+    targets, processes = [], []
+    if args.url:
+        targets.append(("server", args.url))
+    else:
+        for name in APPS:
+            process, url = serve(name)
+            processes.append(process)
+            targets.append((name, url))
+
+    print(f"/chat load: {args.concurrency} clients, {args.duration:.0f}s, {args.ocr_fraction:.0%} OCR uploads")
+    print("=" * 60)
+    print(f"{'TARGET':<10} {'REQ/S':>8} {'P50 (ms)':>9} {'P99 (ms)':>9} {'P99 NO-OCR (ms)':>15} {'ERRORS':>7}")
+    for name, url in targets:
+        latencies, with_ocr, statuses = asyncio.run(
+            generate_load(url, args.concurrency, args.duration, args.ocr_fraction))
+        report(name, latencies, with_ocr, statuses, args.duration)
+    for process in processes:
+        process.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Startup profiler: per-module import time and time-to-first-request.
+
+Import times come from ``python -X importtime`` in a fresh interpreter, so
+nothing imported by this script skews them. Time-to-first-request is measured
+from spawning a server process to its first successful response, for an
+eager server (frameworks and models loaded before binding the port) and a
+lazy one (warmup.py: port bound first, warmup in the background,
+/health/ready turning 200 when done).
+
+    python benchmarks/profile_startup.py
+    python benchmarks/profile_startup.py --modules tensorflow torch --top 15
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+import subprocess
+from collections import defaultdict
+
+import httpx
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+from warmup import BACKEND_DEPENDENCIES, is_installed
+
+
+def import_times(statement):
+    """Run ``statement`` under -X importtime; returns {top-level package: cumulative seconds}"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", statement],
+                            capture_output=True, text=True, cwd=REPO_DIR)
+    packages = defaultdict(float)
+    for line in result.stderr.splitlines():
+        # "import time:       self [us] |  cumulative | imported package"
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit() or name.startswith("  "):
+            continue  # Header, or a nested import already counted in its parent's cumulative time
+        packages[name.strip().split(".")[0]] += int(cumulative) / 1e6
+    return dict(packages)
+
+
+def timed(command):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", command], capture_output=True, cwd=REPO_DIR)
+    return time.perf_counter() - start
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def serve(mode, port, models):
+    """Server entry point (runs in the child process)"""
+    import uvicorn
+    from chat_pipeline import ChatPipeline, create_app
+    from warmup import default_warmup
+
+    def tabular(patient_data):
+        return [{'name': "Hypertension", 'probability': 0.72}]
+
+    warmup = default_warmup(models or None)
+    if mode == 'eager':
+        warmup.run()  # Everything loads before the port is bound, as before
+    app = create_app(ChatPipeline(tabular=tabular), warmup=warmup)
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def time_to_first_request(mode, models, timeout):
+    """Spawn a server; returns (seconds to first /chat response, seconds to ready)"""
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    command = [sys.executable, os.path.abspath(__file__), "--serve", mode, "--port", str(port)]
+    if models:
+        command += ["--models", *models]
+
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=REPO_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    first_request = ready = None
+    try:
+        with httpx.Client(timeout=5.0) as http:
+            while time.perf_counter() - start < timeout and (first_request is None or ready is None):
+                try:
+                    if first_request is None and http.post(f"{base}/chat", json={}).status_code == 200:
+                        first_request = time.perf_counter() - start
+                    if ready is None and http.get(f"{base}/health/ready").status_code == 200:
+                        ready = time.perf_counter() - start
+                except httpx.HTTPError:
+                    pass
+                time.sleep(0.02)
+    finally:
+        process.terminate()
+        process.wait()
+    return first_request, ready
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile backend cold start")
+    parser.add_argument("--modules", nargs="+", default=None,
+                        help="Modules to import-profile (default: installed backend dependencies)")
+    parser.add_argument("--top", type=int, default=10, help="Slowest packages to list")
+    parser.add_argument("--models", nargs="*", default=[], help="Registry artifacts to preload in the warmup")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--serve", choices=["eager", "lazy"], help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port, args.models)
+        return
+
+    modules = args.modules or [name for name in BACKEND_DEPENDENCIES if is_installed(name)]
+    print("Backend cold start profile")
+    print("=" * 60)
+
+    times = import_times("; ".join(f"import {name}" for name in modules))
+    print(f"Import time of {len(modules)} modules: {sum(times.values()):.2f}s")
+    print(f"{'PACKAGE':<24} {'CUMULATIVE (s)':>15}")
+    for name, seconds in sorted(times.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"{name:<24} {seconds:>15.3f}")
+
+    names = repr(modules)
+    check_import = timed(f"import importlib\nfor name in {names}: importlib.import_module(name)")
+    check_spec = timed(f"import importlib.util\nfor name in {names}: importlib.util.find_spec(name)")
+    print()
+    print(f"{'DEPENDENCY CHECK':<24} {'SECONDS':>15}")
+    print(f"{'import every module':<24} {check_import:>15.2f}")
+    print(f"{'find_spec only':<24} {check_spec:>15.2f}")
+
+    print()
+    print(f"{'SERVER':<10} {'FIRST REQUEST (s)':>18} {'READY (s)':>10}")
+    for mode in ("eager", "lazy"):
+        first_request, ready = time_to_first_request(mode, args.models, args.timeout)
+        fmt = lambda value: f"{value:.2f}" if value is not None else "timeout"
+        print(f"{mode:<10} {fmt(first_request):>18} {fmt(ready):>10}")
+
+
+if __name__ == "__main__":
+    main()
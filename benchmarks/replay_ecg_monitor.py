@@ -0,0 +1,187 @@
+"""Replay harness for the real-time ECG monitor: alert latency and patients per core.
+
+Streams ``--patients`` recordings into one ECGMonitor in ``--chunk-ms``
+device packets, on the wall-clock schedule of ``--speed`` x real time
+(patients staggered within each packet interval), and reports per run:
+
+- WINDOW LAT: chunk that completed a window -> model prediction (ms); a model
+  alert fires this long after its last confirming window is complete
+- ALERT E2E:  onset sample ingested -> alert delivered to a subscriber (wall s),
+  for the synthetic episodes; includes waiting for enough beats at 1x
+- ALERT SIG:  the same delay in seconds of signal, independent of speed
+- MAX LAG:    how far ingestion fell behind the packet schedule (ms); growing
+  lag means the run is beyond what one process keeps up with
+- PATIENTS/CORE: seconds of signal processed per CPU second, i.e. how many
+  real-time bedside streams one core sustains
+
+Recordings are WFDB records (``--records``, needs the wfdb package; PTB-XL
+records500 are 500 Hz) looped to ``--duration``, or synthetic 500 Hz 12-lead
+ECGs whose rate jumps to a tachycardia (even patients) or bradycardia (odd)
+halfway through. Without ``--model`` the monitor scores with an untrained
+CNN-LSTM shaped like the ECG model: the inference cost is realistic, its
+predictions are not, so model alerts need ``--model`` and real records.
+
+    python benchmarks/replay_ecg_monitor.py --patients 1 32 --speed 1 10 100 --duration 30
+"""
+import os
+import sys
+import time
+import heapq
+import argparse
+
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from ecg_monitor import ECGMonitor
+from bench_micro_batching import build_ecg_model
+
+STAND_IN_CLASSES = ['NORM', 'MI', 'STTC', 'CD', 'HYP']
+
+
+def synthetic_stream(seconds, heart_rates, sampling_rate=500, seed=0):
+    """12-lead ECG with baseline wander whose heart rate steps through ``heart_rates`` in equal parts"""
+    rng = np.random.default_rng(seed)
+    n = int(seconds * sampling_rate)
+    rate = np.repeat(heart_rates, -(-n // len(heart_rates)))[:n] * (1 + rng.normal(0, 0.01, n))
+    phase = np.cumsum(rate / 60 / sampling_rate) % 1.0
+    t = np.arange(n) / sampling_rate
+    beat = np.exp(-((phase - 0.3) / 0.015) ** 2) + 0.2 * np.exp(-((phase - 0.6) / 0.05) ** 2)
+    wander = 0.3 * np.sin(2 * np.pi * 0.2 * t + rng.random() * 6)
+    return (beat[:, None] * rng.uniform(0.5, 1.5, 12) + wander[:, None]
+            + rng.normal(0, 0.03, (n, 12))).astype(np.float32)
+
+
+def synthetic_patients(n_patients, duration):
+    """(patient_id, signal, sampling rate, episode onset seconds, expected alert code) per patient"""
+    patients = []
+    for p in range(n_patients):
+        rng = np.random.default_rng(p)
+        normal = rng.uniform(60, 85)
+        episode, code = (rng.uniform(160, 180), 'TACHY') if p % 2 == 0 else (rng.uniform(30, 36), 'BRADY')
+        patients.append((f"bed-{p}", synthetic_stream(duration, [normal, episode], seed=p), 500, duration / 2, code))
+    return patients
+
+
+def wfdb_patients(paths, n_patients, duration):
+    import wfdb
+
+    patients = []
+    for p in range(n_patients):
+        record = wfdb.rdrecord(paths[p % len(paths)])
+        signal = np.nan_to_num(record.p_signal[:, :12]).astype(np.float32)
+        signal = np.resize(signal, (int(duration * record.fs), signal.shape[1]))
+        patients.append((f"bed-{p}", signal, int(record.fs), None, None))
+    return patients
+
+
+def replay(monitor, patients, speed, chunk_seconds):
+    """Feed every patient's packets on schedule; returns run measurements"""
+    interval = chunk_seconds / speed
+    schedule = [(p * interval / len(patients), p, 0) for p in range(len(patients))]
+    heapq.heapify(schedule)
+    onsets = {}
+    alerts = []
+    monitor.subscribe(alerts.append)
+
+    max_lag = 0.0
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    while schedule:
+        due, p, offset = heapq.heappop(schedule)
+        now = time.perf_counter() - start
+        if due > now:
+            time.sleep(due - now)
+        else:
+            max_lag = max(max_lag, now - due)
+        patient_id, signal, sampling_rate, onset, _ = patients[p]
+        size = int(round(chunk_seconds * sampling_rate))
+        if onset is not None and offset <= onset * sampling_rate < offset + size:
+            onsets[patient_id] = time.time()
+        monitor.ingest(patient_id, signal[offset:offset + size], sampling_rate)
+        if offset + size < len(signal):
+            heapq.heappush(schedule, (due + interval, p, offset + size))
+
+    while monitor.batcher.samples + monitor.failures < monitor.windows:
+        time.sleep(0.001)
+    wall = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+
+    expected = {patient_id: (onset, code) for patient_id, _, _, onset, code in patients}
+    wall_delays, signal_delays = [], []
+    for alert in alerts:
+        onset, code = expected[alert['patient_id']]
+        if alert['code'] == code and alert['patient_id'] in onsets:
+            wall_delays.append(alert['time'] - onsets[alert['patient_id']])
+            signal_delays.append(alert['stream_time'] - onset)
+    signal_seconds = sum(len(signal) / sampling_rate for _, signal, sampling_rate, _, _ in patients)
+    return {
+        'wall': wall,
+        'cpu': cpu,
+        'max_lag_ms': max_lag * 1000,
+        'alerts': len(alerts),
+        'detected': len(wall_delays),
+        'wall_delays': np.array(wall_delays),
+        'signal_delays': np.array(signal_delays),
+        'patients_per_core': signal_seconds / cpu,
+        'stats': monitor.stats(),
+    }
+
+
+def load_model(args):
+    """(predict_batch, class names, scaler) for the monitor"""
+    if args.model:
+        from model_registry import registry
+        model = registry.get(args.model)
+        label_encoder = registry.get('label_encoder.pkl')
+        scaler = registry.get('scaler.pkl')
+        return (lambda batch: model.predict(batch, batch_size=len(batch), verbose=0),
+                list(label_encoder.classes_), scaler)
+    model, _ = build_ecg_model(num_classes=len(STAND_IN_CLASSES))
+    return lambda batch: model.predict(batch, batch_size=len(batch), verbose=0), STAND_IN_CLASSES, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay ECG streams through the real-time monitor")
+    parser.add_argument("--patients", type=int, nargs="+", default=[1, 32])
+    parser.add_argument("--speed", type=float, nargs="+", default=[1, 10, 100], help="Multiples of real time")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of signal per patient")
+    parser.add_argument("--chunk-ms", type=float, default=40.0, help="Signal per device packet")
+    parser.add_argument("--stride", type=float, default=2.5, help="Seconds between overlapping windows")
+    parser.add_argument("--records", nargs="+", help="WFDB record paths (default: synthetic ECGs)")
+    parser.add_argument("--model", help="ECG model path for the registry (default: untrained stand-in)")
+    parser.add_argument("--max-wait-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    predict_batch, class_names, scaler = load_model(args)
+    for size in range(1, 33):  # Trace every batch size up front so no run pays for it
+        predict_batch(np.zeros((size, 1000, 12), dtype=np.float32))
+    print(f"ECG monitor replay: {args.duration:.0f}s per patient in {args.chunk_ms:.0f} ms packets, "
+          f"{args.stride:.1f}s stride, {'WFDB records' if args.records else 'synthetic ECGs'}")
+    print("=" * 104)
+    print(f"{'PATIENTS':>8} {'SPEED':>6} | {'WINDOWS':>7} {'BATCH':>5} | {'WINDOW LAT P50/P99':>18} | "
+          f"{'ALERTS':>7} {'ALERT E2E P50':>13} {'ALERT SIG':>9} | {'MAX LAG':>8} {'CPU':>6} {'PATIENTS/CORE':>13}")
+    for n_patients in args.patients:
+        patients = (wfdb_patients(args.records, n_patients, args.duration) if args.records
+                    else synthetic_patients(n_patients, args.duration))
+        for speed in args.speed:
+            monitor = ECGMonitor(predict_batch, class_names, scaler=scaler, stride_seconds=args.stride,
+                                 max_wait_ms=args.max_wait_ms)
+            result = replay(monitor, patients, speed, args.chunk_ms / 1000)
+            stats = result['stats']
+            if result['detected']:
+                alerts = f"{result['detected']}/{n_patients}"
+                e2e = f"{np.percentile(result['wall_delays'], 50):.2f}s"
+                delay = f"{np.percentile(result['signal_delays'], 50):.1f}s"
+            else:
+                alerts, e2e, delay = str(result['alerts']), "-", "-"
+            print(f"{n_patients:>8} {speed:>5.0f}x | {stats['windows']:>7} "
+                  f"{stats['batcher']['mean_batch_size']:>5.1f} | "
+                  f"{stats['window_latency_p50_ms']:>8.1f} /{stats['window_latency_p99_ms']:>7.1f} ms | "
+                  f"{alerts:>7} {e2e:>13} {delay:>9} | {result['max_lag_ms']:>5.0f} ms {result['cpu']:>5.1f}s "
+                  f"{result['patients_per_core']:>13.0f}")
+
+
+if __name__ == "__main__":
+    main()
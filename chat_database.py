@@ -0,0 +1,408 @@
+"""SQLite persistence for medical_chatbot.db, tuned for concurrent chat traffic.
+
+- Versioned migrations tracked in ``PRAGMA user_version``: the original schema,
+  then the secondary indexes that conversation history, patient labs,
+  predictions and analysis lookups need.
+- WAL journal mode, so readers never wait for the writer, with one pooled
+  connection per worker thread.
+- A chat turn's messages, predictions and lab results are written with
+  multi-row inserts in a single transaction.
+- New ids are time-ordered UUID strings, so inserts land at the end of the
+  primary key B-tree instead of at random pages.
+- Each conversation row carries its LLM context (rolling window of recent
+  messages plus a running summary, see conversation_context.py), updated in
+  the turn's transaction and read back with one primary-key lookup.
+"""
+import json
+import os
+import time
+import uuid
+import sqlite3
+import threading
+
+from tracing import span
+
+DEFAULT_DB_PATH = "medical_chatbot.db"
+BUSY_TIMEOUT_MS = 5000
+
+# (version, description, statements); applied in order, each in its own transaction
+MIGRATIONS = [
+    (1, "Base schema", [
+        """CREATE TABLE IF NOT EXISTS patients (
+                    patient_id TEXT PRIMARY KEY,
+                    name TEXT,
+                    age INTEGER,
+                    gender TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )""",
+        """CREATE TABLE IF NOT EXISTS conversations (
+                    conversation_id TEXT PRIMARY KEY,
+                    patient_id TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (patient_id) REFERENCES patients(patient_id)
+                )""",
+        """CREATE TABLE IF NOT EXISTS messages (
+                    message_id TEXT PRIMARY KEY,
+                    conversation_id TEXT,
+                    role TEXT,
+                    content TEXT,
+                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (conversation_id) REFERENCES conversations(conversation_id)
+                )""",
+        """CREATE TABLE IF NOT EXISTS medical_data (
+                    data_id TEXT PRIMARY KEY,
+                    patient_id TEXT,
+                    data_type TEXT,
+                    data_value TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (patient_id) REFERENCES patients(patient_id)
+                )""",
+        """CREATE TABLE IF NOT EXISTS predictions (
+                    prediction_id TEXT PRIMARY KEY,
+                    conversation_id TEXT,
+                    prediction_type TEXT,
+                    prediction_data TEXT,
+                    confidence REAL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (conversation_id) REFERENCES conversations(conversation_id)
+                )""",
+        """CREATE TABLE IF NOT EXISTS lab_results (
+                    result_id TEXT PRIMARY KEY,
+                    patient_id TEXT,
+                    test_name TEXT,
+                    value REAL,
+                    unit TEXT,
+                    reference_range TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (patient_id) REFERENCES patients(patient_id)
+                )""",
+        """CREATE TABLE IF NOT EXISTS medical_images (
+                    image_id TEXT PRIMARY KEY,
+                    patient_id TEXT,
+                    image_type TEXT,
+                    analysis TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (patient_id) REFERENCES patients(patient_id)
+                )""",
+        """CREATE TABLE IF NOT EXISTS analysis_results (
+                    analysis_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    patient_id TEXT NOT NULL,
+                    conversation_id TEXT NOT NULL,
+                    analysis_type TEXT NOT NULL,
+                    results TEXT NOT NULL,
+                    confidence_score REAL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (patient_id) REFERENCES patients (patient_id),
+                    FOREIGN KEY (conversation_id) REFERENCES conversations (conversation_id)
+                )""",
+    ]),
+    (2, "Secondary indexes for history, labs, predictions and analysis lookups", [
+        # Conversation history in order; role/timestamp come from the index, content from the row
+        "CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages (conversation_id, timestamp)",
+        # Covering: a patient's labs are answered from the index alone
+        "CREATE INDEX IF NOT EXISTS idx_lab_results_patient "
+        "ON lab_results (patient_id, created_at, test_name, value, unit)",
+        "CREATE INDEX IF NOT EXISTS idx_predictions_conversation ON predictions (conversation_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_analysis_results_patient ON analysis_results (patient_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_conversations_patient ON conversations (patient_id, last_updated)",
+        "CREATE INDEX IF NOT EXISTS idx_medical_data_patient ON medical_data (patient_id, data_type)",
+        "CREATE INDEX IF NOT EXISTS idx_medical_images_patient ON medical_images (patient_id)",
+        "ANALYZE",
+    ]),
+    (3, "Conversation context state next to last_updated", [
+        "ALTER TABLE conversations ADD COLUMN summary TEXT",
+        "ALTER TABLE conversations ADD COLUMN summarized_messages INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE conversations ADD COLUMN recent_messages TEXT",  # JSON list of {role, content}
+        "ALTER TABLE conversations ADD COLUMN message_count INTEGER NOT NULL DEFAULT 0",
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def new_id():
+    """Time-ordered UUID string (v7 layout: 48-bit millisecond timestamp, then random bits)"""
+    random_bits = uuid.uuid4().int & ((1 << 80) - 1)
+    value = (time.time_ns() // 1_000_000) << 80 | random_bits
+    value = (value & ~(0xF << 76)) | (0x7 << 76)  # Version 7
+    value = (value & ~(0x3 << 62)) | (0x2 << 62)  # RFC 4122 variant
+    return str(uuid.UUID(int=value))
+
+
+def connect(db_path=DEFAULT_DB_PATH):
+    """Open a connection with the concurrency pragmas applied"""
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False,
+                           isolation_level=None)  # Transactions are explicit
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")  # Durable at checkpoints; safe with WAL
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-16000")  # ~16 MB page cache per connection
+    conn.execute("PRAGMA mmap_size=268435456")
+    return conn
+
+
+def migrate(conn, target_version=LATEST_VERSION):
+    """Apply pending migrations up to ``target_version``; returns the resulting version"""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for migration_version, description, statements in MIGRATIONS:
+        if migration_version <= version or migration_version > target_version:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version={migration_version}")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        version = migration_version
+        print(f"✓ Applied migration {migration_version}: {description}")
+    return version
+
+
+class ChatDatabase:
+    """Pooled access to medical_chatbot.db: one connection per worker thread"""
+
+    def __init__(self, db_path=DEFAULT_DB_PATH, target_version=LATEST_VERSION):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self.version = migrate(self.connection(), target_version)
+
+    def connection(self):
+        """This thread's connection, opened on first use"""
+        if self._pid != os.getpid():
+            # Connections must not cross a fork; start a fresh pool in the child
+            self._local = threading.local()
+            self._connections = []
+            self._pid = os.getpid()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = connect(self.db_path)
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
+
+    def transaction(self):
+        """Context manager running the block in one write transaction"""
+        return _Transaction(self.connection())
+
+    # Writes
+
+    def save_turn(self, conversation_id, patient_id=None, messages=(), predictions=(), lab_results=()):
+        """Persist one chat turn atomically
+
+        ``messages``: dicts with role, content; ``predictions``: dicts with
+        prediction_type, prediction_data, confidence; ``lab_results``: dicts with
+        test_name, value, unit, reference_range. Returns the new message ids.
+        """
+        return self.save_turns([{
+            'conversation_id': conversation_id, 'patient_id': patient_id, 'messages': messages,
+            'predictions': predictions, 'lab_results': lab_results,
+        }])
+
+    def save_turns(self, turns):
+        """Persist several turns (dicts with save_turn's arguments) in one transaction
+
+        A turn may also carry ``context`` (ConversationContext.state()), which
+        replaces the conversation's stored context.
+        """
+        conversation_rows, context_rows, message_rows, prediction_rows, lab_rows = [], [], [], [], []
+        for turn in turns:
+            conversation_id, patient_id = turn['conversation_id'], turn.get('patient_id')
+            conversation_rows.append((conversation_id, patient_id))
+            context = turn.get('context')
+            if context is not None:
+                context_rows.append((context['summary'], context['summarized_messages'],
+                                     json.dumps(context['recent_messages']), context['message_count'],
+                                     conversation_id))
+            message_rows += [(new_id(), conversation_id, m['role'], m['content']) for m in turn.get('messages', ())]
+            prediction_rows += [(new_id(), conversation_id, p.get('prediction_type'), p.get('prediction_data'),
+                                 p.get('confidence')) for p in turn.get('predictions', ())]
+            lab_rows += [(new_id(), patient_id, r.get('test_name'), r.get('value'), r.get('unit'),
+                          r.get('reference_range')) for r in turn.get('lab_results', ())]
+
+        with span('sqlite.save_turns'), self.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO conversations (conversation_id, patient_id) VALUES (?, ?) "
+                "ON CONFLICT(conversation_id) DO UPDATE SET last_updated = CURRENT_TIMESTAMP, "
+                "patient_id = COALESCE(excluded.patient_id, conversations.patient_id)",
+                conversation_rows)
+            if context_rows:
+                conn.executemany(
+                    "UPDATE conversations SET summary = ?, summarized_messages = ?, recent_messages = ?, "
+                    "message_count = ? WHERE conversation_id = ?", context_rows)
+            _insert_many(conn, "messages", ("message_id", "conversation_id", "role", "content"), message_rows)
+            _insert_many(conn, "predictions", ("prediction_id", "conversation_id", "prediction_type",
+                                               "prediction_data", "confidence"), prediction_rows)
+            _insert_many(conn, "lab_results", ("result_id", "patient_id", "test_name", "value", "unit",
+                                               "reference_range"), lab_rows)
+        return [row[0] for row in message_rows]
+
+    def save_analysis_result(self, patient_id, conversation_id, analysis_type, results, confidence_score=None):
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                "INSERT INTO analysis_results (patient_id, conversation_id, analysis_type, results, confidence_score) "
+                "VALUES (?, ?, ?, ?, ?)", (patient_id, conversation_id, analysis_type, results, confidence_score))
+        return cursor.lastrowid
+
+    def save_batch_results(self, run_id, predictions=(), analysis_results=()):
+        """Persist one shard of an offline scoring run (see batch_score.py) in one transaction
+
+        ``predictions``: dicts with prediction_id, prediction_type,
+        prediction_data, confidence; a row with the same prediction_id is
+        replaced. ``analysis_results``: dicts with patient_id, analysis_type,
+        results, confidence_score; the run's earlier result for the same patient
+        and type is replaced. Re-running a shard therefore never duplicates rows.
+        Rows are attached to a conversation named after the run.
+        """
+        prediction_rows = [(p['prediction_id'], run_id, p.get('prediction_type'), p.get('prediction_data'),
+                            p.get('confidence')) for p in predictions]
+        analysis_rows = [(r['patient_id'], run_id, r['analysis_type'], r['results'], r.get('confidence_score'))
+                         for r in analysis_results]
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT INTO conversations (conversation_id) VALUES (?) "
+                "ON CONFLICT(conversation_id) DO UPDATE SET last_updated = CURRENT_TIMESTAMP", (run_id,))
+            if prediction_rows:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO predictions (prediction_id, conversation_id, prediction_type, "
+                    "prediction_data, confidence) VALUES (?, ?, ?, ?, ?)", prediction_rows)
+            if analysis_rows:
+                conn.executemany(
+                    "DELETE FROM analysis_results WHERE patient_id = ? AND conversation_id = ? AND analysis_type = ?",
+                    [row[:3] for row in analysis_rows])
+                _insert_many(conn, "analysis_results", ("patient_id", "conversation_id", "analysis_type", "results",
+                                                        "confidence_score"), analysis_rows)
+
+    def upsert_patient(self, patient_id, name=None, age=None, gender=None):
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT INTO patients (patient_id, name, age, gender) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(patient_id) DO UPDATE SET name = COALESCE(excluded.name, patients.name), "
+                "age = COALESCE(excluded.age, patients.age), gender = COALESCE(excluded.gender, patients.gender)",
+                (patient_id, name, age, gender))
+
+    # Reads
+
+    def get_conversation_history(self, conversation_id, limit=None):
+        """Messages of a conversation, oldest first (the last ``limit`` when given)
+
+        Messages of one turn share a second-resolution timestamp; rowid keeps their insert order.
+        """
+        conn = self.connection()
+        with span('sqlite.history'):
+            if limit is None:
+                rows = conn.execute(
+                    "SELECT role, content, timestamp FROM messages WHERE conversation_id = ? ORDER BY timestamp, rowid",
+                    (conversation_id,)).fetchall()
+            else:
+                rows = conn.execute(
+                    "SELECT role, content, timestamp FROM (SELECT role, content, timestamp, rowid AS seq FROM messages "
+                    "WHERE conversation_id = ? ORDER BY timestamp DESC, rowid DESC LIMIT ?) ORDER BY timestamp, seq",
+                    (conversation_id, limit)).fetchall()
+        return [{'role': role, 'content': content, 'timestamp': timestamp} for role, content, timestamp in rows]
+
+    def get_context(self, conversation_id):
+        """Stored LLM context of a conversation (one primary-key lookup), or None if it has none yet
+
+        Returns a dict with summary, summarized_messages, recent_messages,
+        message_count and last_updated.
+        """
+        with span('sqlite.context'):
+            row = self.connection().execute(
+                "SELECT summary, summarized_messages, recent_messages, message_count, last_updated "
+                "FROM conversations WHERE conversation_id = ?", (conversation_id,)).fetchone()
+        if row is None or row[2] is None:
+            return None
+        summary, summarized_messages, recent_messages, message_count, last_updated = row
+        return {'summary': summary, 'summarized_messages': summarized_messages,
+                'recent_messages': json.loads(recent_messages), 'message_count': message_count,
+                'last_updated': last_updated}
+
+    def get_patient_labs(self, patient_id, test_name=None):
+        """A patient's lab results, newest first"""
+        query = "SELECT test_name, value, unit, created_at FROM lab_results WHERE patient_id = ?"
+        params = [patient_id]
+        if test_name is not None:
+            query += " AND test_name = ?"
+            params.append(test_name)
+        rows = self.connection().execute(query + " ORDER BY created_at DESC", params).fetchall()
+        return [{'test_name': t, 'value': v, 'unit': u, 'created_at': c} for t, v, u, c in rows]
+
+    def get_predictions(self, conversation_id):
+        rows = self.connection().execute(
+            "SELECT prediction_type, prediction_data, confidence, created_at FROM predictions "
+            "WHERE conversation_id = ? ORDER BY created_at, rowid", (conversation_id,)).fetchall()
+        return [{'prediction_type': t, 'prediction_data': d, 'confidence': c, 'created_at': at} for t, d, c, at in rows]
+
+    def get_analysis_results(self, patient_id):
+        rows = self.connection().execute(
+            "SELECT analysis_id, conversation_id, analysis_type, results, confidence_score, created_at "
+            "FROM analysis_results WHERE patient_id = ? ORDER BY created_at DESC", (patient_id,)).fetchall()
+        keys = ('analysis_id', 'conversation_id', 'analysis_type', 'results', 'confidence_score', 'created_at')
+        return [dict(zip(keys, row)) for row in rows]
+
+    def get_patient_conversations(self, patient_id):
+        rows = self.connection().execute(
+            "SELECT conversation_id, created_at, last_updated FROM conversations WHERE patient_id = ? "
+            "ORDER BY last_updated DESC", (patient_id,)).fetchall()
+        return [{'conversation_id': c, 'created_at': cr, 'last_updated': lu} for c, cr, lu in rows]
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT/ROLLBACK on a connection"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        # IMMEDIATE takes the write lock up front instead of failing on upgrade mid-transaction
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("COMMIT" if exc_type is None else "ROLLBACK")
+        return False
+
+
+# SQLite's default limit on bound parameters per statement
+MAX_VARIABLES = 999
+
+
+def _insert_many(conn, table, columns, rows):
+    """Insert rows with multi-row VALUES statements"""
+    if not rows:
+        return
+    per_row = "(" + ", ".join("?" * len(columns)) + ")"
+    chunk = max(1, MAX_VARIABLES // len(columns))
+    for start in range(0, len(rows), chunk):
+        batch = rows[start:start + chunk]
+        conn.execute(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES " + ", ".join([per_row] * len(batch)),
+            [value for row in batch for value in row])
+
+
+_databases = {}
+_databases_lock = threading.Lock()
+
+
+def get_database(db_path=DEFAULT_DB_PATH):
+    """Process-wide ChatDatabase for a path (migrated on first use)"""
+    with _databases_lock:
+        db = _databases.get(db_path)
+        if db is None:
+            db = _databases[db_path] = ChatDatabase(db_path)
+        return db
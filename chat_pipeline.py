@@ -0,0 +1,499 @@
+"""Async /chat request pipeline: CPU-bound stages off the event loop.
+
+Every stage of a chat turn (OCR, ECG inference, tabular inference) runs on
+its own bounded process or thread pool, and database writes go through a
+single async writer queue. The event loop only awaits results, so one slow
+OCR upload no longer stalls other users.
+
+With an LLM client (see llm_client.py) the report is written by the local
+LLM, prompted with the conversation's bounded context (recent messages plus
+a running summary, see conversation_context.py) rather than its full
+history. ``ChatPipeline.stream`` serves a turn as server-sent events: the
+structured predictions go out as soon as the models finish, followed by the
+report tokens as they are generated.
+
+Each stage has backpressure and a timeout:
+- a stage holding ``workers + max_pending`` calls rejects new ones with
+  StageOverloaded (HTTP 503) instead of queueing without bound;
+- a call that exceeds the stage timeout raises StageTimeout (HTTP 504). Its
+  pool slot is only released when the work actually finishes.
+"""
+import json
+import time
+import asyncio
+import threading
+from collections import deque
+from contextlib import aclosing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import numpy as np
+
+from pipeline_errors import StageOverloaded, StageTimeout
+from tracing import TracingMiddleware, add_metrics_routes, call_traced, propagate, span, tracer
+
+
+class Stage:
+    """One CPU-bound step of the pipeline with a dedicated, bounded pool
+
+    ``func`` must be a picklable top-level function when ``kind='process'``.
+    """
+
+    def __init__(self, name, func, kind='thread', workers=2, max_pending=16, timeout=30.0):
+        self.name = name
+        self.func = func
+        self.kind = kind
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._executor = None
+        self._lock = threading.Lock()
+
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.failures = 0
+        self._latencies = deque(maxlen=1000)
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            if self.kind == 'process':
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=self.name)
+        return self._executor
+
+    def _release(self, start):
+        with self._lock:
+            self.in_flight -= 1
+            self.completed += 1
+            self._latencies.append(time.perf_counter() - start)
+
+    async def run(self, *args):
+        """Run ``func(*args)`` on the stage pool and await its result"""
+        with span(self.name):
+            return await self._run(*args)
+
+    async def _run(self, *args):
+        with self._lock:
+            if self.in_flight >= self.workers + self.max_pending:
+                self.rejected += 1
+                raise StageOverloaded(f"{self.name} stage is at capacity ({self.in_flight} calls)")
+            self.in_flight += 1
+
+        start = time.perf_counter()
+        # Thread stages carry the request's trace, so spans inside them join its breakdown;
+        # process stages send their spans back with the result
+        remote = self.kind == 'process' and tracer.enabled
+        try:
+            if remote:
+                future = self.executor.submit(call_traced, self.func, *args)
+            elif self.kind == 'thread':
+                future = self.executor.submit(propagate(self.func), *args)
+            else:
+                future = self.executor.submit(self.func, *args)
+        except Exception:
+            self._release(start)
+            raise
+        # The slot frees when the work is done, even if the caller timed out and left
+        future.add_done_callback(lambda _: self._release(start))
+
+        try:
+            result = await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise StageTimeout(f"{self.name} stage timed out after {self.timeout:.1f}s")
+        except Exception:
+            self.failures += 1
+            raise
+        if remote:
+            result, spans = result
+            tracer.record_spans(spans, start)
+        return result
+
+    def stats(self):
+        latencies = np.array(self._latencies) * 1000 if self._latencies else np.zeros(1)
+        return {
+            'kind': self.kind,
+            'workers': self.workers,
+            'in_flight': self.in_flight,
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'timeouts': self.timeouts,
+            'failures': self.failures,
+            'p50_ms': float(np.percentile(latencies, 50)),
+            'p99_ms': float(np.percentile(latencies, 99)),
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+class AsyncDBWriter:
+    """Bounded queue of database writes drained in batches by one writer thread
+
+    ``write_batch(items)`` runs on a dedicated thread, so SQLite writes never
+    block the event loop and are grouped into one transaction per batch.
+    """
+
+    def __init__(self, write_batch, max_queue=1000, max_batch=64, put_timeout=5.0):
+        self.write_batch = write_batch
+        self.max_queue = max_queue
+        self.max_batch = max_batch
+        self.put_timeout = put_timeout
+        self._queue = None
+        self._task = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+
+        self.written = 0
+        self.batches = 0
+        self.rejected = 0
+        self.failures = 0
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = asyncio.create_task(self._run())
+
+    async def submit(self, item):
+        """Queue a write; waits while the queue is full, up to ``put_timeout``"""
+        try:
+            await asyncio.wait_for(self._queue.put(item), self.put_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise StageOverloaded("database writer queue is full")
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await loop.run_in_executor(self._executor, self.write_batch, batch)
+                self.written += len(batch)
+                self.batches += 1
+            except Exception as e:
+                self.failures += 1
+                print(f"✗ Database write of {len(batch)} turns failed: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def stop(self):
+        """Flush queued writes and stop the writer"""
+        if self._task is None:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        self._task = None
+        self._executor.shutdown(wait=True)
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize() if self._queue is not None else 0,
+            'written': self.written,
+            'batches': self.batches,
+            'rejected': self.rejected,
+            'failures': self.failures,
+        }
+
+
+def default_response(request, results):
+    """Build the /chat response from the stage results"""
+    predictions = list(results.get('tabular') or [])
+    if results.get('ecg'):
+        predictions.append(results['ecg'])
+    predictions.sort(key=lambda p: p.get('probability', 0), reverse=True)
+
+    warnings = dict(results.get('warnings') or {})
+    report_lines = [f"- {p['name']} ({p.get('probability', 0) * 100:.1f}% confidence)" for p in predictions]
+    return {
+        'report': "\n".join(report_lines) or "No predictions available.",
+        'predictions': predictions,
+        'suggested_labs': sorted({lab for p in predictions for lab in p.get('suggested_labs', [])}),
+        'warnings': warnings,
+        'requires_immediate_attention': any(p.get('urgent') for p in predictions),
+        'ocr': results.get('ocr') or [],
+    }
+
+
+def default_prompt(request, response):
+    """LLM prompt for the /chat report from the user's last message and the predictions"""
+    messages = request.get('messages') or []
+    question = messages[-1].get('content', "") if messages else ""
+    symptoms = (request.get('patient_data') or {}).get('symptoms_text') or ""
+    context = request.get('conversation_context')
+    findings = "\n".join(f"- {p['name']}: {p.get('probability', 0) * 100:.1f}% ({p.get('summary', '')})"
+                         for p in response['predictions']) or "- No model predictions available."
+    return (
+        "You are a medical assistant. Explain these model findings to the patient in plain language, "
+        "note which need urgent attention and which lab tests would help. Do not give a definitive diagnosis.\n\n"
+        + (f"{context}\n\n" if context else "")
+        + f"Patient message: {question}\n"
+        f"Reported symptoms: {symptoms}\n"
+        f"Model findings:\n{findings}\n"
+        f"Suggested labs: {', '.join(response['suggested_labs']) or 'none'}\n"
+    )
+
+
+def _json_default(value):
+    return value.item() if hasattr(value, 'item') else str(value)
+
+
+def sse_event(event, data):
+    """One server-sent event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data, default=_json_default)}\n\n"
+
+
+class ChatPipeline:
+    """Runs a /chat turn through OCR -> (ECG, tabular) -> response -> LLM report -> async DB write
+
+    Stage functions are plain callables (run in pools); missing ones are skipped.
+    ``llm`` is an llm_client.OllamaClient (anything with async ``stream`` and
+    ``generate``); without it the report lists the predictions. ``context``
+    is a conversation_context.ContextManager: the prompt then gets the
+    conversation's stored context, and only the request's last message is used.
+    ``save_turns(turns)`` is called on the writer thread with batches of turns.
+    With ``prediction_cache`` (a prediction_cache.PredictionCache, usually the
+    process-wide ``prediction_cache.prediction_cache``) tabular results are
+    reused for requests with the same normalized labs and vitals.
+    """
+
+    def __init__(self, ocr=None, ecg=None, tabular=None, build_response=default_response, save_turns=None,
+                 llm=None, build_prompt=default_prompt, context=None, prediction_cache=None,
+                 ocr_workers=2, ecg_workers=1, tabular_workers=2, max_pending=16,
+                 ocr_timeout=30.0, ecg_timeout=10.0, tabular_timeout=5.0):
+        self.stages = {}
+        if ocr is not None:
+            # Tesseract and image decoding are CPU-heavy and hold the GIL in places: separate processes
+            self.stages['ocr'] = Stage('ocr', ocr, 'process', ocr_workers, max_pending, ocr_timeout)
+        if ecg is not None:
+            # TensorFlow releases the GIL; one thread avoids oversubscribing its intra-op pool
+            self.stages['ecg'] = Stage('ecg', ecg, 'thread', ecg_workers, max_pending, ecg_timeout)
+        if tabular is not None:
+            self.stages['tabular'] = Stage('tabular', tabular, 'thread', tabular_workers, max_pending, tabular_timeout)
+        self.build_response = build_response
+        self.llm = llm
+        self.build_prompt = build_prompt
+        self.context = context
+        self.prediction_cache = prediction_cache
+        self.ocr_cache = {'hits': 0, 'misses': 0}  # From the results' 'cached' flags; the engine may be remote
+        self.writer = AsyncDBWriter(save_turns) if save_turns is not None else None
+
+    async def start(self):
+        if self.writer is not None:
+            await self.writer.start()
+
+    async def stop(self):
+        if self.writer is not None:
+            await self.writer.stop()
+        for stage in self.stages.values():
+            stage.shutdown()
+        if self.llm is not None and hasattr(self.llm, 'aclose'):
+            await self.llm.aclose()
+
+    async def predict(self, request):
+        """Run the model stages on one /chat request and build the response (report not generated yet)"""
+        patient_data = request.get('patient_data') or {}
+        results = {'warnings': {}}
+
+        images = request.get('images') or []
+        if images and 'ocr' in self.stages:
+            outcomes = await asyncio.gather(*(self.stages['ocr'].run(image) for image in images),
+                                            return_exceptions=True)
+            failed = []
+            for index, outcome in enumerate(outcomes):
+                if isinstance(outcome, StageOverloaded):
+                    raise outcome
+                if isinstance(outcome, Exception):
+                    failed.append(f"image {index + 1}: {outcome}")
+                elif isinstance(outcome, dict) and 'cached' in outcome:
+                    self.ocr_cache['hits' if outcome['cached'] else 'misses'] += 1
+            # Failed images stay as None so results line up with the request's images
+            results['ocr'] = [None if isinstance(outcome, Exception) else outcome for outcome in outcomes]
+            if failed:
+                results['warnings']['ocr_unavailable'] = "ocr analysis unavailable: " + "; ".join(failed)
+
+        # ECG and tabular inference are independent; run them concurrently
+        pending = {}
+        if 'ecg' in self.stages and patient_data.get('ecg_signal') is not None:
+            pending['ecg'] = self.stages['ecg'].run(patient_data['ecg_signal'])
+        if 'tabular' in self.stages:
+            pending['tabular'] = self._tabular(patient_data)
+        outcomes = await asyncio.gather(*pending.values(), return_exceptions=True)
+        for name, outcome in zip(pending, outcomes):
+            if isinstance(outcome, StageOverloaded):
+                raise outcome
+            if isinstance(outcome, Exception):
+                # One failed model degrades the answer instead of failing the request
+                results['warnings'][f'{name}_unavailable'] = f"{name} analysis unavailable: {outcome}"
+            else:
+                results[name] = outcome
+
+        return self.build_response(request, results)
+
+    async def _tabular(self, patient_data):
+        """The tabular stage, through the prediction cache when there is one"""
+        cache = self.prediction_cache
+        if cache is None:
+            return await self.stages['tabular'].run(patient_data)
+        key = cache.key(patient_data)
+        generation = cache.generation()
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+        result = await self.stages['tabular'].run(patient_data)
+        cache.put(key, result, generation)
+        return result
+
+    async def _load_context(self, request):
+        """The conversation's ConversationContext, with its rendered text added to the request"""
+        if self.context is None or not request.get('conversation_id'):
+            return request, None
+        with span('context'):
+            context = await asyncio.to_thread(self.context.load, request['conversation_id'])
+        return dict(request, conversation_context=context.render()), context
+
+    async def _save(self, request, response, context=None):
+        messages = list(request.get('messages') or [])[-1:]
+        messages.append({'role': 'assistant', 'content': response['report']})
+        if context is not None:
+            await self.context.update(context, messages)
+        if self.writer is not None:
+            turn = {
+                'conversation_id': request.get('conversation_id') or 'anonymous',
+                'patient_id': request.get('patient_id'),
+                'messages': messages,
+                'predictions': [{'prediction_type': p.get('name'), 'prediction_data': p.get('summary'),
+                                 'confidence': p.get('probability')} for p in response['predictions']],
+            }
+            if context is not None:
+                turn['context'] = context.state()
+            await self.writer.submit(turn)
+
+    def _llm_failed(self, response, error):
+        # The predictions-based report stays; like a failed model, this degrades the answer
+        response['warnings']['llm_unavailable'] = f"report generation unavailable: {error}"
+
+    async def handle(self, request):
+        """Process one /chat request (the test_chatbot.py payload) and return the response dict"""
+        response = await self.predict(request)
+        request, context = await self._load_context(request)
+        if self.llm is not None:
+            try:
+                with span('llm'):
+                    response['report'] = await self.llm.generate(self.build_prompt(request, response))
+            except Exception as e:
+                self._llm_failed(response, e)
+        await self._save(request, response, context)
+        return response
+
+    async def stream(self, request, response=None):
+        """Server-sent events for one /chat turn
+
+        'predictions' (the response without the LLM report) as soon as the
+        models are done, then one 'token' per report token, then 'done' with
+        the full report. ``response`` is the result of ``predict`` when the
+        caller already ran it. A turn whose client disconnects mid-report is
+        not saved; closing this generator also closes the LLM stream.
+        """
+        if response is None:
+            response = await self.predict(request)
+        yield sse_event('predictions', response)
+        request, context = await self._load_context(request)
+
+        if self.llm is not None:
+            tokens = []
+            try:
+                with span('llm'):
+                    async with aclosing(self.llm.stream(self.build_prompt(request, response))) as tokens_stream:
+                        async for token in tokens_stream:
+                            tokens.append(token)
+                            yield sse_event('token', {'text': token})
+                response['report'] = "".join(tokens)
+            except Exception as e:
+                self._llm_failed(response, e)
+                if tokens:
+                    response['report'] = "".join(tokens)
+
+        yield sse_event('done', {'report': response['report'], 'warnings': response['warnings']})
+        await self._save(request, response, context)
+
+    def stats(self):
+        stats = {name: stage.stats() for name, stage in self.stages.items()}
+        if self.writer is not None:
+            stats['db_writer'] = self.writer.stats()
+        if self.llm is not None and hasattr(self.llm, 'stats'):
+            stats['llm'] = self.llm.stats()
+        if self.context is not None:
+            stats['context'] = self.context.stats()
+        if self.prediction_cache is not None:
+            stats['prediction_cache'] = self.prediction_cache.stats()
+        if 'ocr' in self.stages:
+            stats['ocr_cache'] = dict(self.ocr_cache)
+        return stats
+
+
+def create_app(pipeline, warmup=None, metrics=False):
+    """FastAPI app serving /chat (JSON) and /chat/stream (server-sent events) through a ChatPipeline
+
+    With a ``warmup`` (see warmup.py) the app starts serving immediately,
+    runs the warmup in the background and exposes /health/live and /health/ready.
+    With ``metrics`` every chat request is traced (see tracing.py) and the app
+    serves /metrics and /metrics/slow.
+    """
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse, StreamingResponse
+    from contextlib import asynccontextmanager
+
+    @asynccontextmanager
+    async def lifespan(app):
+        # Tracing is process-wide: on while a metrics app runs, back to its previous state after
+        tracing_was_enabled = tracer.enabled
+        if metrics:
+            tracer.configure(enabled=True)
+        if warmup is not None:
+            warmup.start()
+        await pipeline.start()
+        try:
+            yield
+        finally:
+            await pipeline.stop()
+            tracer.configure(enabled=tracing_was_enabled)
+
+    app = FastAPI(lifespan=lifespan)
+    if warmup is not None:
+        from warmup import add_health_routes
+        add_health_routes(app, warmup)
+    if metrics:
+        app.add_middleware(TracingMiddleware)
+        add_metrics_routes(app, pipeline)
+
+    @app.exception_handler(StageOverloaded)
+    async def overloaded(request, exc):
+        return JSONResponse({'detail': str(exc)}, status_code=503, headers={'Retry-After': '1'})
+
+    @app.exception_handler(StageTimeout)
+    async def timed_out(request, exc):
+        return JSONResponse({'detail': str(exc)}, status_code=504)
+
+    @app.post("/chat")
+    async def chat(request: Request):
+        return await pipeline.handle(await request.json())
+
+    @app.post("/chat/stream")
+    async def chat_stream(request: Request):
+        body = await request.json()
+        # Overload and timeout errors still become 503/504 before the stream starts
+        response = await pipeline.predict(body)
+        return StreamingResponse(pipeline.stream(body, response), media_type="text/event-stream",
+                                 headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    @app.get("/pipeline/stats")
+    async def pipeline_stats():
+        return pipeline.stats()
+
+    return app
@@ -0,0 +1,186 @@
+"""Bounded LLM context per conversation: recent turns plus a running summary.
+
+Instead of resending and re-reading a conversation's whole history every
+turn, each conversation keeps:
+
+- a rolling window of its most recent messages, sent to the LLM verbatim;
+- a summary of everything older, updated incrementally: when the window
+  overflows, the oldest messages are folded into the summary in one batch.
+
+The state is stored on the conversation's row in medical_chatbot.db (see
+ChatDatabase.get_context), written in the same transaction as the turn's
+messages, and cached in memory. Loading a context costs one primary-key
+lookup at most, and the prompt size stays bounded however long the
+conversation gets.
+"""
+import re
+import inspect
+import threading
+from collections import OrderedDict
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+def extractive_summary(summary, messages, max_chars=1500):
+    """Fold messages into a summary without a model: one line per message, oldest lines dropped first"""
+    lines = summary.splitlines() if summary else []
+    for message in messages:
+        content = " ".join(message['content'].split())
+        first_sentence = _SENTENCE_END.split(content, 1)[0][:200]
+        if first_sentence:
+            lines.append(f"{message['role']}: {first_sentence}")
+    while len(lines) > 1 and sum(len(line) + 1 for line in lines) > max_chars:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+def llm_summarizer(llm, max_words=150):
+    """Async summarize function that asks the LLM (an llm_client.OllamaClient) to update the summary"""
+    async def summarize(summary, messages):
+        transcript = "\n".join(f"{message['role']}: {message['content']}" for message in messages)
+        return (await llm.generate(
+            "Update the summary of a conversation between a patient and a medical assistant. Keep symptoms, "
+            f"durations, lab values, predictions and advice. At most {max_words} words.\n\n"
+            f"Current summary:\n{summary or '(empty)'}\n\nNew messages:\n{transcript}\n\nUpdated summary:"
+        )).strip()
+    return summarize
+
+
+class ConversationContext:
+    """Context state of one conversation"""
+
+    def __init__(self, conversation_id, summary="", summarized_messages=0, recent_messages=None, message_count=0):
+        self.conversation_id = conversation_id
+        self.summary = summary or ""
+        self.summarized_messages = summarized_messages  # Messages folded into the summary so far
+        self.recent_messages = list(recent_messages or [])
+        self.message_count = message_count
+        self.summarizing = False
+
+    def state(self):
+        """Columns persisted by ChatDatabase.save_turns"""
+        return {
+            'summary': self.summary,
+            'summarized_messages': self.summarized_messages,
+            'recent_messages': list(self.recent_messages),
+            'message_count': self.message_count,
+        }
+
+    def render(self):
+        """Context block for the LLM prompt"""
+        parts = []
+        if self.summary:
+            parts.append(f"Summary of earlier conversation ({self.summarized_messages} messages):\n{self.summary}")
+        if self.recent_messages:
+            parts.append("Recent messages:\n" + "\n".join(
+                f"{message['role']}: {message['content']}" for message in self.recent_messages))
+        return "\n\n".join(parts)
+
+
+class ContextManager:
+    """Loads, updates and caches ConversationContexts keyed by conversation_id
+
+    ``summarize(summary, messages) -> summary`` may be a plain or an async
+    function. Summarization runs once every ``summarize_batch`` messages, on
+    a batch of that size, so its cost does not grow with the conversation.
+
+    The memory cache assumes a conversation's turns are served by one
+    process (the async DB writer may not have stored the previous turn when
+    the next one arrives). Behind several workers without sticky sessions,
+    use ``cache_entries=0``.
+    """
+
+    def __init__(self, db=None, summarize=extractive_summary, window_messages=12, summarize_batch=8,
+                 cache_entries=1024):
+        self.db = db
+        self.summarize = summarize
+        self.window_messages = window_messages
+        self.summarize_batch = summarize_batch
+        self.cache_entries = cache_entries
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.db_loads = 0
+        self.bootstraps = 0
+        self.summaries = 0
+        self.summary_failures = 0
+
+    def _remember(self, context):
+        with self._lock:
+            self._cache[context.conversation_id] = context
+            self._cache.move_to_end(context.conversation_id)
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+
+    def load(self, conversation_id):
+        """Context of a conversation: from memory, else one database lookup, else empty"""
+        with self._lock:
+            context = self._cache.get(conversation_id)
+            if context is not None:
+                self._cache.move_to_end(conversation_id)
+                self.hits += 1
+                return context
+
+        context = None
+        if self.db is not None:
+            state = self.db.get_context(conversation_id)
+            if state is not None:
+                self.db_loads += 1
+                context = ConversationContext(conversation_id, state['summary'], state['summarized_messages'],
+                                              state['recent_messages'], state['message_count'])
+            else:
+                # Conversations from before context tracking: built once from the full message history. load() is
+                # synchronous, so messages older than the window are folded with the model-free extractive summary
+                history = [{'role': m['role'], 'content': m['content']}
+                           for m in self.db.get_conversation_history(conversation_id)]
+                if history:
+                    self.bootstraps += 1
+                    older, recent = history[:-self.window_messages], history[-self.window_messages:]
+                    context = ConversationContext(
+                        conversation_id, summary=extractive_summary("", older) if older else "",
+                        summarized_messages=len(older), recent_messages=recent, message_count=len(history))
+        context = context or ConversationContext(conversation_id)
+        self._remember(context)
+        return context
+
+    async def update(self, context, messages):
+        """Append a turn's messages; fold the oldest ones into the summary once the window overflows
+
+        A failing summarizer (e.g. an overloaded LLM) leaves the window
+        unfolded; the fold is retried on the next turn.
+        """
+        context.recent_messages.extend({'role': m['role'], 'content': m['content']} for m in messages)
+        context.message_count += len(messages)
+
+        overflow = len(context.recent_messages) - self.window_messages
+        # A concurrent turn of the same conversation already summarizing leaves the fold to the next turn
+        if overflow >= self.summarize_batch and not context.summarizing:
+            context.summarizing = True
+            try:
+                folded = context.recent_messages[:overflow]
+                summary = self.summarize(context.summary, folded)
+                if inspect.isawaitable(summary):
+                    summary = await summary
+            except Exception as e:
+                self.summary_failures += 1
+                print(f"✗ Could not summarize conversation {context.conversation_id}, retrying next turn: {e}")
+            else:
+                context.summary = summary
+                context.summarized_messages += len(folded)
+                del context.recent_messages[:len(folded)]
+                self.summaries += 1
+            finally:
+                context.summarizing = False
+        self._remember(context)
+        return context
+
+    def stats(self):
+        return {
+            'cached': len(self._cache),
+            'memory_hits': self.hits,
+            'db_loads': self.db_loads,
+            'bootstraps': self.bootstraps,
+            'summaries': self.summaries,
+            'summary_failures': self.summary_failures,
+        }
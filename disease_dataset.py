@@ -0,0 +1,81 @@
+"""The Merged_signals.ipynb training pipeline as reusable functions."""
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+from sklearn.impute import SimpleImputer
+from sklearn.preprocessing import MultiLabelBinarizer
+
+from feature_table import load_master_features
+
+NON_FEATURE_COLUMNS = ["hadm_id", "icd9_code", "image_path"]
+
+
+def latest_lab_values(ocr_data):
+    """Keep the latest value per lab label for every admission (Step 1)"""
+    lab_records = []
+    for record in ocr_data:
+        latest = {}
+        for res in record['lab_results']:
+            label, value, charttime = res['label'], res['value'], res['charttime']
+            if label not in latest or charttime > latest[label][1]:
+                latest[label] = (value, charttime)
+        row = {'hadm_id': record['hadm_id']}
+        for label, (value, _) in latest.items():
+            row[label] = value
+        lab_records.append(row)
+    return pd.DataFrame(lab_records)
+
+
+def encode_features(merged):
+    """Feature matrix before imputation: dummies, columns without any value dropped"""
+    X = merged.drop(columns=[c for c in NON_FEATURE_COLUMNS if c in merged.columns])
+    X = pd.get_dummies(X)
+    return X.dropna(axis=1, how='all')
+
+
+def imputer_means(merged):
+    """Per-feature means the training SimpleImputer fills missing values with, to encode new admissions alike"""
+    X = encode_features(merged)
+    return pd.Series(SimpleImputer(strategy="mean").fit(X).statistics_, index=X.columns)
+
+
+def build_training_data(signals_df, diagnoses_df, labs_df=None, min_label_count=30):
+    """Merge features with diagnoses and return (X_imputed, y, mlb, merged) (Steps 2-5)"""
+    merged = signals_df
+    if labs_df is not None:
+        merged = pd.merge(merged, labs_df, on="hadm_id", how="inner")
+    diagnoses_grouped = diagnoses_df.groupby("hadm_id")["icd9_code"].apply(list).reset_index()
+    merged = pd.merge(merged, diagnoses_grouped, on="hadm_id", how="inner")
+
+    # Keep ICD codes with at least min_label_count cases
+    label_counts = Counter(label for sublist in merged["icd9_code"] for label in sublist)
+    top_labels = {label for label, count in label_counts.items() if count >= min_label_count}
+    merged["icd9_code"] = merged["icd9_code"].apply(lambda codes: [c for c in codes if c in top_labels])
+    merged = merged[merged["icd9_code"].map(len) > 0].reset_index(drop=True)
+
+    X = encode_features(merged)
+    imputer = SimpleImputer(strategy="mean")
+    X_imputed = pd.DataFrame(imputer.fit_transform(X), columns=X.columns)
+
+    mlb = MultiLabelBinarizer()
+    y = mlb.fit_transform(merged["icd9_code"])
+
+    return X_imputed, y, mlb, merged
+
+
+def load_training_data(features_path="master_features.csv", diagnoses_path="DIAGNOSES_ICD.csv",
+                       min_label_count=30):
+    """Build the training matrix from the CSVs shipped with the repo"""
+    signals_df = load_master_features(features_path, images=False)
+    diagnoses_df = pd.read_csv(diagnoses_path, dtype={"icd9_code": str})
+    return build_training_data(signals_df, diagnoses_df, min_label_count=min_label_count)
+
+
+def threshold_predictions(probs_list, thresholds=0.3):
+    """Turn sklearn's per-label predict_proba list into a 0/1 matrix (Step 8)"""
+    thresholds = np.broadcast_to(np.asarray(thresholds, dtype=float), (len(probs_list),))
+    y_pred_bin = np.zeros((probs_list[0].shape[0], len(probs_list)), dtype=int)
+    for j, class_probs in enumerate(probs_list):
+        y_pred_bin[:, j] = (class_probs[:, 1] > thresholds[j]).astype(int)
+    return y_pred_bin
@@ -0,0 +1,199 @@
+"""Compact CPU inference artifacts for the ECG CNN-LSTM.
+
+``export_tflite`` freezes the trained Keras model into a TensorFlow Lite
+flatbuffer. Weights become constants and training-only ops are dropped. The
+weights can be post-training quantized:
+
+- 'float16': half-size weights, float32 compute, practically lossless
+- 'dynamic': int8 weights, activations quantized on the fly
+- 'int8':    full integer model calibrated on representative signals
+- None:      float32, only frozen
+
+``TFLiteModel`` runs an exported file with the same ``predict`` call as a
+Keras model. The model registry loads ``.tflite`` paths with it, so
+``ECGTester(model_path='ecg_disease_detector.tflite')`` serves without
+importing TensorFlow when ``tflite_runtime`` is installed.
+"""
+import os
+import time
+import threading
+
+import numpy as np
+
+QUANTIZATIONS = (None, 'float16', 'dynamic', 'int8')
+
+
+def _interpreter_class():
+    """The lightest TFLite interpreter available"""
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        try:
+            from ai_edge_litert.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+
+def inference_model(model, unroll=False):
+    """Rebuild a Sequential model for single-sample inference with the same weights
+
+    The converter can only lower the LSTMs to builtin ops with a static batch
+    size and without recurrent dropout (a no-op at inference anyway).
+    ``unroll`` replaces the LSTM loop by one set of ops per timestep, which
+    full-integer quantization requires.
+    """
+    import tensorflow as tf
+
+    config = model.get_config()
+    for layer in config['layers']:
+        # Keras 3 stores the input shape as batch_shape, Keras 2 (TF 2.15) as batch_input_shape
+        for key in ('batch_shape', 'batch_input_shape'):
+            if layer['config'].get(key) is not None:
+                layer['config'][key] = [1] + list(layer['config'][key][1:])
+        if layer['class_name'] == 'LSTM':
+            layer['config'].update(dropout=0.0, recurrent_dropout=0.0, unroll=unroll)
+    clone = tf.keras.Sequential.from_config(config)
+    clone.set_weights(model.get_weights())
+    return clone
+
+
+def export_tflite(model, output_path, quantization='float16', representative_data=None, calibration_samples=200):
+    """Convert a Keras model (or .h5/.keras path) into a TFLite file; returns its size in bytes
+
+    ``representative_data`` (scaled signals, shape (N, time_points, leads))
+    is required for 'int8' and calibrates the activation ranges.
+    """
+    import tensorflow as tf
+
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown quantization '{quantization}', expected one of {QUANTIZATIONS}")
+    if isinstance(model, (str, os.PathLike)):
+        model = tf.keras.models.load_model(model, compile=False)
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(inference_model(model, unroll=quantization == 'int8'))
+    if quantization is not None:
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantization == 'float16':
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantization == 'int8':
+        if representative_data is None:
+            raise ValueError("int8 quantization needs representative_data to calibrate activations")
+        samples = np.asarray(representative_data[:calibration_samples], dtype=np.float32)
+        converter.representative_dataset = lambda: ([sample[None]] for sample in samples)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+
+    flatbuffer = converter.convert()
+    with open(output_path, 'wb') as f:
+        f.write(flatbuffer)
+    print(f"✓ Exported {quantization or 'float32'} model to {output_path} ({len(flatbuffer) / 2**20:.2f} MB)")
+    return len(flatbuffer)
+
+
+class TFLiteModel:
+    """Keras-compatible ``predict`` over a TFLite file
+
+    Interpreters are not thread-safe, so each thread gets its own, all sharing
+    the same read-only model buffer. Batches run sample by sample; a TFLite
+    invoke costs microseconds on top of the compute.
+    """
+
+    def __init__(self, path, num_threads=1):
+        self.path = path
+        self.num_threads = num_threads
+        with open(path, 'rb') as f:
+            self.model_content = f.read()
+        self._interpreter_class = _interpreter_class()
+        self._local = threading.local()
+
+        interpreter = self._interpreter()
+        input_details = interpreter.get_input_details()[0]
+        output_details = interpreter.get_output_details()[0]
+        self.input_shape = tuple(input_details['shape'][1:])
+        self.input_dtype = input_details['dtype']
+        self.input_quantization = input_details['quantization']
+        self.output_dtype = output_details['dtype']
+        self.output_quantization = output_details['quantization']
+        self.size_bytes = len(self.model_content)
+
+    def _interpreter(self):
+        interpreter = getattr(self._local, 'interpreter', None)
+        if interpreter is None:
+            interpreter = self._interpreter_class(model_content=self.model_content, num_threads=self.num_threads)
+            interpreter.allocate_tensors()
+            self._local.interpreter = interpreter
+            self._local.input_index = interpreter.get_input_details()[0]['index']
+            self._local.output_index = interpreter.get_output_details()[0]['index']
+        return interpreter
+
+    def _quantize_input(self, x):
+        if self.input_dtype == np.float32:
+            return x.astype(np.float32, copy=False)
+        scale, zero_point = self.input_quantization
+        info = np.iinfo(self.input_dtype)
+        return np.clip(np.round(x / scale + zero_point), info.min, info.max).astype(self.input_dtype)
+
+    def _dequantize_output(self, y):
+        if self.output_dtype == np.float32:
+            return y
+        scale, zero_point = self.output_quantization
+        return (y.astype(np.float32) - zero_point) * scale
+
+    def predict(self, x, batch_size=None, verbose=0):
+        """Class probabilities for a (N, time_points, leads) batch"""
+        x = np.asarray(x)
+        if x.ndim == len(self.input_shape):
+            x = x[None]
+        interpreter = self._interpreter()
+        input_index, output_index = self._local.input_index, self._local.output_index
+
+        x = self._quantize_input(x)
+        outputs = []
+        for sample in x:
+            interpreter.set_tensor(input_index, sample[None])
+            interpreter.invoke()
+            outputs.append(interpreter.get_tensor(output_index)[0])
+        return self._dequantize_output(np.stack(outputs))
+
+    __call__ = predict
+
+
+def parity_report(reference, candidates, X, y=None):
+    """Compare candidate models with the reference on a held-out split
+
+    ``reference`` and ``candidates`` (name -> model) only need ``predict``;
+    ``y`` holds encoded class indices. Returns one dict per model with
+    accuracy, top-1 agreement with the reference, max/mean absolute
+    probability difference and ms/sample, and prints them as a table.
+    """
+    def run(model):
+        start = time.perf_counter()
+        probs = model.predict(X, batch_size=len(X), verbose=0)
+        return probs, (time.perf_counter() - start) * 1000 / len(X)
+
+    reference_probs, reference_ms = run(reference)
+    reference_labels = reference_probs.argmax(axis=1)
+    rows = []
+    for name, model in [('keras', reference)] + list(candidates.items()):
+        probs, ms = (reference_probs, reference_ms) if model is reference else run(model)
+        labels = probs.argmax(axis=1)
+        diff = np.abs(probs - reference_probs)
+        rows.append({
+            'name': name,
+            'accuracy': float((labels == y).mean()) if y is not None else None,
+            'agreement': float((labels == reference_labels).mean()),
+            'max_prob_diff': float(diff.max()),
+            'mean_prob_diff': float(diff.mean()),
+            'ms_per_sample': ms,
+        })
+
+    print(f"Parity on {len(X)} held-out signals")
+    print(f"{'MODEL':<12} {'ACCURACY':>9} {'AGREEMENT':>10} {'MAX DIFF':>9} {'MEAN DIFF':>10} {'MS/SAMPLE':>10}")
+    for row in rows:
+        accuracy = f"{row['accuracy']:.1%}" if row['accuracy'] is not None else "n/a"
+        print(f"{row['name']:<12} {accuracy:>9} {row['agreement']:>10.1%} {row['max_prob_diff']:>9.4f} "
+              f"{row['mean_prob_diff']:>10.5f} {row['ms_per_sample']:>10.2f}")
+    return rows
@@ -0,0 +1,240 @@
+"""Parallel WFDB loader with a memory-mapped signal cache for PTB-XL records."""
+import os
+import json
+import time
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import wfdb
+from scipy.signal import resample_poly
+
+DEFAULT_CACHE_DIR = "ecg_cache"
+
+# Memory-mapped caches already opened by this process, keyed by index file path
+_open_caches = {}
+
+
+def cache_key(data_path, sampling_rate, signal_length):
+    """Return the cache file stem for a dataset path, sampling rate and signal length"""
+    raw = f"{os.path.abspath(data_path)}|{sampling_rate}|{signal_length}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def cache_paths(data_path, sampling_rate, signal_length, cache_dir=DEFAULT_CACHE_DIR):
+    """Return the (.npy signals, .json index) paths of a dataset cache
+
+    Each build writes its signals to a new ``<stem>.<version>.npy`` named in
+    the index; the unversioned signals path is only read for older indexes.
+    """
+    stem = os.path.join(cache_dir, f"signals_{cache_key(data_path, sampling_rate, signal_length)}")
+    return stem + ".npy", stem + ".json"
+
+
+def fit_signal(signal, signal_length, n_leads=12):
+    """Trim or zero-pad a (samples, leads) signal to (signal_length, n_leads) float32"""
+    fitted = np.zeros((signal_length, n_leads), dtype=np.float32)
+    n_samples = min(len(signal), signal_length)
+    n_channels = min(signal.shape[1], n_leads)
+    fitted[:n_samples, :n_channels] = signal[:n_samples, :n_channels]
+    return fitted
+
+
+def read_record(task):
+    """Read and resample one WFDB record (process pool worker)"""
+    file_path, sampling_rate, signal_length, n_leads = task
+    try:
+        record = wfdb.rdrecord(file_path)
+        signal = record.p_signal
+
+        # Anti-aliased resampling instead of plain decimation (e.g. 500Hz -> 100Hz)
+        if record.fs != sampling_rate:
+            signal = resample_poly(signal, sampling_rate, int(record.fs), axis=0)
+
+        return fit_signal(np.nan_to_num(signal), signal_length, n_leads)
+    except Exception:
+        return None
+
+
+def resolve_record_paths(data_path, record_ids):
+    """Map record ids to WFDB paths, preferring records100 over records500
+
+    Each folder is listed once instead of calling os.path.exists per record.
+    """
+    available = {}
+    for folder in ['records500', 'records100']:
+        folder_path = os.path.join(data_path, folder)
+        if not os.path.isdir(folder_path):
+            continue
+        for name in os.listdir(folder_path):
+            if name.endswith('.dat'):
+                available[name[:-4]] = os.path.join(folder_path, name[:-4])
+
+    return [available.get(str(record_id).zfill(5)) for record_id in record_ids]
+
+
+def open_cache(data_path, sampling_rate, signal_length, cache_dir=DEFAULT_CACHE_DIR):
+    """Open an existing cache read-only, returning (signals memmap, index) or None"""
+    signals_path, index_path = cache_paths(data_path, sampling_rate, signal_length, cache_dir)
+    if not os.path.exists(index_path):
+        return None
+
+    mtime = os.path.getmtime(index_path)
+    cached = _open_caches.get(index_path)
+    if cached is None or cached[0] != mtime:
+        with open(index_path, 'r') as f:
+            index = json.load(f)
+        if 'signals_file' in index:
+            signals_path = os.path.join(cache_dir, index['signals_file'])
+        if not os.path.exists(signals_path):
+            return None
+        index['rows'] = {record_id: row for row, record_id in enumerate(index['record_ids'])}
+        cached = (mtime, np.load(signals_path, mmap_mode='r'), index)
+        _open_caches[index_path] = cached
+
+    return cached[1], cached[2]
+
+
+def build_cache(data_path, record_ids, sampling_rate=100, signal_length=1000, n_leads=12,
+                cache_dir=DEFAULT_CACHE_DIR, num_workers=None, chunksize=64, previous=None):
+    """Load records on a process pool straight into a memory-mapped .npy cache
+
+    Records already present in ``previous`` (an open (signals, index) cache) are
+    copied across instead of being parsed again.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    signals_path, index_path = cache_paths(data_path, sampling_rate, signal_length, cache_dir)
+    record_ids = [str(record_id).zfill(5) for record_id in record_ids]
+    file_paths = resolve_record_paths(data_path, record_ids)
+
+    # Write into a new versioned file rather than over the old one: callers may still
+    # hold memmaps of it, and Windows refuses to replace a mapped file
+    new_signals_path = f"{signals_path[:-len('.npy')]}.{time.time_ns():x}.npy"
+    signals = np.lib.format.open_memmap(
+        new_signals_path, mode='w+', dtype=np.float32, shape=(len(record_ids), signal_length, n_leads)
+    )
+    loaded = np.zeros(len(record_ids), dtype=bool)
+
+    if previous is not None:
+        old_signals, old_index = previous
+        for row, record_id in enumerate(record_ids):
+            old_row = old_index['rows'].get(record_id)
+            if old_row is not None and old_index['loaded'][old_row]:
+                signals[row] = old_signals[old_row]
+                loaded[row] = True
+        del old_signals, previous
+        _open_caches.pop(index_path, None)
+
+    rows = [row for row, path in enumerate(file_paths) if path is not None and not loaded[row]]
+    tasks = [(file_paths[row], sampling_rate, signal_length, n_leads) for row in rows]
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        for row, signal in zip(rows, executor.map(read_record, tasks, chunksize=chunksize)):
+            if signal is not None:
+                signals[row] = signal
+                loaded[row] = True
+
+    signals.flush()
+    del signals
+
+    index = {
+        'signals_file': os.path.basename(new_signals_path),
+        'data_path': os.path.abspath(data_path),
+        'sampling_rate': sampling_rate,
+        'signal_length': signal_length,
+        'n_leads': n_leads,
+        'record_ids': record_ids,
+        'loaded': loaded.tolist()
+    }
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp_path, index_path)
+    remove_old_signals(signals_path, new_signals_path)
+
+    return open_cache(data_path, sampling_rate, signal_length, cache_dir)
+
+
+def remove_old_signals(signals_path, current_path):
+    """Delete earlier signal files of a cache; ones still mapped somewhere are left for the next build"""
+    cache_dir = os.path.dirname(signals_path) or "."
+    prefix = os.path.basename(signals_path)[:-len(".npy")]
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name.startswith(prefix) and name.endswith(".npy") and path != current_path:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def load_signal_rows(data_path, record_ids, sampling_rate=100, signal_length=1000, n_leads=12,
+                     cache_dir=DEFAULT_CACHE_DIR, num_workers=None):
+    """Return (signals memmap, rows, loaded record ids) for the requested records
+
+    ``signals`` is the whole memory-mapped cache and ``rows`` the positions of
+    the successfully loaded records in it. The cache is (re)built on a process
+    pool the first time a record is requested that it does not contain.
+    """
+    record_ids = [str(record_id).zfill(5) for record_id in record_ids]
+    cached = open_cache(data_path, sampling_rate, signal_length, cache_dir)
+
+    if cached is None or any(record_id not in cached[1]['rows'] for record_id in record_ids):
+        if cached is not None:
+            # Keep previously cached records so the cache only ever grows
+            record_ids_all = list(dict.fromkeys(cached[1]['record_ids'] + record_ids))
+        else:
+            record_ids_all = record_ids
+        print(f"Building signal cache for {len(record_ids_all)} records...")
+        cached = build_cache(data_path, record_ids_all, sampling_rate, signal_length, n_leads,
+                             cache_dir, num_workers, previous=cached)
+
+    signals, index = cached
+    rows = [index['rows'][record_id] for record_id in record_ids]
+    rows = np.array([row for row in rows if index['loaded'][row]], dtype=np.int64)
+    loaded_ids = [index['record_ids'][row] for row in rows]
+
+    return signals, rows, loaded_ids
+
+
+def load_signals(data_path, record_ids, sampling_rate=100, signal_length=1000, n_leads=12,
+                 cache_dir=DEFAULT_CACHE_DIR, num_workers=None):
+    """Return (signals, loaded record ids) for the requested records"""
+    signals, rows, loaded_ids = load_signal_rows(data_path, record_ids, sampling_rate, signal_length,
+                                                 n_leads, cache_dir, num_workers)
+
+    # Whole-cache requests stay memory-mapped; subsets are gathered into memory
+    if np.array_equal(rows, np.arange(len(signals))):
+        return signals, loaded_ids
+    return signals[rows], loaded_ids
+
+
+def scale_signals(scaler, signals):
+    """Apply a fitted StandardScaler to a (N, time_points, leads) batch
+
+    Scalers fitted per lead (as streaming training does) are applied across
+    time; older scalers keep the per-record (leads, time_points) orientation
+    used by preprocess_signals.
+    """
+    n_records, n_samples, n_leads = signals.shape
+    if getattr(scaler, 'n_features_in_', None) == n_leads:
+        return scaler.transform(signals.reshape(-1, n_leads)).reshape(signals.shape)
+
+    stacked = signals.transpose(0, 2, 1).reshape(-1, n_samples)
+    scaled = scaler.transform(stacked)
+    return scaled.reshape(n_records, n_leads, n_samples).transpose(0, 2, 1)
+
+
+def load_cached_record(file_path, sampling_rate=100, signal_length=1000, cache_dir=DEFAULT_CACHE_DIR):
+    """Look up a single <data_path>/recordsXXX/<id> record in the cache, or return None"""
+    record_id = os.path.basename(file_path)
+    data_path = os.path.dirname(os.path.dirname(os.path.abspath(file_path)))
+
+    cached = open_cache(data_path, sampling_rate, signal_length, cache_dir)
+    if cached is None:
+        return None
+
+    signals, index = cached
+    row = index['rows'].get(record_id)
+    if row is None or not index['loaded'][row]:
+        return None
+    return np.array(signals[row])
@@ -0,0 +1,461 @@
+"""Real-time ECG monitoring: per-patient sample streams, sliding-window inference and alerts.
+
+Bedside devices push small chunks of multi-lead samples (e.g. 40 ms at a
+time). Each patient gets a PatientStream:
+
+- a ring buffer holding the last ``window_seconds`` of samples at the model's
+  100 Hz, so a window is never re-assembled from the whole recording;
+- causal filters whose state is carried from chunk to chunk (anti-aliasing
+  before decimating faster streams, a 0.5-40 Hz band-pass for peak tracking),
+  so chunked filtering gives the same output as filtering the whole stream;
+- an RPeakTracker that finds new R-peaks in each chunk and keeps a running
+  heart rate and RR irregularity.
+
+Every ``stride_seconds`` of signal the latest window (overlapping the
+previous one) is scaled and submitted to a MicroBatcher shared by all
+patients, so windows that come due together across patients are scored in
+one predict call. Urgent classes (MI, AFIB, ...) and heart rates outside the
+configured limits raise alerts, which are pushed to subscribers.
+"""
+import time
+import threading
+from collections import deque
+
+import numpy as np
+from scipy.ndimage import maximum_filter1d
+from scipy.signal import butter, sosfilt, sosfilt_zi
+
+from ecg_features import N_LEADS, REFERENCE_LEAD
+from ecg_loader import scale_signals
+from micro_batching import MicroBatcher
+
+MODEL_RATE = 100  # Hz, the rate the ECG model was trained on
+DEFAULT_URGENT_CLASSES = ('MI', 'AFIB', 'AFLT')
+
+
+class RPeakTracker:
+    """Incremental R-peak detection on one band-passed lead
+
+    A sample is a peak when it is the maximum within +/- ``min_distance``
+    seconds, rises above the previous sample and exceeds half of a running
+    peak amplitude, as detect_r_peaks does for whole records. The last
+    ``min_distance`` seconds of each chunk wait for the next chunk before
+    they can be confirmed, so peaks are reported with that much delay.
+    """
+
+    def __init__(self, sampling_rate=MODEL_RATE, min_distance=0.3, history=16):
+        self.sampling_rate = sampling_rate
+        self.distance = max(1, int(round(min_distance * sampling_rate)))
+        self._tail = np.zeros(0, dtype=np.float32)
+        self._tail_start = 0       # Stream index of _tail[0]
+        self._checked_until = 1    # Stream indices below this have been decided
+        self.peak_level = None
+        self.last_peak = None
+        self.rr = deque(maxlen=history)  # seconds
+        self.n_peaks = 0
+
+    def update(self, samples):
+        """Feed the next filtered samples; returns stream indices of newly confirmed peaks"""
+        x = np.concatenate([self._tail, np.asarray(samples, dtype=np.float32)])
+        start = self._tail_start
+        if self.peak_level is None:
+            # Wait for two seconds of signal to set the first amplitude estimate
+            if len(x) < 2 * self.sampling_rate:
+                self._tail = x
+                return []
+            self.peak_level = float(np.percentile(x, 99))
+
+        d = self.distance
+        local_max = maximum_filter1d(x, size=2 * d + 1, mode='nearest')
+        candidates = (x == local_max)
+        candidates[1:] &= x[1:] > x[:-1]
+        candidates[0] = False
+        candidates[len(x) - d:] = False  # No right-hand context yet
+        candidates[:max(0, self._checked_until - start)] = False
+
+        peaks = []
+        for i in np.flatnonzero(candidates):
+            index = start + int(i)
+            if x[i] < 0.5 * self.peak_level:
+                continue
+            if self.last_peak is not None:
+                if index - self.last_peak < d:
+                    continue
+                self.rr.append((index - self.last_peak) / self.sampling_rate)
+            self.peak_level = 0.875 * self.peak_level + 0.125 * float(x[i])
+            self.last_peak = index
+            self.n_peaks += 1
+            peaks.append(index)
+
+        end = start + len(x)
+        self._checked_until = max(self._checked_until, end - d)
+        # Let the threshold recover after a drop in amplitude (lead moved, gain changed): halve it per 2 s without beats
+        if self.last_peak is None or end - self.last_peak > 2 * self.sampling_rate:
+            self.peak_level *= 0.5 ** (len(samples) / (2 * self.sampling_rate))
+        keep = min(len(x), 2 * d + 1)
+        self._tail = x[len(x) - keep:]
+        self._tail_start = end - keep
+        return peaks
+
+    @property
+    def heart_rate(self):
+        """BPM from the median of the last 5 RR intervals, so it follows rate changes within a few beats"""
+        if not self.rr:
+            return float('nan')
+        return 60.0 / float(np.median(list(self.rr)[-5:]))
+
+    @property
+    def irregularity(self):
+        """RR std / mean over recent beats (like ecg_features' regularity), NaN before three peaks"""
+        if len(self.rr) < 2:
+            return float('nan')
+        rr = np.array(self.rr)
+        return float(rr.std() / rr.mean())
+
+
+class PatientStream:
+    """Ring buffer, filter state and R-peak tracking for one patient's stream"""
+
+    def __init__(self, patient_id, sampling_rate=MODEL_RATE, window_seconds=10.0, stride_seconds=2.5,
+                 n_leads=N_LEADS, lead=REFERENCE_LEAD, band=(0.5, 40.0)):
+        if sampling_rate % MODEL_RATE:
+            raise ValueError(f"sampling rate must be a multiple of {MODEL_RATE} Hz, got {sampling_rate}")
+        self.patient_id = patient_id
+        self.sampling_rate = sampling_rate
+        self.decimation = sampling_rate // MODEL_RATE
+        self.n_leads = n_leads
+        self.lead = lead
+        self.window = int(round(window_seconds * MODEL_RATE))
+        self.stride = max(1, int(round(stride_seconds * MODEL_RATE)))
+
+        self._buffer = np.zeros((2 * self.window, n_leads), dtype=np.float32)
+        self.n_samples = 0  # Samples written at MODEL_RATE
+        self.next_window_end = self.window
+        self._phase = 0     # Input samples to skip before the next kept one when decimating
+
+        # Anti-aliasing low-pass applied before keeping every decimation-th sample
+        self._aa_sos = butter(4, 0.8 * MODEL_RATE / 2, fs=sampling_rate, output='sos') if self.decimation > 1 else None
+        self._aa_zi = None
+        self._band_sos = butter(2, band, btype='bandpass', fs=MODEL_RATE, output='sos')
+        self._band_zi = None
+        self.tracker = RPeakTracker(MODEL_RATE)
+
+        self.lock = threading.Lock()
+        self.chunks = 0
+        self.windows = 0
+        self.streaks = {}        # Consecutive windows each urgent class was predicted in
+        self.last_alerts = {}    # Alert code -> stream seconds of its last alert
+        self.last_prediction = None
+        self.last_chunk_time = None
+
+    @property
+    def stream_seconds(self):
+        return self.n_samples / MODEL_RATE
+
+    def _decimate(self, chunk):
+        if self._aa_sos is None:
+            return chunk
+        if self._aa_zi is None:
+            self._aa_zi = sosfilt_zi(self._aa_sos)[:, :, None] * chunk[0][None, None, :]
+        filtered, self._aa_zi = sosfilt(self._aa_sos, chunk, axis=0, zi=self._aa_zi)
+        kept = filtered[self._phase::self.decimation]
+        self._phase = (self._phase - len(chunk)) % self.decimation
+        return kept
+
+    def _write(self, samples):
+        capacity = len(self._buffer)
+        skipped = max(0, len(samples) - capacity)
+        samples = samples[skipped:]
+        positions = (self.n_samples + skipped + np.arange(len(samples))) % capacity
+        self._buffer[positions] = samples
+
+    def window_at(self, end):
+        """The (window, leads) samples ending at stream index ``end`` (must still be in the buffer)"""
+        positions = np.arange(end - self.window, end) % len(self._buffer)
+        return self._buffer[positions]
+
+    def ingest(self, chunk):
+        """Append a (samples, leads) chunk; returns (new R-peak indices, [(end index, window), ...])"""
+        chunk = np.asarray(chunk, dtype=np.float32)
+        if chunk.ndim != 2 or chunk.shape[1] != self.n_leads:
+            raise ValueError(f"expected a (samples, {self.n_leads}) chunk, got {chunk.shape}")
+        samples = self._decimate(chunk)
+        if not len(samples):
+            return [], []
+
+        self._write(samples)
+        self.n_samples += len(samples)
+        self.chunks += 1
+
+        lead = samples[:, self.lead]
+        if self._band_zi is None:
+            self._band_zi = sosfilt_zi(self._band_sos) * lead[0]
+        filtered, self._band_zi = sosfilt(self._band_sos, lead, zi=self._band_zi)
+        peaks = self.tracker.update(filtered)
+
+        # Windows that fell out of the ring buffer (a very large chunk) are skipped
+        oldest_end = self.n_samples - len(self._buffer) + self.window
+        if self.next_window_end < oldest_end:
+            self.next_window_end += -(-(oldest_end - self.next_window_end) // self.stride) * self.stride
+        windows = []
+        while self.next_window_end <= self.n_samples:
+            windows.append((self.next_window_end, self.window_at(self.next_window_end)))
+            self.next_window_end += self.stride
+        self.windows += len(windows)
+        return peaks, windows
+
+
+class ECGMonitor:
+    """Streams of many patients scored by one model through a shared MicroBatcher
+
+    ``predict_batch`` maps a scaled (N, 1000, 12) batch to class
+    probabilities, in the order of ``class_names``. An alert is raised when an
+    ``urgent_classes`` probability reaches ``alert_threshold`` in
+    ``confirm_windows`` consecutive windows, or when the tracked heart rate
+    leaves ``heart_rate_limits`` (BRADY / TACHY); the same code is not
+    repeated for a patient within ``alert_cooldown`` seconds of signal.
+
+    Alerts are dicts passed to every ``subscribe``d callback, on the thread
+    that produced them (the batcher thread for model alerts). ``latency_ms``
+    runs from the arrival of the chunk that completed the window to the alert.
+    """
+
+    def __init__(self, predict_batch, class_names, scaler=None, window_seconds=10.0, stride_seconds=2.5,
+                 urgent_classes=DEFAULT_URGENT_CLASSES, alert_threshold=0.5, confirm_windows=1,
+                 heart_rate_limits=(40, 150), alert_cooldown=30.0, n_leads=N_LEADS, lead=REFERENCE_LEAD,
+                 max_batch_size=32, max_wait_ms=20.0):
+        self.class_names = list(class_names)
+        self.scaler = scaler
+        self.window_seconds = window_seconds
+        self.stride_seconds = stride_seconds
+        self.urgent = [(self.class_names.index(code), code) for code in urgent_classes if code in self.class_names]
+        self.alert_threshold = alert_threshold
+        self.confirm_windows = confirm_windows
+        self.heart_rate_limits = heart_rate_limits
+        self.alert_cooldown = alert_cooldown
+        self.n_leads = n_leads
+        self.lead = lead
+        self.batcher = MicroBatcher(predict_batch, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms,
+                                    name="ecg-monitor")
+        self.patients = {}
+        self.alerts = deque(maxlen=1000)
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+        self.chunks = 0
+        self.windows = 0
+        self.failures = 0
+        self._latencies = deque(maxlen=10000)  # seconds from window-completing chunk to prediction
+
+    @classmethod
+    def from_tester(cls, tester, **kwargs):
+        """Monitor scoring with an ECGTester's model, scaler and label encoder"""
+        if tester.label_encoder is not None:
+            class_names = list(tester.label_encoder.classes_)
+        else:
+            class_names = [f"CLASS_{i}" for i in range(tester.model.output_shape[-1])]
+        scaler = tester.scaler if hasattr(tester.scaler, 'mean_') else None  # Unfitted fallback scaler
+        return cls(tester.predict_batch, class_names, scaler=scaler, **kwargs)
+
+    def subscribe(self, callback):
+        """Call ``callback(alert)`` for every alert; returns the callback for unsubscribe"""
+        with self._lock:
+            self._subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def open(self, patient_id, sampling_rate=MODEL_RATE):
+        """Start (or restart) a patient's stream"""
+        stream = PatientStream(patient_id, sampling_rate, self.window_seconds, self.stride_seconds,
+                               self.n_leads, self.lead)
+        with self._lock:
+            self.patients[patient_id] = stream
+        return stream
+
+    def close(self, patient_id):
+        with self._lock:
+            return self.patients.pop(patient_id, None) is not None
+
+    def ingest(self, patient_id, samples, sampling_rate=None):
+        """Append a (samples, leads) chunk to a patient's stream (opened on first use)
+
+        Returns the number of windows submitted for inference. Chunks of one
+        patient must arrive in order; different patients may ingest from
+        different threads.
+        """
+        arrival = time.perf_counter()
+        stream = self.patients.get(patient_id)
+        if stream is None or (sampling_rate is not None and sampling_rate != stream.sampling_rate):
+            stream = self.open(patient_id, sampling_rate or MODEL_RATE)
+
+        with stream.lock:
+            peaks, windows = stream.ingest(samples)
+            stream.last_chunk_time = time.time()
+            if peaks and self.heart_rate_limits is not None:
+                self._check_heart_rate(stream, arrival)
+
+        self.chunks += 1
+        if windows:
+            ends, batch = zip(*windows)
+            batch = np.stack(batch)
+            if self.scaler is not None:
+                batch = scale_signals(self.scaler, batch).astype(np.float32)
+            for end, window in zip(ends, batch):
+                future = self.batcher.submit(window)
+                future.add_done_callback(
+                    lambda future, end=end: self._on_prediction(stream, end, arrival, future))
+            self.windows += len(windows)
+        return len(windows)
+
+    def _check_heart_rate(self, stream, arrival):
+        heart_rate = stream.tracker.heart_rate
+        low, high = self.heart_rate_limits
+        if len(stream.tracker.rr) < 4 or low <= heart_rate <= high:
+            return
+        code = 'BRADY' if heart_rate < low else 'TACHY'
+        self._alert(stream, code, 'rhythm', stream.n_samples, arrival, heart_rate=round(heart_rate, 1))
+
+    def _on_prediction(self, stream, end, arrival, future):
+        try:
+            probs = np.asarray(future.result())
+        except Exception as e:
+            self.failures += 1
+            print(f"✗ Monitor inference failed for {stream.patient_id}: {e}")
+            return
+        self._latencies.append(time.perf_counter() - arrival)
+
+        predicted = int(np.argmax(probs))
+        with stream.lock:
+            stream.last_prediction = {
+                'code': self.class_names[predicted],
+                'probability': float(probs[predicted]),
+                'stream_time': end / MODEL_RATE,
+            }
+            for index, code in self.urgent:
+                if probs[index] >= self.alert_threshold:
+                    stream.streaks[code] = stream.streaks.get(code, 0) + 1
+                    if stream.streaks[code] >= self.confirm_windows:
+                        self._alert(stream, code, 'model', end, arrival, probability=float(probs[index]))
+                else:
+                    stream.streaks[code] = 0
+
+    def _alert(self, stream, code, source, end, arrival, **details):
+        """Raise an alert unless the same code fired for this patient within the cooldown (stream lock held)"""
+        stream_time = end / MODEL_RATE
+        last = stream.last_alerts.get(code)
+        if last is not None and stream_time - last < self.alert_cooldown:
+            return
+        stream.last_alerts[code] = stream_time
+
+        alert = {
+            'patient_id': stream.patient_id,
+            'code': code,
+            'source': source,
+            'stream_time': stream_time,
+            'time': time.time(),
+            'latency_ms': (time.perf_counter() - arrival) * 1000,
+            **details,
+        }
+        self.alerts.append(alert)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(alert)
+            except Exception as e:
+                print(f"✗ Alert subscriber failed: {e}")
+
+    def status(self, patient_id):
+        """Current heart rate, irregularity (None until enough beats) and latest prediction of a patient, or None"""
+        stream = self.patients.get(patient_id)
+        if stream is None:
+            return None
+        with stream.lock:
+            heart_rate, irregularity = stream.tracker.heart_rate, stream.tracker.irregularity
+            return {
+                'patient_id': patient_id,
+                'sampling_rate': stream.sampling_rate,
+                'stream_seconds': stream.stream_seconds,
+                'heart_rate': None if np.isnan(heart_rate) else heart_rate,
+                'irregularity': None if np.isnan(irregularity) else irregularity,
+                'r_peaks': stream.tracker.n_peaks,
+                'windows': stream.windows,
+                'last_prediction': stream.last_prediction,
+                'last_alerts': dict(stream.last_alerts),
+                'last_chunk_time': stream.last_chunk_time,
+            }
+
+    def stats(self):
+        latencies = np.array(self._latencies) * 1000 if self._latencies else np.zeros(1)
+        return {
+            'patients': len(self.patients),
+            'chunks': self.chunks,
+            'windows': self.windows,
+            'alerts': len(self.alerts),
+            'failures': self.failures,
+            'window_latency_p50_ms': float(np.percentile(latencies, 50)),
+            'window_latency_p99_ms': float(np.percentile(latencies, 99)),
+            'batcher': self.batcher.stats(),
+        }
+
+
+def add_monitor_routes(app, monitor):
+    """Streaming ingestion and alert routes on a FastAPI app
+
+    - POST /monitor/{patient_id}/samples  {"samples": [[lead values] * n], "sampling_rate": 500}
+    - GET /monitor/{patient_id}           status
+    - DELETE /monitor/{patient_id}        end the stream
+    - GET /monitor/alerts                 server-sent events, one 'alert' event per alert
+    """
+    import asyncio
+    from fastapi import HTTPException, Request
+    from fastapi.responses import StreamingResponse
+    from chat_pipeline import sse_event
+
+    @app.post("/monitor/{patient_id}/samples")
+    async def ingest(patient_id: str, request: Request):
+        body = await request.json()
+        try:
+            windows = monitor.ingest(patient_id, np.asarray(body['samples'], dtype=np.float32),
+                                     body.get('sampling_rate'))
+        except (KeyError, ValueError) as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        return {'windows': windows, 'stream_seconds': monitor.patients[patient_id].stream_seconds}
+
+    @app.get("/monitor/alerts")
+    async def alerts(request: Request):
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=1000)
+
+        def push(alert):
+            loop.call_soon_threadsafe(lambda: queue.full() or queue.put_nowait(alert))
+
+        async def events():
+            monitor.subscribe(push)
+            try:
+                while True:
+                    yield sse_event('alert', await queue.get())
+            finally:
+                monitor.unsubscribe(push)
+
+        return StreamingResponse(events(), media_type="text/event-stream",
+                                 headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    @app.get("/monitor/{patient_id}")
+    async def status(patient_id: str):
+        status = monitor.status(patient_id)
+        if status is None:
+            raise HTTPException(status_code=404, detail=f"no stream for patient {patient_id}")
+        return status
+
+    @app.delete("/monitor/{patient_id}")
+    async def close(patient_id: str):
+        if not monitor.close(patient_id):
+            raise HTTPException(status_code=404, detail=f"no stream for patient {patient_id}")
+        return {'closed': patient_id}
+
+    return app
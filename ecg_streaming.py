@@ -0,0 +1,53 @@
+"""Out-of-core training input for the ECG CNN-LSTM.
+
+Signals are read batch by batch from the memory-mapped store built by
+ecg_loader, so peak memory is bounded by the batch size rather than the
+dataset size.
+"""
+import numpy as np
+import tensorflow as tf
+from sklearn.preprocessing import StandardScaler
+
+from ecg_loader import scale_signals
+
+
+def fit_scaler_streaming(signals, rows, scaler=None, chunk_size=256):
+    """Learn per-lead scaler statistics in a single pass over chunks of the store"""
+    scaler = scaler or StandardScaler()
+    rows = np.sort(rows)
+
+    for start in range(0, len(rows), chunk_size):
+        chunk = np.asarray(signals[rows[start:start + chunk_size]], dtype=np.float32)
+        scaler.partial_fit(chunk.reshape(-1, chunk.shape[-1]))
+
+    return scaler
+
+
+def make_dataset(signals, rows, labels, scaler, batch_size=32, shuffle=True, prefetch=2, seed=42):
+    """Build a prefetching tf.data pipeline of scaled batches from a memory-mapped store
+
+    ``rows`` index into ``signals`` and ``labels`` holds the encoded label of
+    each row, in the same order. Batches are reshuffled every epoch.
+    """
+    rows = np.asarray(rows)
+    labels = np.asarray(labels, dtype=np.int64)
+    n_samples, n_leads = signals.shape[1], signals.shape[2]
+    rng = np.random.default_rng(seed)
+
+    def generator():
+        order = rng.permutation(len(rows)) if shuffle else np.arange(len(rows))
+        for start in range(0, len(order), batch_size):
+            # Read each batch in ascending row order so memmap access stays sequential
+            positions = order[start:start + batch_size]
+            positions = positions[np.argsort(rows[positions])]
+            batch = np.asarray(signals[rows[positions]], dtype=np.float32)
+            yield scale_signals(scaler, batch), labels[positions]
+
+    dataset = tf.data.Dataset.from_generator(
+        generator,
+        output_signature=(
+            tf.TensorSpec(shape=(None, n_samples, n_leads), dtype=tf.float32),
+            tf.TensorSpec(shape=(None,), dtype=tf.int64)
+        )
+    )
+    return dataset.prefetch(prefetch)
@@ -0,0 +1,306 @@
+"""Cached, batched text embeddings for symptom text and knowledge-index queries.
+
+Texts are normalized (Unicode NFKC, case-folded, whitespace collapsed,
+surrounding punctuation stripped) so that near-identical phrasings share one
+embedding. Lookups go through a memory LRU tier and then a persistent disk
+tier, both keyed by a hash of the normalized text and the model version and
+stored as float16. Only misses reach the encoder, through a MicroBatcher that
+coalesces misses from concurrent requests into one forward pass.
+
+An EmbeddingService is a drop-in encoder: ``service(texts)`` returns an
+(n, dim) float32 array like the wrapped encoder (rounded through float16),
+so it can be passed anywhere an encoder is expected, e.g.
+``KnowledgeIndex(encoder=service)``. The model registry's knowledge index
+uses ``get_service()``.
+"""
+import os
+import re
+import time
+import asyncio
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict, deque
+
+import numpy as np
+
+from micro_batching import MicroBatcher
+
+DEFAULT_MODEL = "all-MiniLM-L6-v2"
+
+_WHITESPACE = re.compile(r"\s+")
+_EDGE_PUNCTUATION = " \t\n.,;:!?\"'()[]{}"
+
+
+def normalize_text(text):
+    """Canonical form of a phrase for cache lookups (and for encoding)"""
+    text = unicodedata.normalize('NFKC', text).casefold()
+    return _WHITESPACE.sub(" ", text).strip(_EDGE_PUNCTUATION)
+
+
+def cache_key(normalized_text, model_version):
+    """16-byte digest of the model version and normalized text"""
+    return hashlib.sha256(f"{model_version}\0{normalized_text}".encode('utf-8')).digest()[:16]
+
+
+class DiskEmbeddingCache:
+    """Append-only file of fixed-size (key, float16 vector) records
+
+    Every process appends whole records with a single O_APPEND write and
+    memory-maps the file for reads, so several workers share one cache.
+    Records appended by other processes are picked up by ``refresh``.
+    """
+
+    def __init__(self, path, dim):
+        self.path = path
+        self.dim = dim
+        self.dtype = np.dtype([('key', 'S16'), ('vector', '<f2', (dim,))])
+        self._rows = {}
+        self._records = None
+        self._size = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if os.path.exists(path):
+            size = os.path.getsize(path)
+            if size % self.dtype.itemsize:
+                # A writer died mid-record; drop the partial tail so appends stay aligned
+                os.truncate(path, size - size % self.dtype.itemsize)
+        self.refresh()
+
+    def refresh(self):
+        """Index records appended since the last call"""
+        with self._lock:
+            size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+            if size == self._size:
+                return
+            n_records = size // self.dtype.itemsize
+            records = np.memmap(self.path, dtype=self.dtype, mode='r', shape=(n_records,))
+            start = len(self._rows)
+            self._rows.update(zip(records['key'][start:].tolist(), range(start, n_records)))
+            self._records = records
+            self._size = n_records * self.dtype.itemsize
+
+    def get(self, key):
+        row = self._rows.get(key)
+        return None if row is None else np.array(self._records[row]['vector'])
+
+    def put(self, keys, vectors):
+        records = np.empty(len(keys), dtype=self.dtype)
+        records['key'] = keys
+        records['vector'] = vectors
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, records.tobytes())
+        finally:
+            os.close(fd)
+        self.refresh()
+
+    def __len__(self):
+        return len(self._rows)
+
+
+class SentenceEncoder:
+    """sentence-transformers model loaded on first use"""
+
+    def __init__(self, model_name=DEFAULT_MODEL, device="cpu", batch_size=64):
+        self.model_name = model_name
+        self.device = device
+        self.batch_size = batch_size
+        self.version = f"sentence-transformers/{model_name}"
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from sentence_transformers import SentenceTransformer
+                    self._model = SentenceTransformer(self.model_name, device=self.device)
+        return self._model
+
+    def __call__(self, texts):
+        return self.model.encode(list(texts), batch_size=self.batch_size, convert_to_numpy=True,
+                                 show_progress_bar=False)
+
+
+class EmbeddingService:
+    """Encoder wrapper with normalization, a two-tier float16 cache and cross-request batching
+
+    ``encoder(texts) -> (n, dim) array``. ``model_version`` must change
+    whenever the encoder's outputs do; it is part of every cache key.
+    """
+
+    def __init__(self, encoder, model_version=None, cache_dir="embedding_cache", memory_entries=4096,
+                 max_batch_size=64, max_wait_ms=5.0):
+        self.encoder = encoder
+        self.model_version = model_version or getattr(encoder, 'version', None)
+        if self.model_version is None:
+            raise ValueError("EmbeddingService needs a model_version to key its cache")
+        self.cache_dir = cache_dir
+        self.memory_entries = memory_entries
+        self.batcher = MicroBatcher(self._encode_batch, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms,
+                                    name=f"embed-{self.model_version}")
+        self.dim = None
+        self._disk = None
+        self._memory = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+        self.texts = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.encode_latencies = deque(maxlen=10000)  # (seconds, batch size) per encoder call
+        self._open_disk_cache()
+
+    def _disk_path(self, dim):
+        safe_version = re.sub(r"[^\w.-]+", "_", self.model_version)
+        return os.path.join(self.cache_dir, f"{safe_version}-{dim}d.bin")
+
+    def _open_disk_cache(self, dim=None):
+        """Open the disk tier once the embedding size is known (from an existing file or the first encode)"""
+        if not self.cache_dir:
+            return
+        if dim is None and os.path.isdir(self.cache_dir):
+            prefix = os.path.basename(self._disk_path(0))[:-len("0d.bin")]
+            for name in os.listdir(self.cache_dir):
+                match = re.fullmatch(re.escape(prefix) + r"(\d+)d\.bin", name)
+                if match:
+                    dim = int(match.group(1))
+                    break
+        if dim is not None:
+            self.dim = dim
+            self._disk = DiskEmbeddingCache(self._disk_path(dim), dim)
+
+    def _encode_batch(self, texts):
+        """Encode one coalesced batch of normalized texts and cache it in both tiers"""
+        texts = [str(text) for text in texts]
+        start = time.perf_counter()
+        vectors = np.asarray(self.encoder(texts), dtype=np.float32)
+        self.encode_latencies.append((time.perf_counter() - start, len(texts)))
+
+        keys = [cache_key(text, self.model_version) for text in texts]
+        stored = vectors.astype(np.float16)
+        for key, vector in zip(keys, stored):
+            self._remember(key, vector)
+        if self.cache_dir:
+            if self._disk is None:
+                self._open_disk_cache(vectors.shape[1])
+            self._disk.put(keys, stored)  # One append per batch
+        self.dim = vectors.shape[1]
+        return stored
+
+    def _remember(self, key, vector):
+        with self._lock:
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def _lookup(self, key):
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return vector
+        if self._disk is not None:
+            vector = self._disk.get(key)
+            if vector is None:
+                self._disk.refresh()  # Another worker may have encoded it
+                vector = self._disk.get(key)
+            if vector is not None:
+                self._remember(key, vector)
+                self.disk_hits += 1
+                return vector
+        return None
+
+    def _finish(self, key):
+        with self._lock:
+            self._inflight.pop(key, None)
+
+    def _submit(self, texts):
+        """Cached vectors by key, plus futures for the misses (shared with in-flight requests)"""
+        keys = []
+        found, pending = {}, {}
+        for text in texts:
+            normalized = normalize_text(text)
+            key = cache_key(normalized, self.model_version)
+            keys.append(key)
+            if key in found or key in pending:
+                continue
+            vector = self._lookup(key)
+            if vector is not None:
+                found[key] = vector
+                continue
+            with self._lock:
+                future = self._inflight.get(key)
+                if future is None:
+                    self.misses += 1
+                    future = self._inflight[key] = self.batcher.submit(normalized)
+                    future.add_done_callback(lambda f, key=key: self._finish(key))
+            pending[key] = future
+        self.texts += len(texts)
+        return keys, found, pending
+
+    def _stack(self, keys, found):
+        if not keys:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        return np.stack([found[key] for key in keys]).astype(np.float32)
+
+    def encode(self, texts):
+        """(n, dim) float32 embeddings; a single string gives a (dim,) vector"""
+        single = isinstance(texts, str)
+        keys, found, pending = self._submit([texts] if single else list(texts))
+        for key, future in pending.items():
+            found[key] = future.result()
+        vectors = self._stack(keys, found)
+        return vectors[0] if single else vectors
+
+    async def encode_async(self, texts):
+        """Awaitable ``encode`` that does not block the event loop on misses"""
+        single = isinstance(texts, str)
+        keys, found, pending = self._submit([texts] if single else list(texts))
+        for key, future in pending.items():
+            # In-flight futures are shared with other callers: cancelling this one must not cancel theirs
+            found[key] = await asyncio.shield(asyncio.wrap_future(future))
+        vectors = self._stack(keys, found)
+        return vectors[0] if single else vectors
+
+    __call__ = encode
+
+    def stats(self):
+        """Cache hit rates and encoder latency (ms per call and per text)"""
+        lookups = self.hits + self.disk_hits + self.misses
+        latencies = np.array([seconds for seconds, _ in self.encode_latencies]) * 1000
+        encoded = sum(size for _, size in self.encode_latencies)
+        return {
+            'model_version': self.model_version,
+            'texts': self.texts,
+            'memory_hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            'memory_entries': len(self._memory),
+            'disk_entries': len(self._disk) if self._disk is not None else 0,
+            'encode_calls': len(latencies),
+            'encode_p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+            'encode_p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else 0.0,
+            'encode_ms_per_text': float(latencies.sum() / encoded) if encoded else 0.0,
+            'batching': self.batcher.stats(),
+        }
+
+
+_services = {}
+_services_lock = threading.Lock()
+
+
+def get_service(model_name=DEFAULT_MODEL, **kwargs):
+    """Process-wide EmbeddingService for a sentence-transformers model (loaded on first encode)"""
+    with _services_lock:
+        service = _services.get(model_name)
+        if service is None:
+            service = _services[model_name] = EmbeddingService(SentenceEncoder(model_name), **kwargs)
+        return service
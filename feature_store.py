@@ -0,0 +1,368 @@
+"""Incremental, columnar feature store for the disease model, keyed by hadm_id.
+
+Replaces the from-scratch pandas pipeline of Merged_signals.ipynb (Steps 1-5).
+Signal features, OCR lab results and diagnoses are ingested as appends: each
+batch is reduced with a vectorized group-by and written in place, so adding or
+updating one admission only touches that admission's rows.
+
+On disk every column is its own memory-mapped ``.npy`` file (values, lab
+charttimes, ICD label indicators), preallocated with spare capacity and doubled
+when full. ``index.json`` holds the column list and running sums/counts used
+for mean imputation.
+"""
+import os
+import json
+import threading
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import MultiLabelBinarizer
+
+from feature_table import load_master_features
+
+DEFAULT_STORE_DIR = "feature_store"
+INITIAL_CAPACITY = 1024
+NO_TIME = np.iinfo(np.int64).min
+
+# Row flags: which sources have been ingested for an admission
+HAS_FEATURES = 1
+HAS_LABS = 2
+HAS_DIAGNOSES = 4
+
+IGNORED_COLUMNS = ("icd9_code", "image_path")
+
+
+class FeatureStore:
+    """Encoded per-admission features, latest lab values and ICD labels stored column by column"""
+
+    def __init__(self, store_dir=DEFAULT_STORE_DIR):
+        self.store_dir = store_dir
+        self._lock = threading.Lock()
+        self._dirty = {}  # Column files written since the last commit, by id
+        os.makedirs(store_dir, exist_ok=True)
+
+        index_path = os.path.join(store_dir, "index.json")
+        if os.path.exists(index_path):
+            with open(index_path, 'r') as f:
+                index = json.load(f)
+        else:
+            index = {'n_rows': 0, 'capacity': INITIAL_CAPACITY, 'columns': [], 'codes': [],
+                     'sums': [], 'counts': []}
+
+        self.n_rows = index['n_rows']
+        self.capacity = index['capacity']
+        self.columns = index['columns']  # [{'name', 'kind': numeric|lab|dummy, 'source', 'category'}]
+        self.codes = index['codes']
+        self.sums = index['sums']
+        self.counts = index['counts']
+
+        self._hadm_ids = self._open("hadm_ids.npy", np.int64, 0)
+        self._flags = self._open("flags.npy", np.uint8, 0)
+        self._values = [self._open(f"values_{i}.npy", np.float64, np.nan) for i in range(len(self.columns))]
+        self._times = {i: self._open(f"times_{i}.npy", np.int64, NO_TIME)
+                       for i, column in enumerate(self.columns) if column['kind'] == 'lab'}
+        self._labels = [self._open(f"labels_{j}.npy", np.uint8, 0) for j in range(len(self.codes))]
+
+        self._row_index = {int(h): row for row, h in enumerate(self._hadm_ids[:self.n_rows])}
+        self._column_index = {column['name']: i for i, column in enumerate(self.columns)}
+        self._code_index = {code: j for j, code in enumerate(self.codes)}
+
+    # Storage
+
+    def _open(self, name, dtype, fill):
+        """Open a column file, creating it with ``fill`` values when missing"""
+        path = os.path.join(self.store_dir, name)
+        if os.path.exists(path):
+            return np.load(path, mmap_mode='r+')
+        array = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(self.capacity,))
+        array[:] = fill
+        self._touch(array)
+        return array
+
+    def _arrays(self):
+        """Every column file as (name, memmap, fill value)"""
+        arrays = [("hadm_ids.npy", self._hadm_ids, 0), ("flags.npy", self._flags, 0)]
+        arrays += [(f"values_{i}.npy", a, 0.0 if self.columns[i]['kind'] == 'dummy' else np.nan)
+                   for i, a in enumerate(self._values)]
+        arrays += [(f"times_{i}.npy", a, NO_TIME) for i, a in self._times.items()]
+        arrays += [(f"labels_{j}.npy", a, 0) for j, a in enumerate(self._labels)]
+        return arrays
+
+    def _grow(self, min_capacity):
+        """Double the capacity of every column file until ``min_capacity`` rows fit"""
+        capacity = self.capacity
+        while capacity < min_capacity:
+            capacity *= 2
+
+        grown = {}
+        for name, array, fill in self._arrays():
+            path = os.path.join(self.store_dir, name)
+            tmp_path = path + ".tmp.npy"
+            new = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=array.dtype, shape=(capacity,))
+            new[:self.capacity] = array
+            new[self.capacity:] = fill
+            new.flush()
+            del new
+            os.replace(tmp_path, path)
+            grown[name] = np.load(path, mmap_mode='r+')
+
+        self.capacity = capacity
+        self._dirty.clear()
+        self._hadm_ids = grown["hadm_ids.npy"]
+        self._flags = grown["flags.npy"]
+        self._values = [grown[f"values_{i}.npy"] for i in range(len(self._values))]
+        self._times = {i: grown[f"times_{i}.npy"] for i in self._times}
+        self._labels = [grown[f"labels_{j}.npy"] for j in range(len(self._labels))]
+
+    def _commit(self):
+        """Flush the column files written since the last commit and atomically rewrite the index"""
+        for array in self._dirty.values():
+            array.flush()
+        self._dirty.clear()
+
+        index = {'n_rows': self.n_rows, 'capacity': self.capacity, 'columns': self.columns,
+                 'codes': self.codes, 'sums': self.sums, 'counts': self.counts}
+        index_path = os.path.join(self.store_dir, "index.json")
+        with open(index_path + ".tmp", 'w') as f:
+            json.dump(index, f)
+        os.replace(index_path + ".tmp", index_path)
+
+    def _rows_for(self, hadm_ids):
+        """Row numbers for admission ids, appending rows for new ones"""
+        hadm_ids = np.asarray(hadm_ids, dtype=np.int64)
+        new_ids = [h for h in pd.unique(hadm_ids).tolist() if h not in self._row_index]
+        if new_ids:
+            if self.n_rows + len(new_ids) > self.capacity:
+                self._grow(self.n_rows + len(new_ids))
+            self._hadm_ids[self.n_rows:self.n_rows + len(new_ids)] = new_ids
+            self._touch(self._hadm_ids)
+            for h in new_ids:
+                self._row_index[h] = self.n_rows
+                self.n_rows += 1
+        return np.fromiter((self._row_index[h] for h in hadm_ids.tolist()), dtype=np.intp, count=len(hadm_ids))
+
+    def _touch(self, *arrays):
+        """Mark column files as written"""
+        for array in arrays:
+            self._dirty[id(array)] = array
+
+    def _column(self, name, kind, source=None, category=None):
+        """Index of a value column, creating it when new"""
+        i = self._column_index.get(name)
+        if i is not None:
+            if self.columns[i]['kind'] != kind:
+                raise ValueError(f"Column '{name}' already exists as a {self.columns[i]['kind']} column")
+            return i
+
+        i = len(self.columns)
+        self.columns.append({'name': name, 'kind': kind, 'source': source, 'category': category})
+        self.sums.append(0.0)
+        self.counts.append(0)
+        self._column_index[name] = i
+        # Dummies are 0 for every row that does not have the category, as with get_dummies
+        self._values.append(self._open(f"values_{i}.npy", np.float64, 0.0 if kind == 'dummy' else np.nan))
+        if kind == 'lab':
+            self._times[i] = self._open(f"times_{i}.npy", np.int64, NO_TIME)
+        return i
+
+    def _write(self, i, rows, values):
+        """Write values into column ``i`` and keep its running sum/count for imputation"""
+        column = self._values[i]
+        old = column[rows]
+        old_valid, new_valid = ~np.isnan(old), ~np.isnan(values)
+        self.sums[i] += float(values[new_valid].sum() - old[old_valid].sum())
+        self.counts[i] += int(new_valid.sum() - old_valid.sum())
+        column[rows] = values
+        self._touch(column)
+
+    # Ingestion
+
+    def ingest_features(self, features_df):
+        """Insert or replace signal feature rows (master_features.csv layout)"""
+        df = features_df.drop(columns=[c for c in IGNORED_COLUMNS if c in features_df.columns])
+        df = df.drop_duplicates("hadm_id", keep="last")
+
+        # Non-numeric columns are one-hot encoded, as pd.get_dummies does
+        features = df.drop(columns="hadm_id")
+        categorical = list(features.select_dtypes(exclude=['number', 'bool']).columns)
+        numeric = [name for name in features.columns if name not in categorical]
+        # One conversion for all numeric columns; per-column writes below are plain numpy
+        values = features[numeric].to_numpy(dtype=np.float64)
+
+        with self._lock:
+            rows = self._rows_for(df["hadm_id"].to_numpy())
+            for k, name in enumerate(numeric):
+                self._write(self._column(name, 'numeric'), rows, values[:, k])
+
+            for name in categorical:
+                series = df[name]
+                # Reset this source's dummies for the rows, then set the matching category.
+                # A dummy column's count is its number of ones.
+                for i, column in enumerate(self.columns):
+                    if column['kind'] == 'dummy' and column['source'] == name:
+                        self.counts[i] -= int(self._values[i][rows].sum())
+                        self._values[i][rows] = 0.0
+                        self._touch(self._values[i])
+                for category, positions in series.groupby(series, sort=False, observed=True).indices.items():
+                    i = self._column(f"{name}_{category}", 'dummy', source=name, category=str(category))
+                    self._values[i][rows[positions]] = 1.0
+                    self._touch(self._values[i])
+                    self.counts[i] += len(positions)
+                    self.sums[i] = float(self.counts[i])
+
+            self._flags[rows] |= HAS_FEATURES
+            self._touch(self._flags)
+            self._commit()
+        return len(rows)
+
+    def ingest_labs(self, lab_records):
+        """Merge lab results, keeping the latest charttime per admission and label
+
+        ``lab_records`` is the OCR JSON (a list of {'hadm_id', 'lab_results': [...]})
+        or a DataFrame with hadm_id, label, value and charttime columns.
+        """
+        if isinstance(lab_records, pd.DataFrame):
+            labs = lab_records[["hadm_id", "label", "value", "charttime"]].copy()
+        else:
+            labs = pd.json_normalize(lab_records, record_path='lab_results', meta=['hadm_id'])
+            if labs.empty:
+                return 0
+            labs = labs[["hadm_id", "label", "value", "charttime"]]
+
+        labs["charttime"] = pd.to_datetime(labs["charttime"]).to_numpy(dtype='datetime64[ns]').view(np.int64)
+        labs["value"] = pd.to_numeric(labs["value"], errors='coerce')
+
+        # Latest value per (hadm_id, label); on equal charttimes the first one wins, like the notebook
+        labs = labs.sort_values("charttime", ascending=False, kind="stable")
+        labs = labs.drop_duplicates(["hadm_id", "label"], keep="first")
+
+        with self._lock:
+            rows = self._rows_for(labs["hadm_id"].to_numpy())
+            times = labs["charttime"].to_numpy()
+            values = labs["value"].to_numpy(dtype=np.float64)
+
+            updated = 0
+            for label, positions in labs.groupby("label", sort=False).indices.items():
+                i = self._column(str(label), 'lab')
+                label_rows = rows[positions]
+                newer = times[positions] > self._times[i][label_rows]
+                if newer.any():
+                    self._write(i, label_rows[newer], values[positions][newer])
+                    self._times[i][label_rows[newer]] = times[positions][newer]
+                    self._touch(self._times[i])
+                    updated += int(newer.sum())
+
+            self._flags[rows] |= HAS_LABS
+            self._touch(self._flags)
+            self._commit()
+        return updated
+
+    def ingest_diagnoses(self, diagnoses_df):
+        """Add ICD-9 codes (DIAGNOSES_ICD.csv layout) to the admissions' label sets"""
+        diagnoses = diagnoses_df[["hadm_id", "icd9_code"]].dropna()
+        codes = diagnoses["icd9_code"].astype(str).str.strip()
+
+        with self._lock:
+            rows = self._rows_for(diagnoses["hadm_id"].to_numpy())
+            for code, positions in codes.groupby(codes, sort=False).indices.items():
+                j = self._code_index.get(code)
+                if j is None:
+                    j = len(self.codes)
+                    self.codes.append(code)
+                    self._code_index[code] = j
+                    self._labels.append(self._open(f"labels_{j}.npy", np.uint8, 0))
+                self._labels[j][rows[positions]] = 1
+                self._touch(self._labels[j])
+
+            self._flags[rows] |= HAS_DIAGNOSES
+            self._touch(self._flags)
+            self._commit()
+        return len(rows)
+
+    # Reads
+
+    def _output_columns(self, counts=None):
+        """Column indices in the notebook's order: signal features, lab values, then dummies per source"""
+        counts = self.counts if counts is None else counts
+        plain = [i for kind in ('numeric', 'lab') for i, c in enumerate(self.columns)
+                 if c['kind'] == kind and counts[i] > 0]
+        sources = {}
+        for c in self.columns:
+            if c['kind'] == 'dummy':
+                sources.setdefault(c['source'], len(sources))
+        dummies = sorted((i for i, c in enumerate(self.columns) if c['kind'] == 'dummy' and counts[i] > 0),
+                         key=lambda i: (sources[self.columns[i]['source']], self.columns[i]['category']))
+        return plain + dummies
+
+    def get(self, hadm_id, impute=True):
+        """Encoded features of one admission as a one-row DataFrame, or None if unknown"""
+        row = self._row_index.get(int(hadm_id))
+        if row is None:
+            return None
+
+        columns = self._output_columns()
+        values = np.array([self._values[i][row] for i in columns], dtype=np.float64)
+        if impute:
+            missing = np.isnan(values)
+            for k in np.flatnonzero(missing):
+                i = columns[k]
+                values[k] = self.sums[i] / self.counts[i]
+        return pd.DataFrame([values], columns=[self.columns[i]['name'] for i in columns])
+
+    def labels(self, hadm_id):
+        """ICD-9 codes recorded for one admission"""
+        row = self._row_index.get(int(hadm_id))
+        if row is None:
+            return []
+        return [code for j, code in enumerate(self.codes) if self._labels[j][row]]
+
+    def training_data(self, min_label_count=30, require_labs=None):
+        """Return (X_imputed, y, mlb, hadm_ids) like disease_dataset.build_training_data
+
+        Admissions need signal features and diagnoses, and lab results too when
+        any were ingested (``require_labs``), matching the notebook's inner joins.
+        """
+        if require_labs is None:
+            require_labs = any(c['kind'] == 'lab' for c in self.columns)
+        required = HAS_FEATURES | HAS_DIAGNOSES | (HAS_LABS if require_labs else 0)
+        rows = np.flatnonzero((self._flags[:self.n_rows] & required) == required)
+
+        # Keep ICD codes with at least min_label_count cases, then admissions with a kept code
+        label_matrix = np.column_stack([self._labels[j][rows] for j in range(len(self.codes))]) \
+            if self.codes else np.zeros((len(rows), 0), dtype=np.uint8)
+        keep_codes = [j for j in range(len(self.codes)) if label_matrix[:, j].sum() >= min_label_count]
+        classes = sorted(self.codes[j] for j in keep_codes)
+        label_matrix = label_matrix[:, [self._code_index[code] for code in classes]]
+        has_label = label_matrix.sum(axis=1) > 0
+        rows, label_matrix = rows[has_label], label_matrix[has_label]
+
+        # Columns that have at least one value among these admissions (dropna(how='all'))
+        matrix = np.column_stack([self._values[i][rows] for i in range(len(self.columns))]) \
+            if self.columns else np.zeros((len(rows), 0))
+        counts = (~np.isnan(matrix)).sum(axis=0)
+        counts[[i for i, c in enumerate(self.columns) if c['kind'] == 'dummy']] = \
+            matrix[:, [c['kind'] == 'dummy' for c in self.columns]].sum(axis=0)
+        columns = self._output_columns(counts)
+        matrix = matrix[:, columns]
+
+        # Mean imputation over the selected admissions
+        means = np.nanmean(matrix, axis=0) if len(rows) else np.zeros(len(columns))
+        missing = np.isnan(matrix)
+        matrix[missing] = np.take(means, np.nonzero(missing)[1])
+
+        X_imputed = pd.DataFrame(matrix, columns=[self.columns[i]['name'] for i in columns])
+        mlb = MultiLabelBinarizer(classes=classes)
+        mlb.fit([])
+        return X_imputed, label_matrix.astype(int), mlb, self._hadm_ids[rows].copy()
+
+
+def build_store(features_path="master_features.csv", diagnoses_path="DIAGNOSES_ICD.csv", lab_path=None,
+                store_dir=DEFAULT_STORE_DIR):
+    """Ingest the repo's CSVs (and optionally the OCR lab JSON) into a feature store"""
+    store = FeatureStore(store_dir)
+    store.ingest_features(load_master_features(features_path, images=False))
+    store.ingest_diagnoses(pd.read_csv(diagnoses_path, dtype={"icd9_code": str}))
+    if lab_path is not None:
+        with open(lab_path, 'r') as f:
+            store.ingest_labs(json.load(f))
+    return store
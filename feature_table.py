@@ -0,0 +1,281 @@
+"""Typed, columnar loading of master_features.csv.
+
+The CSV is parsed once with a declared schema and written to a binary
+columnar cache: float32 vitals/labs, bit-packed ICD-9 indicator flags,
+categorical codes for gender/ethnicity and one string blob for the signal
+image paths. Later loads memory-map the cache instead of re-parsing.
+"""
+import os
+import json
+import shutil
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_CACHE_DIR = "features_cache"
+SCHEMA_VERSION = 1
+
+# Declared schema; columns are typed by name, never by sniffing values
+ID_COLUMN = "hadm_id"
+CATEGORICAL_COLUMNS = ["gender", "ethnicity"]
+INTEGER_COLUMNS = {"age": np.int16}
+MEASUREMENT_PREFIXES = ("chartevents_", "labevents_")
+IMAGE_COLUMN = "image_path"
+# Every other column is a 0/1 ICD-9 indicator flag; build_cache rejects one holding other values
+
+
+def column_kind(name):
+    """Schema kind of a master_features column"""
+    if name == ID_COLUMN:
+        return 'id'
+    if name in CATEGORICAL_COLUMNS:
+        return 'categorical'
+    if name in INTEGER_COLUMNS:
+        return 'integer'
+    if name.startswith(MEASUREMENT_PREFIXES):
+        return 'float'
+    if name == IMAGE_COLUMN:
+        return 'image'
+    return 'indicator'
+
+
+def read_dtypes(columns):
+    """pd.read_csv dtypes for the declared schema (indicators parse as float32, NaN allowed)"""
+    dtypes = {}
+    for name in columns:
+        kind = column_kind(name)
+        if kind == 'id':
+            dtypes[name] = np.int64
+        elif kind == 'categorical':
+            dtypes[name] = 'category'
+        elif kind == 'image':
+            dtypes[name] = object
+        else:
+            dtypes[name] = np.float32
+    return dtypes
+
+
+def check_indicator(name, values):
+    """Refuse to bit-pack a column that is not a 0/1 flag (a new numeric column missing from the schema)"""
+    present = values[~np.isnan(values)]
+    other = np.unique(present[(present != 0) & (present != 1)])
+    if len(other):
+        raise ValueError(f"Column '{name}' is treated as a 0/1 ICD-9 indicator but holds {other[:3].tolist()}; "
+                         f"declare it in the feature_table schema (MEASUREMENT_PREFIXES, INTEGER_COLUMNS, ...)")
+
+
+def source_signature(csv_path):
+    """Identify a CSV version by path, size and modification time"""
+    stat = os.stat(csv_path)
+    return f"{os.path.abspath(csv_path)}|{stat.st_size}|{stat.st_mtime_ns}|{SCHEMA_VERSION}"
+
+
+def cache_path(csv_path, cache_dir=DEFAULT_CACHE_DIR):
+    """Directory holding the columnar cache of a CSV"""
+    stem = os.path.splitext(os.path.basename(csv_path))[0]
+    key = hashlib.sha1(os.path.abspath(csv_path).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(cache_dir, f"{stem}_{key}")
+
+
+class LazyImage:
+    """Handle to a signal image; the file is only read when ``load()`` is called"""
+
+    __slots__ = ('path', 'base_dir')
+
+    def __init__(self, path, base_dir="."):
+        self.path = path
+        self.base_dir = base_dir
+
+    @property
+    def full_path(self):
+        return os.path.join(self.base_dir, self.path)
+
+    def exists(self):
+        return os.path.exists(self.full_path)
+
+    def load(self, grayscale=True):
+        """Read the image as a numpy array"""
+        import cv2
+        image = cv2.imread(self.full_path, cv2.IMREAD_GRAYSCALE if grayscale else cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError(f"Could not load image: {self.full_path}")
+        return image
+
+    def __repr__(self):
+        return f"LazyImage({self.path!r})"
+
+
+def build_cache(csv_path, cache_dir=DEFAULT_CACHE_DIR):
+    """Parse the CSV once with the declared schema and write the columnar cache"""
+    header = pd.read_csv(csv_path, nrows=0).columns
+    df = pd.read_csv(csv_path, dtype=read_dtypes(header))
+    n_rows = len(df)
+
+    target = cache_path(csv_path, cache_dir)
+    tmp_dir = target + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    columns, indicators = [], []
+    for name in df.columns:
+        kind = column_kind(name)
+        entry = {'name': name, 'kind': kind}
+        values = df[name]
+
+        if kind == 'indicator':
+            flags = values.to_numpy(dtype=np.float32)
+            try:
+                check_indicator(name, flags)
+            except ValueError:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                raise
+            entry['index'] = len(indicators)
+            indicators.append(flags)
+        elif kind == 'categorical':
+            codes = values.cat.codes.to_numpy()
+            entry['categories'] = [str(c) for c in values.cat.categories]
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), codes.astype(np.int8 if len(entry['categories']) < 127 else np.int16))
+        elif kind == 'integer':
+            if values.isna().any():
+                entry['kind'] = kind = 'float'  # Missing values need NaN
+                np.save(os.path.join(tmp_dir, f"{name}.npy"), values.to_numpy(dtype=np.float32))
+            else:
+                np.save(os.path.join(tmp_dir, f"{name}.npy"), values.to_numpy().astype(INTEGER_COLUMNS[name]))
+        elif kind == 'image':
+            # All paths in one UTF-8 blob with offsets; missing paths have zero length
+            encoded = [p.encode("utf-8") if isinstance(p, str) else b"" for p in values]
+            offsets = np.zeros(n_rows + 1, dtype=np.int64)
+            offsets[1:] = np.cumsum([len(b) for b in encoded])
+            np.save(os.path.join(tmp_dir, f"{name}_offsets.npy"), offsets)
+            with open(os.path.join(tmp_dir, f"{name}.bin"), 'wb') as f:
+                f.write(b"".join(encoded))
+        else:
+            dtype = np.int64 if kind == 'id' else np.float32
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), values.to_numpy(dtype=dtype))
+        columns.append(entry)
+
+    # Indicators: one bit per row, plus a validity bitmap for missing flags
+    if indicators:
+        flags = np.vstack(indicators)
+        valid = ~np.isnan(flags)
+        np.save(os.path.join(tmp_dir, "indicators.npy"), np.packbits(np.nan_to_num(flags) == 1, axis=1))
+        np.save(os.path.join(tmp_dir, "indicators_valid.npy"), np.packbits(valid, axis=1))
+        for entry in columns:
+            if entry['kind'] == 'indicator':
+                entry['complete'] = bool(valid[entry['index']].all())
+
+    with open(os.path.join(tmp_dir, "index.json"), 'w') as f:
+        json.dump({'source': source_signature(csv_path), 'n_rows': n_rows, 'columns': columns}, f)
+
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp_dir, target)
+    return target
+
+
+class FeatureTable:
+    """Memory-mapped, typed view of a cached master_features table"""
+
+    def __init__(self, path, base_dir="."):
+        self.path = path
+        self.base_dir = base_dir
+        with open(os.path.join(path, "index.json"), 'r') as f:
+            index = json.load(f)
+        self.n_rows = index['n_rows']
+        self.schema = {entry['name']: entry for entry in index['columns']}
+        self.columns = [entry['name'] for entry in index['columns']]
+
+        self._arrays = {}
+        self._indicators = self._load("indicators.npy") if os.path.exists(os.path.join(path, "indicators.npy")) else None
+        self._indicators_valid = self._load("indicators_valid.npy") if self._indicators is not None else None
+
+    def _load(self, name):
+        array = self._arrays.get(name)
+        if array is None:
+            array = self._arrays[name] = np.load(os.path.join(self.path, name), mmap_mode='r')
+        return array
+
+    def __len__(self):
+        return self.n_rows
+
+    @property
+    def hadm_ids(self):
+        return self.column(ID_COLUMN)
+
+    def column(self, name):
+        """One column as a numpy array (memory-mapped where stored as-is)"""
+        entry = self.schema[name]
+        kind = entry['kind']
+        if kind == 'indicator':
+            bits = np.unpackbits(self._indicators[entry['index']], count=self.n_rows)
+            if entry['complete']:
+                return bits
+            valid = np.unpackbits(self._indicators_valid[entry['index']], count=self.n_rows).astype(bool)
+            return np.where(valid, bits, np.nan).astype(np.float32)
+        if kind == 'image':
+            return np.array([self.image_path(i) for i in range(self.n_rows)], dtype=object)
+        return self._load(f"{name}.npy")
+
+    def categorical(self, name):
+        """A categorical column as a pandas Categorical"""
+        return pd.Categorical.from_codes(np.asarray(self._load(f"{name}.npy")), self.schema[name]['categories'])
+
+    def image_path(self, i):
+        """Signal image path of row ``i``, or None"""
+        offsets = self._load(f"{IMAGE_COLUMN}_offsets.npy")
+        start, end = int(offsets[i]), int(offsets[i + 1])
+        if start == end:
+            return None
+        with open(os.path.join(self.path, f"{IMAGE_COLUMN}.bin"), 'rb') as f:
+            f.seek(start)
+            return f.read(end - start).decode("utf-8")
+
+    def image(self, i):
+        """Lazy handle to the signal image of row ``i``, or None"""
+        path = self.image_path(i)
+        return LazyImage(path, self.base_dir) if path is not None else None
+
+    def images(self):
+        """Lazy handles for every row"""
+        offsets = self._load(f"{IMAGE_COLUMN}_offsets.npy").tolist()
+        with open(os.path.join(self.path, f"{IMAGE_COLUMN}.bin"), 'rb') as f:
+            blob = f.read()
+        base_dir = self.base_dir
+        return [LazyImage(blob[start:end].decode("utf-8"), base_dir) if end > start else None
+                for start, end in zip(offsets[:-1], offsets[1:])]
+
+    def to_frame(self, columns=None, images=True):
+        """Typed DataFrame: float32 measurements, uint8 flags, categorical gender/ethnicity
+
+        The image column holds LazyImage handles when ``images`` is True.
+        """
+        data = {}
+        for name in columns or self.columns:
+            kind = self.schema[name]['kind']
+            if kind == 'categorical':
+                data[name] = self.categorical(name)
+            elif kind == 'image':
+                if images:
+                    data[name] = self.images()
+            else:
+                data[name] = self.column(name)
+        return pd.DataFrame(data)
+
+
+def open_table(csv_path="master_features.csv", cache_dir=DEFAULT_CACHE_DIR):
+    """Open the columnar cache of a CSV, (re)building it when missing or stale"""
+    path = cache_path(csv_path, cache_dir)
+    index_path = os.path.join(path, "index.json")
+    stale = True
+    if os.path.exists(index_path):
+        with open(index_path, 'r') as f:
+            stale = json.load(f)['source'] != source_signature(csv_path)
+    if stale:
+        os.makedirs(cache_dir, exist_ok=True)
+        build_cache(csv_path, cache_dir)
+    return FeatureTable(path, base_dir=os.path.dirname(os.path.abspath(csv_path)))
+
+
+def load_master_features(csv_path="master_features.csv", cache_dir=DEFAULT_CACHE_DIR, images=True):
+    """Typed master_features DataFrame backed by the columnar cache"""
+    return open_table(csv_path, cache_dir).to_frame(images=images)
@@ -0,0 +1,159 @@
+"""Vectorized inference for the multi-label RandomForest disease model.
+
+The fitted forest is flattened into contiguous node arrays (feature,
+threshold, children, per-label leaf probabilities). A batch of rows is pushed
+through every tree at once, one level per step, and the per-label decision
+thresholds are applied in the same pass, without sklearn's per-tree Python
+overhead.
+"""
+import json
+import hashlib
+
+import numpy as np
+
+from tracing import span
+
+DEFAULT_THRESHOLD = 0.3
+CHUNK_ROWS = 256  # Rows traversed together; keeps the (rows, trees) working set in cache
+
+
+class FlatForest:
+    """A fitted multi-output RandomForestClassifier compiled into flat arrays"""
+
+    def __init__(self, feature, threshold, children_left, children_right, leaf_values, roots, max_depth,
+                 classes=None, feature_names=None, thresholds=DEFAULT_THRESHOLD):
+        self.feature = feature
+        self.threshold = threshold
+        self.children_left = children_left
+        self.children_right = children_right
+        # Interleaved [right, left] so one gather picks the next node from the split outcome
+        self.children = np.stack([children_right, children_left], axis=1).ravel()
+        self.leaf_values = leaf_values
+        self.roots = roots
+        self.max_depth = max_depth
+        self.classes = classes
+        self.feature_names = feature_names
+        self.n_labels = leaf_values.shape[1]
+        self.set_thresholds(thresholds)
+
+    @classmethod
+    def from_sklearn(cls, model, thresholds=DEFAULT_THRESHOLD):
+        """Compile a fitted (multi-output) RandomForestClassifier"""
+        n_outputs = model.n_outputs_
+        classes = model.classes_ if n_outputs > 1 else [model.classes_]
+
+        # Position of the positive class (1) in each output; -1 when it was never seen in training
+        positive = [int(np.flatnonzero(np.asarray(c) == 1)[0]) if np.any(np.asarray(c) == 1) else -1
+                    for c in classes]
+
+        features, thresholds_, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            n_nodes = tree.node_count
+            is_leaf = tree.children_left == -1
+
+            # Leaves loop back to themselves so every row can take max_depth steps
+            node_ids = np.arange(n_nodes) + offset
+            lefts.append(np.where(is_leaf, node_ids, tree.children_left + offset))
+            rights.append(np.where(is_leaf, node_ids, tree.children_right + offset))
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds_.append(np.where(is_leaf, np.inf, tree.threshold))
+
+            # Per-label probability of the positive class at each node
+            value = tree.value.reshape(n_nodes, n_outputs, -1).astype(np.float64)
+            totals = value.sum(axis=2)
+            leaf = np.zeros((n_nodes, n_outputs), dtype=np.float64)
+            for j, pos in enumerate(positive):
+                if pos >= 0:
+                    leaf[:, j] = value[:, j, pos] / np.maximum(totals[:, j], 1e-12)
+            values.append(leaf)
+
+            roots.append(offset)
+            offset += n_nodes
+            max_depth = max(max_depth, tree.max_depth)
+
+        feature_names = getattr(model, 'feature_names_in_', None)
+        return cls(
+            feature=np.concatenate(features).astype(np.intp),
+            threshold=np.concatenate(thresholds_).astype(np.float64),
+            children_left=np.concatenate(lefts).astype(np.intp),
+            children_right=np.concatenate(rights).astype(np.intp),
+            leaf_values=np.concatenate(values).astype(np.float64),
+            roots=np.asarray(roots, dtype=np.intp),
+            max_depth=int(max_depth),
+            classes=classes,
+            feature_names=list(feature_names) if feature_names is not None else None,
+            thresholds=thresholds,
+        )
+
+    def set_thresholds(self, thresholds):
+        """Set the decision threshold, either one value or one per label"""
+        self.thresholds = np.broadcast_to(np.asarray(thresholds, dtype=np.float64), (self.n_labels,)).copy()
+
+    def _as_matrix(self, X):
+        """Convert input rows to the float32 matrix sklearn's trees compare against"""
+        if self.feature_names is not None and hasattr(X, 'columns'):
+            X = X[self.feature_names]
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[None, :]
+        return X
+
+    def apply(self, X):
+        """Return the (n_rows, n_trees) leaf index reached in every tree"""
+        X = self._as_matrix(X)
+        n_rows, n_features = X.shape
+        flat_X = np.ascontiguousarray(X).ravel()
+        leaves = np.empty((n_rows, len(self.roots)), dtype=np.intp)
+
+        for start in range(0, n_rows, CHUNK_ROWS):
+            n = min(CHUNK_ROWS, n_rows - start)
+            row_offsets = ((np.arange(n) + start) * n_features)[:, None]
+            nodes = np.broadcast_to(self.roots, (n, len(self.roots))).copy()
+            for _ in range(self.max_depth):
+                go_left = flat_X[row_offsets + self.feature[nodes]] <= self.threshold[nodes]
+                nodes = self.children[2 * nodes + go_left]
+            leaves[start:start + n] = nodes
+
+        return leaves
+
+    def predict_proba(self, X):
+        """Positive-class probability per label, shape (n_rows, n_labels)"""
+        return self.leaf_values[self.apply(X)].mean(axis=1)
+
+    def predict(self, X):
+        """Return (probabilities, 0/1 label matrix) with per-label thresholds applied"""
+        with span('forest.predict'):
+            proba = self.predict_proba(X)
+            return proba, (proba > self.thresholds).astype(int)
+
+
+def file_sha256(path):
+    """Hex sha256 of a file, read in 1 MB blocks (the hash forest_tuning publishes as model_sha256)"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_thresholds(tuning, n_labels=None, model_path=None):
+    """Per-label thresholds from forest_tuning's tuning.json (a path or the loaded dict)
+
+    With ``model_path`` the model file must be the one the thresholds were
+    tuned for (same sha256), so a retrained model never runs with another
+    model's thresholds.
+    """
+    if not isinstance(tuning, dict):
+        with open(tuning, 'r') as f:
+            tuning = json.load(f)
+    thresholds = np.asarray(tuning['thresholds'], dtype=np.float64)
+    if n_labels is not None and len(thresholds) != n_labels:
+        raise ValueError(f"{len(thresholds)} tuned thresholds for a model with {n_labels} labels")
+    if model_path is not None and tuning.get('model_sha256'):
+        if file_sha256(model_path) != tuning['model_sha256']:
+            raise ValueError(f"{model_path} is not the model these thresholds were tuned for "
+                             f"(version {tuning.get('version')})")
+    return thresholds
@@ -0,0 +1,439 @@
+"""Cross-validated hyperparameter and per-label threshold search for the disease RandomForest.
+
+Replaces hand-editing Merged_signals.ipynb (100 trees, a 0.3 threshold for
+every ICD label, labels with at least 30 cases):
+
+- Data: the notebook's training rows for ``--min-label-count``, split into
+  ``--folds`` folds stratified on each admission's rarest label. The fold
+  assignment and per-fold imputed matrices (training-fold means, so
+  validation rows never leak into the imputation) are cached as .npy files
+  under ``--cache-dir``, keyed by the input files and split settings, and
+  memory-mapped by the workers.
+- Search: ``--configs`` forest settings sampled from SEARCH_SPACE (plus the
+  notebook's) are fitted fold by fold on a process pool using every core.
+  After each of the first ``--prune-rounds`` folds only the best
+  1/``--eta`` of the configurations continue (successive halving), so poor
+  settings stop after a fold or two. The notebook's setting always runs to
+  the end as the reference.
+- Thresholds: each label's threshold is picked by one vectorized sweep of
+  THRESHOLD_GRID over the out-of-fold probabilities. A configuration's score
+  is the macro F1 over labels at its tuned thresholds.
+- Artifact: the best configuration is refitted on all rows (imputed like the
+  notebook) and published atomically as ``<output>/v<N>/``:
+  disease_model.joblib and tuning.json (labels in model output order,
+  training imputer means, per-label thresholds, out-of-fold F1 at those thresholds and at 0.3, the
+  parameters, the search log and the model's sha256). ``--install`` copies
+  them to disease_model.pkl and disease_thresholds.json, which the model
+  registry serves; ``forest_inference.load_thresholds`` reads tuning.json.
+
+Out-of-fold F1 at tuned thresholds is measured on the predictions the
+thresholds were tuned on, so it is optimistic; ``f1_at_default`` is not.
+
+    python forest_tuning.py --configs 24 --folds 5
+    python forest_tuning.py --min-label-count 20 --install
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import tempfile
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from forest_inference import file_sha256
+
+DEFAULT_CACHE_DIR = "tuning_cache"
+CACHE_FORMAT = 2  # Bumped when the cached files change
+DEFAULT_OUTPUT_DIR = "tuned_models"
+INSTALL_PATHS = {'model': "disease_model.pkl", 'tuning': "disease_thresholds.json"}
+
+# The notebook's model: RandomForestClassifier(n_estimators=100, random_state=42)
+NOTEBOOK_PARAMS = {'n_estimators': 100, 'max_depth': None, 'min_samples_leaf': 1, 'max_features': 'sqrt',
+                   'class_weight': None}
+SEARCH_SPACE = {
+    'n_estimators': [100, 200, 400],
+    'max_depth': [None, 6, 12],
+    'min_samples_leaf': [1, 2, 4],
+    'max_features': ['sqrt', 0.3, 0.6],
+    'class_weight': [None, 'balanced', 'balanced_subsample'],
+}
+THRESHOLD_GRID = np.round(np.arange(0.05, 0.951, 0.025), 3)
+DEFAULT_THRESHOLD = 0.3
+
+# Fold matrices already opened by this worker process, keyed by file path
+_arrays = {}
+
+
+def file_signature(path):
+    stat = os.stat(path)
+    return f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+
+
+def cache_key(features_path, diagnoses_path, min_label_count, n_folds, seed):
+    raw = "|".join([file_signature(features_path), file_signature(diagnoses_path),
+                    str(min_label_count), str(n_folds), str(seed), str(CACHE_FORMAT)])
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def assign_folds(y, n_folds, seed):
+    """Fold id per row, stratified on each row's rarest label (rows of labels too rare to split share a stratum)"""
+    from sklearn.model_selection import StratifiedKFold
+
+    counts = y.sum(axis=0)
+    rarest = np.where(y.any(axis=1), np.argmin(np.where(y > 0, counts, np.inf), axis=1), -1)
+    strata_sizes = np.bincount(rarest + 1)
+    rarest[strata_sizes[rarest + 1] < n_folds] = -1
+    folds = np.zeros(len(y), dtype=np.int8)
+    splitter = StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=seed)
+    for fold, (_, val_idx) in enumerate(splitter.split(np.zeros(len(y)), rarest)):
+        folds[val_idx] = fold
+    return folds
+
+
+def _save(cache_dir, name, array):
+    np.save(os.path.join(cache_dir, f"{name}.npy"), np.ascontiguousarray(array))
+
+
+def prepare_folds(features_path="master_features.csv", diagnoses_path="DIAGNOSES_ICD.csv", min_label_count=30,
+                  n_folds=5, seed=42, cache_dir=DEFAULT_CACHE_DIR):
+    """Build or reuse the cached folds; returns (fold cache directory, meta dict)"""
+    from disease_dataset import encode_features, imputer_means, load_training_data
+
+    fold_dir = os.path.join(cache_dir, cache_key(features_path, diagnoses_path, min_label_count, n_folds, seed))
+    meta_path = os.path.join(fold_dir, "meta.json")
+    if os.path.exists(meta_path):
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+        print(f"✓ Reusing cached folds in {fold_dir}")
+        return fold_dir, meta
+
+    start = time.perf_counter()
+    X_imputed, y, mlb, merged = load_training_data(features_path, diagnoses_path, min_label_count=min_label_count)
+    raw = encode_features(merged).reindex(columns=X_imputed.columns).to_numpy(dtype=np.float64)
+    folds = assign_folds(y, n_folds, seed)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=cache_dir)
+    try:
+        _save(tmp_dir, "X", X_imputed.to_numpy(dtype=np.float32))
+        _save(tmp_dir, "y", y.astype(np.uint8))
+        _save(tmp_dir, "folds", folds)
+        for fold in range(n_folds):
+            train, val = raw[folds != fold], raw[folds == fold]
+            # Training-fold means; columns empty in the training fold fall back to 0
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)
+                means = np.nan_to_num(np.nanmean(train, axis=0))
+            _save(tmp_dir, f"fold{fold}_train", np.where(np.isnan(train), means, train).astype(np.float32))
+            _save(tmp_dir, f"fold{fold}_val", np.where(np.isnan(val), means, val).astype(np.float32))
+        meta = {
+            'features': os.path.abspath(features_path),
+            'diagnoses': os.path.abspath(diagnoses_path),
+            'min_label_count': min_label_count,
+            'n_folds': n_folds,
+            'seed': seed,
+            'feature_names': list(X_imputed.columns),
+            'labels': [str(label) for label in mlb.classes_],
+            'n_rows': int(len(y)),
+            'fold_sizes': np.bincount(folds, minlength=n_folds).tolist(),
+            'imputer_means': imputer_means(merged).to_dict(),
+        }
+        with open(os.path.join(tmp_dir, "meta.json"), 'w') as f:
+            json.dump(meta, f, indent=2)
+        try:
+            os.replace(tmp_dir, fold_dir)
+        except OSError:
+            # Another run published the same folds first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    print(f"✓ Cached {n_folds} folds of {meta['n_rows']} admissions x {len(meta['feature_names'])} features, "
+          f"{len(meta['labels'])} labels in {fold_dir} ({time.perf_counter() - start:.1f}s)")
+    return fold_dir, meta
+
+
+def load_array(fold_dir, name):
+    path = os.path.join(fold_dir, f"{name}.npy")
+    array = _arrays.get(path)
+    if array is None:
+        array = _arrays[path] = np.load(path, mmap_mode='r')
+    return array
+
+
+def positive_proba(model, X):
+    """(n_rows, n_labels) probability of the positive class; 0 for labels never positive in training"""
+    probs = model.predict_proba(X)
+    if model.n_outputs_ == 1:
+        probs, classes = [probs], [model.classes_]
+    else:
+        classes = model.classes_
+    return np.stack([p[:, list(c).index(1)] if 1 in c else np.zeros(len(X)) for p, c in zip(probs, classes)],
+                    axis=1)
+
+
+def fit_fold(fold_dir, fold, params, seed):
+    """Fit one configuration on a training fold; returns (validation probabilities, fit seconds)"""
+    from sklearn.ensemble import RandomForestClassifier
+
+    folds = load_array(fold_dir, "folds")
+    y = load_array(fold_dir, "y")
+    start = time.perf_counter()
+    model = RandomForestClassifier(random_state=seed, n_jobs=1, **params)
+    model.fit(load_array(fold_dir, f"fold{fold}_train"), y[folds != fold])
+    return positive_proba(model, load_array(fold_dir, f"fold{fold}_val")), time.perf_counter() - start
+
+
+def sweep_thresholds(proba, y, grid=THRESHOLD_GRID, chunk_rows=4096):
+    """Best threshold per label by F1, vectorized over grid x rows x labels
+
+    Returns (thresholds, f1 at those thresholds). Ties take the middle of the
+    best range; labels without positives keep DEFAULT_THRESHOLD.
+    """
+    y = np.asarray(y, dtype=bool)
+    tp = np.zeros((len(grid), y.shape[1]))
+    predicted = np.zeros((len(grid), y.shape[1]))
+    for start in range(0, len(y), chunk_rows):
+        above = proba[None, start:start + chunk_rows] > grid[:, None, None]
+        tp += (above & y[None, start:start + chunk_rows]).sum(axis=1)
+        predicted += above.sum(axis=1)
+    positives = y.sum(axis=0)
+    f1 = 2 * tp / np.maximum(predicted + positives, 1)
+
+    labels = np.arange(y.shape[1])
+    first = f1.argmax(axis=0)
+    last = len(grid) - 1 - f1[::-1].argmax(axis=0)
+    middle = (first + last) // 2
+    best = np.where(f1[middle, labels] == f1[first, labels], middle, first)
+    thresholds = np.where(positives > 0, grid[best], DEFAULT_THRESHOLD)
+    return thresholds, f1[best, labels]
+
+
+def f1_at(proba, y, thresholds):
+    y = np.asarray(y, dtype=bool)
+    predicted = proba > thresholds
+    tp = (predicted & y).sum(axis=0)
+    return 2 * tp / np.maximum(predicted.sum(axis=0) + y.sum(axis=0), 1)
+
+
+def sample_configs(n_configs, seed, space=SEARCH_SPACE):
+    """The notebook's parameters plus ``n_configs - 1`` distinct random grid points"""
+    rng = np.random.default_rng(seed)
+    configs = [dict(NOTEBOOK_PARAMS)]
+    seen = {json.dumps(configs[0], sort_keys=True)}
+    n_grid = int(np.prod([len(set(values)) for values in space.values()]))
+    # The notebook's point only adds a configuration when the space does not already contain it
+    if any(NOTEBOOK_PARAMS.get(name) not in values for name, values in space.items()):
+        n_grid += 1
+    while len(configs) < min(n_configs, n_grid):
+        params = dict(NOTEBOOK_PARAMS, **{name: values[rng.integers(len(values))] for name, values in space.items()})
+        params = {name: value.item() if hasattr(value, 'item') else value for name, value in params.items()}
+        key = json.dumps(params, sort_keys=True)
+        if key not in seen:
+            seen.add(key)
+            configs.append(params)
+    return configs
+
+
+class Trial:
+    """One configuration's out-of-fold predictions and progress"""
+
+    def __init__(self, trial_id, params, n_rows, n_labels):
+        self.trial_id = trial_id
+        self.params = params
+        self.oof = np.full((n_rows, n_labels), np.nan)
+        self.folds_done = []
+        self.fit_seconds = 0.0
+        self.pruned_after = None
+        self.score = None
+
+    def evaluate(self, y, folds):
+        """Macro F1 at tuned thresholds over the rows of the completed folds"""
+        rows = np.isin(folds, self.folds_done)
+        self.score = float(sweep_thresholds(self.oof[rows], y[rows])[1].mean())
+        return self.score
+
+    def log(self):
+        return {'trial': self.trial_id, 'params': self.params, 'folds': len(self.folds_done),
+                'macro_f1': self.score, 'pruned_after_fold': self.pruned_after,
+                'fit_seconds': round(self.fit_seconds, 2)}
+
+
+def run_folds(executor, fold_dir, trials, fold_ids, seed, y, folds):
+    """Fit every (trial, fold) pair in parallel and fill in the out-of-fold predictions"""
+    futures = {executor.submit(fit_fold, fold_dir, fold, trial.params, seed): (trial, fold)
+               for trial in trials for fold in fold_ids}
+    for future in as_completed(futures):
+        trial, fold = futures[future]
+        proba, seconds = future.result()
+        trial.oof[folds == fold] = proba
+        trial.folds_done.append(fold)
+        trial.fit_seconds += seconds
+    for trial in trials:
+        trial.evaluate(y, folds)
+
+
+def search(fold_dir, meta, configs, workers, eta=2, prune_rounds=2, seed=42):
+    """Successive-halving cross-validation over ``configs``; returns all trials, best first"""
+    y = np.load(os.path.join(fold_dir, "y.npy"))
+    folds = np.load(os.path.join(fold_dir, "folds.npy"))
+    n_folds = meta['n_folds']
+    trials = [Trial(i, params, len(y), y.shape[1]) for i, params in enumerate(configs)]
+    alive = list(trials)
+
+    print(f"{'ROUND':<8} {'TRIALS':>6} {'BEST F1':>8} {'PRUNED':>6} {'SECONDS':>8}")
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for fold in range(n_folds):
+            start = time.perf_counter()
+            if fold < prune_rounds:
+                run_folds(executor, fold_dir, alive, [fold], seed, y, folds)
+            else:
+                # No more pruning: the remaining folds run together
+                run_folds(executor, fold_dir, alive, list(range(fold, n_folds)), seed, y, folds)
+            alive.sort(key=lambda trial: trial.score, reverse=True)
+            pruned = []
+            if fold < prune_rounds and fold < n_folds - 1:
+                keep = max(1, int(np.ceil(len(alive) / eta)))
+                pruned = [trial for trial in alive[keep:] if trial.trial_id != 0]  # Trial 0 is the notebook's
+                for trial in pruned:
+                    trial.pruned_after = fold
+                alive = [trial for trial in alive if trial not in pruned]
+            label = f"fold {fold}" if fold < prune_rounds or fold == n_folds - 1 else f"folds {fold}-{n_folds - 1}"
+            print(f"{label:<8} {len(alive) + len(pruned):>6} {alive[0].score:>8.3f} {len(pruned):>6} "
+                  f"{time.perf_counter() - start:>8.1f}")
+            if fold >= prune_rounds:
+                break
+
+    finished = sorted([trial for trial in trials if len(trial.folds_done) == n_folds],
+                      key=lambda trial: trial.score, reverse=True)
+    return finished + [trial for trial in trials if len(trial.folds_done) < n_folds]
+
+
+def next_version(output_dir):
+    versions = [int(name[1:]) for name in os.listdir(output_dir) if name[:1] == "v" and name[1:].isdigit()]
+    return max(versions, default=0) + 1
+
+
+def write_artifact(output_dir, fold_dir, meta, best, baseline, trials, seed):
+    """Refit ``best`` on all rows and publish model + tuning.json as the next version; returns its directory"""
+    import joblib
+    import pandas as pd
+    from sklearn.ensemble import RandomForestClassifier
+
+    y = np.load(os.path.join(fold_dir, "y.npy"))
+    X = pd.DataFrame(np.load(os.path.join(fold_dir, "X.npy")), columns=meta['feature_names'])
+    start = time.perf_counter()
+    model = RandomForestClassifier(random_state=seed, n_jobs=-1, **best.params).fit(X, y)
+    model.n_jobs = None
+    refit_seconds = time.perf_counter() - start
+
+    thresholds, f1 = sweep_thresholds(best.oof, y)
+    default_f1 = f1_at(best.oof, y, DEFAULT_THRESHOLD)
+    baseline_f1 = f1_at(baseline.oof, y, DEFAULT_THRESHOLD)
+
+    os.makedirs(output_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=output_dir)
+    try:
+        model_path = os.path.join(tmp_dir, "disease_model.joblib")
+        joblib.dump(model, model_path)
+        version = next_version(output_dir)
+        tuning = {
+            'version': version,
+            'created': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'model_file': "disease_model.joblib",
+            'model_sha256': file_sha256(model_path),
+            'params': best.params,
+            'random_state': seed,
+            'refit_seconds': round(refit_seconds, 2),
+            'data': {name: meta[name] for name in ['features', 'diagnoses', 'min_label_count', 'n_folds', 'n_rows']},
+            'labels': meta['labels'],
+            'imputer_means': meta['imputer_means'],
+            'thresholds': thresholds.tolist(),
+            'f1': f1.tolist(),
+            'f1_at_default': default_f1.tolist(),
+            'support': y.sum(axis=0).tolist(),
+            'macro_f1': float(f1.mean()),
+            'macro_f1_at_default': float(default_f1.mean()),
+            'notebook_macro_f1_at_default': float(baseline_f1.mean()),
+            'search': [trial.log() for trial in trials],
+        }
+        with open(os.path.join(tmp_dir, "tuning.json"), 'w') as f:
+            json.dump(tuning, f, indent=2)
+        version_dir = os.path.join(output_dir, f"v{version}")
+        os.replace(tmp_dir, version_dir)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    return version_dir, tuning
+
+
+def install(version_dir, model_path=INSTALL_PATHS['model'], tuning_path=INSTALL_PATHS['tuning']):
+    """Copy a published version to the serving paths (atomic replace, picked up by the registry's hot-swap)"""
+    for source, target in [("disease_model.joblib", model_path), ("tuning.json", tuning_path)]:
+        tmp_path = f"{target}.{os.getpid()}.tmp"
+        shutil.copyfile(os.path.join(version_dir, source), tmp_path)
+        os.replace(tmp_path, target)
+        print(f"✓ Installed {os.path.join(version_dir, source)} as {target}")
+
+
+def print_report(tuning):
+    print(f"\n{'LABEL':<8} {'SUPPORT':>7} {'THRESHOLD':>9} {'F1':>6} {'F1@0.3':>7}")
+    for label, support, threshold, f1, default_f1 in zip(tuning['labels'], tuning['support'], tuning['thresholds'],
+                                                         tuning['f1'], tuning['f1_at_default']):
+        print(f"{label:<8} {support:>7} {threshold:>9.3f} {f1:>6.3f} {default_f1:>7.3f}")
+    print(f"Macro F1: {tuning['macro_f1']:.3f} tuned, {tuning['macro_f1_at_default']:.3f} at 0.3 "
+          f"(notebook model at 0.3: {tuning['notebook_macro_f1_at_default']:.3f})")
+    print(f"Best parameters: {tuning['params']}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Tune the disease RandomForest and its per-label thresholds")
+    parser.add_argument("--features", default="master_features.csv")
+    parser.add_argument("--diagnoses", default="DIAGNOSES_ICD.csv")
+    parser.add_argument("--min-label-count", type=int, default=30, help="Keep ICD codes with this many cases")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--configs", type=int, default=24, help="Configurations to try, the notebook's included")
+    parser.add_argument("--space", help="JSON overriding SEARCH_SPACE entries, e.g. '{\"n_estimators\": [50, 100]}'")
+    parser.add_argument("--eta", type=float, default=2.0, help="Keep 1/eta of the configurations per pruning round")
+    parser.add_argument("--prune-rounds", type=int, default=2, help="Folds after which to prune")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT_DIR, help="Directory of versioned artifacts")
+    parser.add_argument("--install", action="store_true",
+                        help=f"Copy the result to {INSTALL_PATHS['model']} and {INSTALL_PATHS['tuning']}")
+    args = parser.parse_args(argv)
+    if args.folds < 2:
+        parser.error("--folds must be at least 2")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    space = dict(SEARCH_SPACE, **json.loads(args.space)) if args.space else SEARCH_SPACE
+    fold_dir, meta = prepare_folds(args.features, args.diagnoses, args.min_label_count, args.folds, args.seed,
+                                   args.cache_dir)
+    configs = sample_configs(args.configs, args.seed, space)
+    print(f"Searching {len(configs)} configurations with {args.folds}-fold CV on {args.workers} workers")
+
+    start = time.perf_counter()
+    trials = search(fold_dir, meta, configs, args.workers, args.eta, args.prune_rounds, args.seed)
+    fits = sum(len(trial.folds_done) for trial in trials)
+    print(f"✓ {fits} fold fits instead of {len(configs) * args.folds} in {time.perf_counter() - start:.1f}s")
+
+    baseline = next(trial for trial in trials if trial.trial_id == 0)
+    version_dir, tuning = write_artifact(args.output, fold_dir, meta, trials[0], baseline, trials, args.seed)
+    print_report(tuning)
+    print(f"✓ Wrote version {tuning['version']} to {version_dir}")
+    if args.install:
+        install(version_dir)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,429 @@
+"""Disease knowledge retrieval: an incremental ANN index over a memory-mapped chunk store.
+
+Replaces the model/disease_index.faiss + disease_metadata.json +
+disease_chunks.json trio. Chunk texts, metadata and embeddings live in
+append-only binary files that are memory-mapped and looked up by offset, so
+opening the knowledge base costs a few page faults instead of parsing every
+chunk into Python objects in every worker.
+
+The FAISS index ('flat', 'ivf' or 'hnsw') is updated in place: ``add``
+appends, ``delete`` removes ids (or tombstones them for HNSW, which cannot
+remove vectors). Because the float16 embeddings are kept in the store, a
+rebuild or a change of index type never re-encodes any text.
+"""
+import os
+import json
+import threading
+
+import numpy as np
+
+from tracing import span
+
+DEFAULT_INDEX_DIR = os.path.join("model", "knowledge_index")
+INDEX_TYPES = ('flat', 'ivf', 'hnsw')
+
+
+def _append(path, data):
+    with open(path, 'ab') as f:
+        f.write(data)
+
+
+class ChunkStore:
+    """Append-only chunk texts, JSON metadata and float16 embeddings, addressed by chunk id
+
+    A chunk's id is its row number. Layout in ``store_dir``:
+
+        text.bin / text.idx          utf-8 texts and int64 end offsets
+        metadata.bin / metadata.idx  JSON-encoded metadata and int64 end offsets
+        vectors.bin                  float16 (n, dim) embeddings
+        deleted.bin                  uint8 tombstone per chunk
+        store.json                   row count, dim, deleted count
+    """
+
+    FILES = ('text.bin', 'text.idx', 'metadata.bin', 'metadata.idx', 'vectors.bin', 'deleted.bin')
+
+    def __init__(self, store_dir, dim=None):
+        self.store_dir = store_dir
+        self._lock = threading.Lock()
+        self._maps = {}
+        os.makedirs(store_dir, exist_ok=True)
+
+        state_path = os.path.join(store_dir, "store.json")
+        if os.path.exists(state_path):
+            with open(state_path, 'r') as f:
+                state = json.load(f)
+        else:
+            if dim is None:
+                raise ValueError(f"{store_dir} is not a chunk store; pass dim to create one")
+            state = {'n_rows': 0, 'dim': dim, 'n_deleted': 0}
+            for name in self.FILES:
+                open(os.path.join(store_dir, name), 'wb').close()
+        self.n_rows = state['n_rows']
+        self.dim = state['dim']
+        self.n_deleted = state['n_deleted']
+        if dim is not None and dim != self.dim:
+            raise ValueError(f"Store has dim {self.dim}, got {dim}")
+        self._truncate_to_committed()
+
+    def _path(self, name):
+        return os.path.join(self.store_dir, name)
+
+    def _truncate_to_committed(self):
+        """Drop bytes appended by a writer that died before updating store.json"""
+        if self.n_rows == 0:
+            sizes = {'text.bin': 0, 'metadata.bin': 0}
+        else:
+            sizes = {'text.bin': int(self._map('text.idx', np.int64)[self.n_rows - 1]),
+                     'metadata.bin': int(self._map('metadata.idx', np.int64)[self.n_rows - 1])}
+        sizes.update({'text.idx': 8 * self.n_rows, 'metadata.idx': 8 * self.n_rows,
+                      'vectors.bin': 2 * self.dim * self.n_rows, 'deleted.bin': self.n_rows})
+        for name, size in sizes.items():
+            if os.path.getsize(self._path(name)) > size:
+                os.truncate(self._path(name), size)
+        self._maps.clear()
+
+    def _map(self, name, dtype, shape=None):
+        """Read-only memory map of a store file (reopened after appends)"""
+        key = (name, shape)
+        mapped = self._maps.get(key)
+        if mapped is None:
+            if os.path.getsize(self._path(name)) == 0:
+                mapped = np.zeros(0 if shape is None else (0,) + shape, dtype=dtype)
+            else:
+                mapped = np.memmap(self._path(name), dtype=dtype, mode='r')
+                if shape is not None:
+                    mapped = mapped.reshape((-1,) + shape)
+            self._maps[key] = mapped
+        return mapped
+
+    def _commit(self):
+        tmp_path = self._path("store.json.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump({'n_rows': self.n_rows, 'dim': self.dim, 'n_deleted': self.n_deleted}, f)
+        os.replace(tmp_path, self._path("store.json"))
+        self._maps.clear()
+
+    def add(self, texts, vectors, metadatas=None):
+        """Append chunks; returns their ids"""
+        vectors = np.asarray(vectors, dtype=np.float16).reshape(len(texts), self.dim)
+        metadatas = metadatas if metadatas is not None else [{}] * len(texts)
+        encoded_texts = [text.encode('utf-8') for text in texts]
+        encoded_metadata = [json.dumps(meta, separators=(',', ':')).encode('utf-8') for meta in metadatas]
+
+        with self._lock:
+            text_end = os.path.getsize(self._path('text.bin'))
+            meta_end = os.path.getsize(self._path('metadata.bin'))
+            _append(self._path('text.bin'), b''.join(encoded_texts))
+            _append(self._path('text.idx'), (text_end + np.cumsum([len(t) for t in encoded_texts])).astype(np.int64).tobytes())
+            _append(self._path('metadata.bin'), b''.join(encoded_metadata))
+            _append(self._path('metadata.idx'), (meta_end + np.cumsum([len(m) for m in encoded_metadata])).astype(np.int64).tobytes())
+            _append(self._path('vectors.bin'), vectors.tobytes())
+            _append(self._path('deleted.bin'), bytes(len(texts)))
+
+            ids = np.arange(self.n_rows, self.n_rows + len(texts), dtype=np.int64)
+            self.n_rows += len(texts)
+            self._commit()
+        return ids
+
+    def delete(self, ids):
+        """Tombstone chunks; returns the ids that were live"""
+        ids = np.unique(np.asarray(ids, dtype=np.int64))
+        ids = ids[(ids >= 0) & (ids < self.n_rows)]
+        with self._lock:
+            deleted = np.memmap(self._path('deleted.bin'), dtype=np.uint8, mode='r+')
+            ids = ids[deleted[ids] == 0]
+            deleted[ids] = 1
+            deleted.flush()
+            del deleted
+            self.n_deleted += len(ids)
+            self._commit()
+        return ids
+
+    def is_deleted(self, ids):
+        return self._map('deleted.bin', np.uint8)[np.asarray(ids, dtype=np.int64)].astype(bool)
+
+    def live_ids(self):
+        return np.flatnonzero(self._map('deleted.bin', np.uint8) == 0).astype(np.int64)
+
+    def vectors(self, ids=None):
+        """float32 embeddings of ``ids`` (all chunks by default)"""
+        vectors = self._map('vectors.bin', np.float16, (self.dim,))
+        return np.asarray(vectors if ids is None else vectors[ids], dtype=np.float32)
+
+    def _slice(self, name, chunk_id):
+        ends = self._map(f'{name}.idx', np.int64)
+        start = int(ends[chunk_id - 1]) if chunk_id > 0 else 0
+        return bytes(self._map(f'{name}.bin', np.uint8)[start:int(ends[chunk_id])])
+
+    def text(self, chunk_id):
+        return self._slice('text', chunk_id).decode('utf-8')
+
+    def metadata(self, chunk_id):
+        return json.loads(self._slice('metadata', chunk_id))
+
+    def get(self, chunk_id):
+        """{'id', 'text', 'metadata'} of a chunk, or None if it was deleted"""
+        if not 0 <= chunk_id < self.n_rows or self.is_deleted([chunk_id])[0]:
+            return None
+        return {'id': int(chunk_id), 'text': self.text(chunk_id), 'metadata': self.metadata(chunk_id)}
+
+    def __len__(self):
+        return self.n_rows - self.n_deleted
+
+
+class KnowledgeIndex:
+    """Incremental FAISS index plus ChunkStore, searched with batched query embedding
+
+    ``encoder(texts) -> (n, dim) array`` embeds chunks and queries; vectors
+    are L2-normalized and scored by inner product (cosine similarity).
+    """
+
+    def __init__(self, index_dir=DEFAULT_INDEX_DIR, dim=None, index_type='hnsw', encoder=None,
+                 nlist=None, nprobe=16, hnsw_m=32, ef_construction=80, ef_search=64,
+                 ivf_min_train=2048, rebuild_ratio=0.2, encode_batch_size=64):
+        self.index_dir = index_dir
+        self.encoder = encoder
+        self.encode_batch_size = encode_batch_size
+        os.makedirs(index_dir, exist_ok=True)
+
+        config_path = os.path.join(index_dir, "index.json")
+        if os.path.exists(config_path):
+            with open(config_path, 'r') as f:
+                config = json.load(f)
+        else:
+            if index_type not in INDEX_TYPES:
+                raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES}")
+            config = {'index_type': index_type, 'nlist': nlist, 'nprobe': nprobe, 'hnsw_m': hnsw_m,
+                      'ef_construction': ef_construction, 'ef_search': ef_search, 'ivf_min_train': ivf_min_train,
+                      'rebuild_ratio': rebuild_ratio, 'tombstones': 0, 'trained_nlist': None}
+        self.config = config
+
+        self.store = ChunkStore(os.path.join(index_dir, "chunks"), dim)
+        self.dim = self.store.dim
+        self._lock = threading.RLock()
+
+        index_path = os.path.join(index_dir, "index.faiss")
+        if os.path.exists(index_path):
+            import faiss
+            self.index = faiss.read_index(index_path)
+            self._apply_search_params()
+            if not self._in_sync():
+                # Chunks were added or deleted after the last save(): the store is the source of truth
+                print(f"✗ {index_path} is older than the chunk store; rebuilding it")
+                self.rebuild()
+        else:
+            self.rebuild()
+
+    def _in_sync(self):
+        """Whether the loaded index covers exactly the store's chunks as of its last save()"""
+        store = self.store
+        if (self.config.get('store_rows', store.n_rows), self.config.get('store_deleted', store.n_deleted)) != \
+                (store.n_rows, store.n_deleted):
+            return False
+        # HNSW keeps tombstoned vectors until the next rebuild
+        expected = len(store) + (self.config['tombstones'] if self.index_type == 'hnsw' else 0)
+        return self.index.ntotal == expected
+
+    @property
+    def index_type(self):
+        return self.config['index_type']
+
+    def _make_index(self, n_vectors):
+        """An empty FAISS index of the configured type, ready for ``add_with_ids``"""
+        import faiss
+
+        config = self.config
+        self.config['trained_nlist'] = None
+        if self.index_type == 'hnsw':
+            hnsw = faiss.IndexHNSWFlat(self.dim, config['hnsw_m'], faiss.METRIC_INNER_PRODUCT)
+            hnsw.hnsw.efConstruction = config['ef_construction']
+            return faiss.IndexIDMap2(hnsw)
+        if self.index_type == 'ivf' and n_vectors >= config['ivf_min_train']:
+            # ~4 sqrt(n) lists, with at least 39 training points per list as FAISS recommends
+            nlist = config['nlist'] or int(min(4 * np.sqrt(n_vectors), n_vectors // 39))
+            quantizer = faiss.IndexFlatIP(self.dim)
+            ivf = faiss.IndexIVFFlat(quantizer, self.dim, max(1, nlist), faiss.METRIC_INNER_PRODUCT)
+            config['trained_nlist'] = ivf.nlist
+            return ivf
+        # Flat, or IVF that has too few vectors to train yet
+        return faiss.IndexIDMap2(faiss.IndexFlatIP(self.dim))
+
+    def _apply_search_params(self):
+        import faiss
+        inner = faiss.downcast_index(self.index.index) if hasattr(self.index, 'id_map') else self.index
+        if isinstance(inner, faiss.IndexHNSW):
+            inner.hnsw.efSearch = self.config['ef_search']
+        elif isinstance(inner, faiss.IndexIVF):
+            inner.nprobe = self.config['nprobe']
+
+    def _is_trained_ivf(self):
+        return self.config['trained_nlist'] is not None
+
+    def rebuild(self, index_type=None):
+        """Build a fresh index from the stored embeddings (no re-encoding)
+
+        Drops HNSW tombstones, trains IVF on the current data, or switches
+        the index type.
+        """
+        with self._lock:
+            if index_type is not None:
+                if index_type not in INDEX_TYPES:
+                    raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES}")
+                self.config['index_type'] = index_type
+            ids = self.store.live_ids()
+            vectors = self.store.vectors(ids)
+            index = self._make_index(len(ids))
+            if not index.is_trained:
+                index.train(vectors)
+            if len(ids):
+                index.add_with_ids(vectors, ids)
+            self.index = index
+            self.config['tombstones'] = 0
+            self._apply_search_params()
+        return self
+
+    def encode(self, texts):
+        """Normalized float32 embeddings, encoded ``encode_batch_size`` texts per encoder call"""
+        if self.encoder is None:
+            raise ValueError("KnowledgeIndex has no encoder; pass embeddings or vectors instead of text")
+        batches = [np.asarray(self.encoder(texts[i:i + self.encode_batch_size]), dtype=np.float32)
+                   for i in range(0, len(texts), self.encode_batch_size)]
+        vectors = np.concatenate(batches) if batches else np.zeros((0, self.dim), dtype=np.float32)
+        return self._normalize(vectors)
+
+    @staticmethod
+    def _normalize(vectors):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def add(self, texts, metadatas=None, embeddings=None):
+        """Add chunks (encoded unless ``embeddings`` are given); returns their ids"""
+        texts = list(texts)
+        vectors = self._normalize(embeddings) if embeddings is not None else self.encode(texts)
+        with self._lock:
+            ids = self.store.add(texts, vectors, metadatas)
+            if self.index_type == 'ivf' and not self._is_trained_ivf() and len(self.store) >= self.config['ivf_min_train']:
+                self.rebuild()  # Enough data to train the IVF quantizer now
+            else:
+                # Same float16-rounded vectors as a rebuild would index
+                self.index.add_with_ids(self.store.vectors(ids), ids)
+        return ids
+
+    def delete(self, ids):
+        """Remove chunks from results; returns how many were live"""
+        with self._lock:
+            ids = self.store.delete(ids)
+            if self.index_type == 'hnsw':
+                # HNSW graphs cannot drop nodes: filter at query time, rebuild once tombstones pile up
+                self.config['tombstones'] += len(ids)
+                if self.config['tombstones'] > self.config['rebuild_ratio'] * max(1, self.index.ntotal):
+                    self.rebuild()
+            elif len(ids):
+                self.index.remove_ids(ids)
+        return len(ids)
+
+    def search_vectors(self, vectors, k=5):
+        """(scores, ids) arrays of shape (n_queries, k) for query embeddings; missing hits are -1"""
+        vectors = self._normalize(np.atleast_2d(vectors))
+        with span('retrieval.search'), self._lock:
+            # Over-fetch to make up for tombstoned HNSW hits
+            k_search = min(k + self.config['tombstones'], max(1, self.index.ntotal))
+            scores, ids = self.index.search(vectors, k_search)
+        if self.config['tombstones']:
+            valid = ids >= 0
+            valid[valid] = ~self.store.is_deleted(ids[valid])
+            order = np.argsort(~valid, axis=1, kind='stable')
+            ids = np.where(np.take_along_axis(valid, order, axis=1), np.take_along_axis(ids, order, axis=1), -1)
+            scores = np.take_along_axis(scores, order, axis=1)
+        if ids.shape[1] < k:
+            pad = k - ids.shape[1]
+            ids = np.pad(ids, ((0, 0), (0, pad)), constant_values=-1)
+            scores = np.pad(scores, ((0, 0), (0, pad)), constant_values=-np.inf)
+        return scores[:, :k], ids[:, :k]
+
+    def search(self, queries, k=5):
+        """Top-``k`` chunks per query, with every query embedded in one batch
+
+        Returns one list per query of {'id', 'score', 'text', 'metadata'}.
+        """
+        single = isinstance(queries, str)
+        queries = [queries] if single else list(queries)
+        with span('retrieval.embed'):
+            vectors = self.encode(queries)
+        scores, ids = self.search_vectors(vectors, k)
+        results = []
+        for row_scores, row_ids in zip(scores, ids):
+            hits = []
+            for score, chunk_id in zip(row_scores, row_ids):
+                chunk = self.store.get(chunk_id) if chunk_id >= 0 else None
+                if chunk is not None:  # Deleted by another process since the index was loaded
+                    hits.append(dict(chunk, score=float(score)))
+            results.append(hits)
+        return results[0] if single else results
+
+    def set_search_params(self, nprobe=None, ef_search=None):
+        """Trade recall for latency without rebuilding"""
+        if nprobe is not None:
+            self.config['nprobe'] = nprobe
+        if ef_search is not None:
+            self.config['ef_search'] = ef_search
+        self._apply_search_params()
+
+    def save(self):
+        """Write index.faiss and index.json (the chunk store is always up to date on disk)"""
+        import faiss
+        with self._lock:
+            index_path = os.path.join(self.index_dir, "index.faiss")
+            faiss.write_index(self.index, index_path + ".tmp")
+            os.replace(index_path + ".tmp", index_path)
+            self.config['store_rows'] = self.store.n_rows
+            self.config['store_deleted'] = self.store.n_deleted
+            config_path = os.path.join(self.index_dir, "index.json")
+            with open(config_path + ".tmp", 'w') as f:
+                json.dump(self.config, f, indent=2)
+            os.replace(config_path + ".tmp", config_path)
+        print(f"✓ Saved {self.index_type} index with {len(self.store)} chunks to {self.index_dir}")
+
+    def stats(self):
+        return {
+            'index_type': self.index_type,
+            'chunks': len(self.store),
+            'deleted': self.store.n_deleted,
+            'tombstones': self.config['tombstones'],
+            'indexed': int(self.index.ntotal),
+            'dim': self.dim,
+            'nlist': self.config['trained_nlist'],
+            'nprobe': self.config['nprobe'],
+            'ef_search': self.config['ef_search'],
+        }
+
+
+def import_legacy(index_dir=DEFAULT_INDEX_DIR, faiss_path="model/disease_index.faiss",
+                  metadata_path="model/disease_metadata.json", chunks_path="model/disease_chunks.json",
+                  index_type='hnsw', encoder=None):
+    """Convert the JSON + FAISS knowledge base into a KnowledgeIndex
+
+    The embeddings are read back from the old index, so nothing is re-encoded.
+    Chunks may be strings or dicts with a 'text' field; metadata may be a list
+    aligned with the chunks or a dict keyed by chunk position.
+    """
+    import faiss
+
+    legacy = faiss.read_index(faiss_path)
+    if isinstance(faiss.downcast_index(legacy), faiss.IndexIVF):
+        faiss.extract_index_ivf(legacy).make_direct_map()
+    vectors = legacy.reconstruct_n(0, legacy.ntotal)
+
+    with open(chunks_path, 'r', encoding='utf-8') as f:
+        chunks = json.load(f)
+    with open(metadata_path, 'r', encoding='utf-8') as f:
+        metadata = json.load(f)
+    texts = [chunk if isinstance(chunk, str) else chunk.get('text', '') for chunk in chunks]
+    if isinstance(metadata, dict):
+        metadata = [metadata.get(str(i), {}) for i in range(len(texts))]
+
+    index = KnowledgeIndex(index_dir, dim=legacy.d, index_type=index_type, encoder=encoder)
+    index.add(texts, metadata, embeddings=vectors)
+    index.save()
+    return index
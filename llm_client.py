@@ -0,0 +1,152 @@
+"""Streaming client for the local Ollama server that writes the /chat report.
+
+One OllamaClient per process keeps a pool of keep-alive HTTP connections to
+Ollama, so a report does not pay a TCP handshake, and it bounds concurrent
+generations with a fixed number of slots (Ollama serializes generations per
+model anyway). ``stream`` yields tokens as Ollama produces them. Closing the
+stream early, e.g. when the /chat client disconnects, closes the HTTP
+response, which makes Ollama stop generating, and frees the slot right away.
+"""
+import json
+import time
+import asyncio
+from collections import deque
+
+import numpy as np
+
+from pipeline_errors import StageOverloaded, StageTimeout
+
+DEFAULT_URL = "http://localhost:11434"
+DEFAULT_MODEL = "llama2"
+
+
+class OllamaClient:
+    """Pooled, slot-limited async client for Ollama's /api/generate"""
+
+    def __init__(self, base_url=DEFAULT_URL, model=DEFAULT_MODEL, max_concurrent=2, max_waiting=16,
+                 slot_timeout=10.0, token_timeout=60.0, max_connections=8, keepalive_expiry=60.0, options=None):
+        self.base_url = base_url
+        self.model = model
+        self.max_concurrent = max_concurrent
+        self.max_waiting = max_waiting
+        self.slot_timeout = slot_timeout
+        self.token_timeout = token_timeout  # Longest wait for the next token, including prompt evaluation
+        self.max_connections = max_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.options = options
+        self._client = None
+        self._slots = asyncio.Semaphore(max_concurrent)
+
+        self.in_flight = 0
+        self.waiting = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.failures = 0
+        self.rejected = 0
+        self.tokens = 0
+        self._first_token_latencies = deque(maxlen=1000)
+
+    @property
+    def client(self):
+        """httpx.AsyncClient created on first use, inside the serving event loop"""
+        if self._client is None:
+            import httpx
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(connect=5.0, read=self.token_timeout, write=10.0, pool=self.slot_timeout),
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections,
+                                    keepalive_expiry=self.keepalive_expiry),
+            )
+        return self._client
+
+    async def _acquire_slot(self):
+        if self.waiting >= self.max_waiting:
+            self.rejected += 1
+            raise StageOverloaded(f"LLM has {self.waiting} reports waiting for a generation slot")
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.slot_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise StageOverloaded(f"no LLM generation slot freed up within {self.slot_timeout:.1f}s")
+        finally:
+            self.waiting -= 1
+
+    async def stream(self, prompt, system=None):
+        """Yield report tokens as they are generated
+
+        Use ``contextlib.aclosing`` (or break and let the generator close):
+        the slot and connection are released as soon as the stream closes.
+        """
+        import httpx
+
+        await self._acquire_slot()
+        self.in_flight += 1
+        start = time.perf_counter()
+        first_token = True
+        outcome = 'cancelled'
+        payload = {'model': self.model, 'prompt': prompt, 'stream': True}
+        if system:
+            payload['system'] = system
+        if self.options:
+            payload['options'] = self.options
+        try:
+            async with self.client.stream("POST", "/api/generate", json=payload) as response:
+                response.raise_for_status()
+                # Read to the end of the body (past the 'done' chunk) so the connection goes back to the pool
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get('error'):
+                        raise RuntimeError(f"Ollama error: {chunk['error']}")
+                    token = chunk.get('response')
+                    if token:
+                        if first_token:
+                            self._first_token_latencies.append(time.perf_counter() - start)
+                            first_token = False
+                        self.tokens += 1
+                        yield token
+            outcome = 'completed'
+        except httpx.TimeoutException:
+            outcome = 'failed'
+            raise StageTimeout(f"LLM produced no token within {self.token_timeout:.1f}s")
+        except Exception:
+            outcome = 'failed'
+            raise
+        finally:
+            # Also reached on GeneratorExit/CancelledError: the response is closed, Ollama stops generating
+            self.in_flight -= 1
+            self._slots.release()
+            if outcome == 'completed':
+                self.completed += 1
+            elif outcome == 'cancelled':
+                self.cancelled += 1
+            else:
+                self.failures += 1
+
+    async def generate(self, prompt, system=None):
+        """Whole report as one string"""
+        return "".join([token async for token in self.stream(prompt, system)])
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self):
+        latencies = np.array(self._first_token_latencies) * 1000 if self._first_token_latencies else np.zeros(1)
+        return {
+            'model': self.model,
+            'slots': self.max_concurrent,
+            'in_flight': self.in_flight,
+            'waiting': self.waiting,
+            'completed': self.completed,
+            'cancelled': self.cancelled,
+            'failures': self.failures,
+            'rejected': self.rejected,
+            'tokens': self.tokens,
+            'first_token_p50_ms': float(np.percentile(latencies, 50)),
+            'first_token_p99_ms': float(np.percentile(latencies, 99)),
+        }
@@ -0,0 +1,133 @@
+"""Local stand-in for Ollama's /api/generate, for tests and benchmarks without a model.
+
+Streams a canned report as NDJSON chunks in Ollama's format, after a
+``first_token_delay`` (prompt evaluation) and one token every
+``token_delay`` seconds. /stub/stats reports how many generations completed,
+how many were abandoned by the client and how many TCP connections were used.
+
+    python llm_stub.py --port 11434        # then point OllamaClient at it
+"""
+import json
+import time
+import socket
+import asyncio
+import argparse
+import threading
+
+REPORT = ("Based on the model findings, your symptoms and results are most consistent with elevated blood "
+          "pressure. Chest pain with shortness of breath should be checked promptly by a clinician. A lipid "
+          "panel, troponin and an ECG would help clarify the picture. This is not a diagnosis.")
+
+
+def create_stub_app(first_token_delay=0.3, token_delay=0.02, report=REPORT):
+    from fastapi import FastAPI, Request
+    from fastapi.responses import StreamingResponse
+
+    app = FastAPI()
+    stats = {'requests': 0, 'active': 0, 'completed': 0, 'abandoned': 0, 'connections': set()}
+    app.state.stats = stats
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        body = await request.json()
+        stats['requests'] += 1
+        stats['connections'].add(tuple(request.client))
+        model = body.get('model', "stub")
+        words = report.split(" ")
+        tokens = [word + " " for word in words[:-1]] + words[-1:]
+
+        async def chunks():
+            stats['active'] += 1
+            done = False
+            try:
+                await asyncio.sleep(first_token_delay)
+                for i, token in enumerate(tokens):
+                    if i:
+                        await asyncio.sleep(token_delay)
+                    yield json.dumps({'model': model, 'response': token, 'done': False}) + "\n"
+                yield json.dumps({'model': model, 'response': "", 'done': True, 'eval_count': len(tokens)}) + "\n"
+                done = True
+            finally:
+                stats['active'] -= 1
+                stats['completed' if done else 'abandoned'] += 1
+
+        if not body.get('stream', True):
+            await asyncio.sleep(first_token_delay + token_delay * (len(tokens) - 1))
+            stats['completed'] += 1
+            return {'model': model, 'response': "".join(tokens), 'done': True}
+        return StreamingResponse(chunks(), media_type="application/x-ndjson")
+
+    @app.get("/stub/stats")
+    async def stub_stats():
+        return dict(stats, connections=len(stats['connections']))
+
+    return app
+
+
+class BackgroundServer:
+    """Serve an ASGI app with uvicorn on a background thread (port 0 picks a free port)"""
+
+    def __init__(self, app, host="127.0.0.1", port=0):
+        import uvicorn
+        self.app = app
+        self.host = host
+        self.port = port
+        self.server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning"))
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def start(self, timeout=10.0):
+        if self.port == 0:
+            with socket.socket() as s:
+                s.bind((self.host, 0))
+                self.port = self.server.config.port = s.getsockname()[1]
+        self.thread = threading.Thread(target=self.server.run, name="background-server", daemon=True)
+        self.thread.start()
+        deadline = time.perf_counter() + timeout
+        while not self.server.started:
+            if time.perf_counter() > deadline or not self.thread.is_alive():
+                raise RuntimeError(f"Server on {self.url} did not start")
+            time.sleep(0.01)
+        return self.url
+
+    def stop(self):
+        self.server.should_exit = True
+        if self.thread is not None:
+            self.thread.join(timeout=10.0)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class StubLLMServer(BackgroundServer):
+    """The stub Ollama server on a background thread"""
+
+    def __init__(self, host="127.0.0.1", port=0, **kwargs):
+        super().__init__(create_stub_app(**kwargs), host, port)
+
+    def stats(self):
+        stats = self.app.state.stats
+        return dict(stats, connections=len(stats['connections']))
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Stub Ollama server streaming a canned report")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--first-token-delay", type=float, default=0.3, help="Seconds before the first token")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="Seconds between tokens")
+    args = parser.parse_args()
+    uvicorn.run(create_stub_app(args.first_token_delay, args.token_delay), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
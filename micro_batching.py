@@ -0,0 +1,145 @@
+"""Request-coalescing scheduler for single-sample model inference.
+
+Concurrent callers each submit one sample; a scheduler thread per model
+groups them into one batch and makes a single ``predict_batch`` call,
+flushing when the batch reaches ``max_batch_size`` or when the oldest
+queued sample has waited ``max_wait_ms``. Each caller gets its own row
+back. Per-call overhead (Keras ``predict`` setup, sklearn's per-tree
+Python loop) is paid once per batch instead of once per request.
+"""
+import time
+import queue
+import asyncio
+import threading
+from collections import Counter, deque
+from concurrent.futures import Future
+
+import numpy as np
+
+from tracing import span
+
+DEFAULT_MAX_BATCH_SIZE = 32
+DEFAULT_MAX_WAIT_MS = 5.0
+
+
+class MicroBatcher:
+    """Coalesce single-sample calls to ``predict_batch(np.stack(samples))``"""
+
+    def __init__(self, predict_batch, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait_ms=DEFAULT_MAX_WAIT_MS,
+                 name="model"):
+        self.predict_batch = predict_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.name = name
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        self.batch_sizes = Counter()
+        self.queue_delays = deque(maxlen=10000)  # seconds from submit to batch start
+        self.samples = 0
+        self.batches = 0
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name=f"batcher-{self.name}", daemon=True)
+                    self._thread.start()
+
+    def submit(self, sample):
+        """Queue one sample; returns a Future resolving to its prediction row"""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((np.asarray(sample), future, time.perf_counter()))
+        return future
+
+    def predict(self, sample):
+        """Blocking single-sample prediction through the batcher"""
+        return self.submit(sample).result()
+
+    async def predict_async(self, sample):
+        """Awaitable single-sample prediction through the batcher"""
+        return await asyncio.wrap_future(self.submit(sample))
+
+    def _collect(self):
+        """Block for the first sample, then gather more until the batch is full or the wait expires"""
+        batch = [self._queue.get()]
+        deadline = batch[0][2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            # Callers that cancelled while queued are dropped from the batch
+            batch = [item for item in self._collect() if item[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            start = time.perf_counter()
+            samples, futures, submitted = zip(*batch)
+
+            try:
+                with span(f"{self.name}.batch"):
+                    outputs = self.predict_batch(np.stack(samples))
+                if len(outputs) != len(futures):
+                    # Rows cannot be matched to callers; resolve every future rather than leave some waiting
+                    raise ValueError(f"{self.name}: predict_batch returned {len(outputs)} rows "
+                                     f"for {len(futures)} samples")
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+
+            for future, row in zip(futures, outputs):
+                future.set_result(row)
+
+            self.samples += len(batch)
+            self.batches += 1
+            self.batch_sizes[len(batch)] += 1
+            self.queue_delays.extend(start - t for t in submitted)
+
+    def stats(self):
+        """Batch-size distribution and queueing delay percentiles (ms)"""
+        delays = np.array(self.queue_delays) * 1000 if self.queue_delays else np.zeros(1)
+        return {
+            'samples': self.samples,
+            'batches': self.batches,
+            'mean_batch_size': self.samples / self.batches if self.batches else 0.0,
+            'batch_sizes': dict(sorted(self.batch_sizes.items())),
+            'queue_delay_p50_ms': float(np.percentile(delays, 50)),
+            'queue_delay_p99_ms': float(np.percentile(delays, 99)),
+        }
+
+
+_batchers = {}
+_batchers_lock = threading.Lock()
+
+
+def get_batcher(name, predict_batch, max_batch_size=None, max_wait_ms=None):
+    """Process-wide MicroBatcher per model name (created on first use)
+
+    Settings given for an existing batcher must match the ones it was
+    created with; conflicting ones raise ValueError instead of being ignored.
+    """
+    with _batchers_lock:
+        batcher = _batchers.get(name)
+        if batcher is None:
+            batcher = _batchers[name] = MicroBatcher(
+                predict_batch, DEFAULT_MAX_BATCH_SIZE if max_batch_size is None else max_batch_size,
+                DEFAULT_MAX_WAIT_MS if max_wait_ms is None else max_wait_ms, name=name)
+            return batcher
+    if max_batch_size is not None and max_batch_size != batcher.max_batch_size:
+        raise ValueError(f"Batcher '{name}' exists with max_batch_size={batcher.max_batch_size}, got {max_batch_size}")
+    if max_wait_ms is not None and max_wait_ms / 1000 != batcher.max_wait:
+        raise ValueError(f"Batcher '{name}' exists with max_wait_ms={batcher.max_wait * 1000:g}, got {max_wait_ms}")
+    return batcher
+
+
+def batcher_stats():
+    """stats() of every process-wide batcher"""
+    return {name: batcher.stats() for name, batcher in _batchers.items()}
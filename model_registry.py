@@ -0,0 +1,288 @@
+"""Process-wide registry of model artifacts loaded once and shared read-only.
+
+Every artifact (Keras ECG model, pickled scaler/encoder, joblib disease model,
+torch checkpoint, FAISS index, JSON metadata) is loaded at most once per
+process. Large arrays are memory-mapped where the format allows it (joblib
+``mmap_mode='r'``, FAISS ``IO_FLAG_MMAP``, torch ``mmap=True``), so the OS page
+cache shares them between uvicorn workers instead of every worker holding its
+own copy. ``preload()`` before forking (e.g. ``gunicorn --preload``) shares the
+rest copy-on-write.
+
+Artifacts are hot-swapped: when the file on disk changes, the new version is
+loaded in the background and replaces the old one once it is ready.
+"""
+import os
+import json
+import time
+import pickle
+import threading
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def _load_keras(path):
+    import tensorflow as tf
+    return tf.keras.models.load_model(path)
+
+
+def _load_tflite(path):
+    from ecg_export import TFLiteModel
+    return TFLiteModel(path)
+
+
+def _load_joblib(path):
+    import joblib
+    # Uncompressed joblib dumps keep numpy arrays (e.g. the forest's node arrays) memory-mapped
+    return joblib.load(path, mmap_mode='r')
+
+
+def _load_pickle(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def _load_torch(path):
+    import torch
+    try:
+        return torch.load(path, map_location='cpu', mmap=True)
+    except TypeError:
+        # torch < 2.1 has no mmap support
+        return torch.load(path, map_location='cpu')
+
+
+def _load_faiss(path):
+    import faiss
+    return faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+
+
+def _load_knowledge_index(path):
+    from knowledge_index import KnowledgeIndex
+    from embedding_service import get_service
+    return KnowledgeIndex(path, encoder=get_service())
+
+
+def _load_json(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+LOADERS = {
+    'keras': _load_keras,
+    'tflite': _load_tflite,
+    'joblib': _load_joblib,
+    'pickle': _load_pickle,
+    'torch': _load_torch,
+    'faiss': _load_faiss,
+    'knowledge_index': _load_knowledge_index,
+    'json': _load_json,
+}
+
+EXTENSION_LOADERS = {
+    '.h5': 'keras',
+    '.keras': 'keras',
+    '.tflite': 'tflite',
+    '.pkl': 'pickle',
+    '.joblib': 'joblib',
+    '.pt': 'torch',
+    '.pth': 'torch',
+    '.faiss': 'faiss',
+    '.json': 'json',
+}
+
+# Artifacts the backend and notebooks use, by registry name
+DEFAULT_ARTIFACTS = {
+    'ecg_model': ('ecg_disease_detector.h5', 'keras'),
+    'ecg_scaler': ('scaler.pkl', 'pickle'),
+    'ecg_label_encoder': ('label_encoder.pkl', 'pickle'),
+    'disease_model': ('disease_model.pkl', 'joblib'),
+    'disease_thresholds': ('disease_thresholds.json', 'json'),
+    'best_model': ('model/best_model.pt', 'torch'),
+    'label_map': ('model/label_map.json', 'json'),
+    'disease_index': ('model/disease_index.faiss', 'faiss'),
+    'disease_metadata': ('model/disease_metadata.json', 'json'),
+    'disease_chunks': ('model/disease_chunks.json', 'json'),
+    'knowledge_index': ('model/knowledge_index', 'knowledge_index'),
+}
+
+
+def resident_memory():
+    """Resident set size of this process in bytes, or None if unavailable"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class ModelEntry:
+    """One registered artifact and its currently served version"""
+
+    def __init__(self, name, path, loader):
+        self.name = name
+        self.path = path
+        self.loader = loader
+        self.model = None
+        self.version = 0
+        self.signature = None
+        self.load_seconds = None
+        self.resident_bytes = None
+        self.loaded_at = None
+        self.last_checked = 0.0
+        self.reloading = False
+        self.error = None
+        self.lock = threading.Lock()  # Guards swapping in a new version
+        self.load_lock = threading.Lock()  # Serializes the first load
+
+
+class ModelRegistry:
+    """Load each model artifact once per process and hot-swap new versions"""
+
+    def __init__(self, check_interval=5.0):
+        self.check_interval = check_interval
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, path, loader=None):
+        """Register an artifact under a name; ``loader`` defaults from the file extension"""
+        loader = loader or EXTENSION_LOADERS.get(os.path.splitext(path)[1].lower(), 'pickle')
+        if loader not in LOADERS:
+            raise ValueError(f"Unknown loader '{loader}' for {path}")
+
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None or entry.path != path or entry.loader != loader:
+                self._entries[name] = ModelEntry(name, path, loader)
+        return name
+
+    def _entry(self, name):
+        entry = self._entries.get(name)
+        if entry is None:
+            if name in DEFAULT_ARTIFACTS:
+                self.register(name, *DEFAULT_ARTIFACTS[name])
+            else:
+                # Unknown names are treated as file paths
+                self.register(name, name)
+            entry = self._entries[name]
+        return entry
+
+    def _load(self, entry):
+        """Load the artifact from disk and swap it in"""
+        signature = _file_signature(entry.path)
+        rss_before = resident_memory()
+        start = time.perf_counter()
+
+        model = LOADERS[entry.loader](entry.path)
+
+        load_seconds = time.perf_counter() - start
+        rss_after = resident_memory()
+
+        # Swap under the lock so readers see either the old or the new version, never a mix
+        with entry.lock:
+            entry.model = model
+            entry.signature = signature
+            entry.version += 1
+            entry.load_seconds = load_seconds
+            entry.resident_bytes = (rss_after - rss_before) if rss_before is not None and rss_after is not None else None
+            entry.loaded_at = time.time()
+            entry.error = None
+        print(f"✓ Loaded {entry.name} v{entry.version} from {entry.path} in {load_seconds:.2f}s")
+
+    def _reload_in_background(self, entry):
+        def reload():
+            try:
+                self._load(entry)
+            except Exception as e:
+                # Keep serving the previous version; a later change triggers another attempt
+                entry.error = str(e)
+                print(f"✗ Reloading {entry.name} failed: {e}")
+            finally:
+                entry.reloading = False
+
+        entry.reloading = True
+        threading.Thread(target=reload, name=f"reload-{entry.name}", daemon=True).start()
+
+    def get(self, name):
+        """Return the current version of an artifact, loading it on first use"""
+        entry = self._entry(name)
+
+        if entry.model is None:
+            # First load is synchronous; FileNotFoundError propagates to the caller
+            with entry.load_lock:
+                if entry.model is None:
+                    self._load(entry)
+                    entry.last_checked = time.monotonic()
+            return entry.model
+
+        now = time.monotonic()
+        if now - entry.last_checked >= self.check_interval and not entry.reloading:
+            entry.last_checked = now
+            try:
+                if _file_signature(entry.path) != entry.signature:
+                    self._reload_in_background(entry)
+            except OSError:
+                pass  # File temporarily missing while being replaced
+
+        return entry.model
+
+    def preload(self, names=None):
+        """Load artifacts up front, e.g. before forking worker processes
+
+        Missing files are skipped. Returns the names that were loaded.
+        """
+        loaded = []
+        for name in names or list(DEFAULT_ARTIFACTS):
+            entry = self._entry(name)
+            if not os.path.exists(entry.path):
+                continue
+            try:
+                self.get(name)
+                loaded.append(name)
+            except Exception as e:
+                print(f"✗ Could not preload {name}: {e}")
+        return loaded
+
+    def stats(self):
+        """Per-model version, load time and resident size"""
+        return {
+            name: {
+                'path': entry.path,
+                'loader': entry.loader,
+                'version': entry.version,
+                'loaded': entry.model is not None,
+                'load_seconds': entry.load_seconds,
+                'resident_bytes': entry.resident_bytes,
+                'file_bytes': entry.signature[1] if entry.signature else None,
+                'loaded_at': entry.loaded_at,
+                'error': entry.error,
+            }
+            for name, entry in self._entries.items()
+        }
+
+    def report(self):
+        """Print a load time / resident size table for the loaded models"""
+        print(f"{'MODEL':<20} {'VERSION':>7} {'LOAD (s)':>9} {'RSS (MB)':>9} {'FILE (MB)':>10}")
+        for name, stat in self.stats().items():
+            if not stat['loaded']:
+                continue
+            rss = f"{stat['resident_bytes'] / 2**20:.1f}" if stat['resident_bytes'] is not None else "n/a"
+            print(f"{name:<20} {stat['version']:>7} {stat['load_seconds']:>9.2f} {rss:>9} "
+                  f"{stat['file_bytes'] / 2**20:>10.1f}")
+
+
+# Shared registry for this process
+registry = ModelRegistry()
+
+
+def get_model(name):
+    """Return an artifact from the process-wide registry"""
+    return registry.get(name)
@@ -0,0 +1,325 @@
+"""OCR for uploaded lab-result images.
+
+Pages are preprocessed like processed_ocr_image.png (grayscale, Otsu
+binarization). Large pages are cut into horizontal regions at blank rows and
+recognized in parallel on a persistent worker pool. Results are cached by a
+content hash of the image bytes, in memory and on disk, so a re-uploaded scan
+skips Tesseract entirely. Lab values are pulled out of the text in one pass
+with a single precompiled pattern covering every supported analyte.
+
+Tesseract itself only stays warm with the optional ``tesserocr`` package
+(one initialized API per worker thread; it needs the Tesseract development
+headers to build, so it is not in requirements.txt). With ``pytesseract``,
+the default, every region still starts a ``tesseract`` process: regions run
+in parallel, but ``warm_up()`` only starts the pool threads.
+"""
+import os
+import re
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from tracing import span
+
+try:
+    import tesserocr  # Optional: one initialized Tesseract per thread instead of a process per call
+except ImportError:
+    tesserocr = None
+
+# Canonical lab name (as used in patient_data['lab_results']) -> spellings found on lab sheets
+ANALYTES = {
+    'glucose': ['glucose', 'blood glucose', 'fasting glucose', 'glu'],
+    'hba1c': ['hba1c', 'hemoglobin a1c', 'haemoglobin a1c', 'a1c'],
+    'hemoglobin': ['hemoglobin', 'haemoglobin', 'hgb', 'hb'],
+    'hematocrit': ['hematocrit', 'haematocrit', 'hct'],
+    'white_blood_cells': ['white blood cell count', 'white blood cells', 'white blood cell', 'wbc count', 'wbc',
+                          'leukocytes'],
+    'red_blood_cells': ['red blood cell count', 'red blood cells', 'red blood cell', 'rbc count', 'rbc'],
+    'platelets': ['platelet count', 'platelets', 'plt'],
+    'creatinine': ['creatinine', 'creat'],
+    'urea': ['blood urea nitrogen', 'urea nitrogen', 'urea', 'bun'],
+    'sodium': ['sodium'],
+    'potassium': ['potassium'],
+    'chloride': ['chloride'],
+    'lactate': ['lactate', 'lactic acid'],
+    'cholesterol': ['total cholesterol', 'cholesterol'],
+    'ALT': ['alanine aminotransferase', 'alt', 'sgpt'],
+    'AST': ['aspartate aminotransferase', 'ast', 'sgot'],
+    'ALP': ['alkaline phosphatase', 'alp'],
+    'bilirubin': ['total bilirubin', 'bilirubin'],
+    'albumin': ['albumin'],
+    'TSH': ['thyroid stimulating hormone', 'tsh'],
+    'FT4': ['free thyroxine', 'free t4', 'ft4'],
+    'troponin': ['troponin i', 'troponin t', 'troponin'],
+}
+
+_LABEL_TO_ANALYTE = {label: name for name, labels in ANALYTES.items() for label in labels}
+
+
+def _trie_regex(words):
+    """Alternation of ``words`` factored into a prefix trie ("hb(?:a1c)?" instead of "hba1c|hb")
+
+    Python's re tries alternatives one by one at every position; sharing
+    prefixes lets a position be rejected after a character or two.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node):
+        ends = '' in node
+        branches = [(r'\s+' if char == ' ' else re.escape(char)) + build(child)
+                    for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if ends:
+            # Greedy optional group: the longest spelling is tried first
+            return body + '?' if len(branches) == 1 and len(body) == 1 else f'(?:{body})?'
+        return body
+
+    return build(trie)
+
+
+_LAB_PATTERN = re.compile(
+    r'(?<![a-z])\(?(?P<label>' + _trie_regex(_LABEL_TO_ANALYTE) + r')\)?'
+    r'(?![a-z])'
+    r'(?:[^\S\n]*\([^)\n]*\))?'                            # "Alanine Aminotransferase (ALT)"
+    r'[^\S\n]*[:=]?\s*'                                    # Separator, possibly a line break
+    r'(?P<value>[-+]?\d+(?:[.,]\d+)?)'
+    r'(?:[^\S\n]*(?P<unit>%|x?10\^\d+/[a-zµ]+|[a-zµ]*/[a-zµ0-9]+|fl|pg))?',
+    re.IGNORECASE,
+)
+
+
+def parse_lab_values(text):
+    """Extract {canonical lab name: {'value', 'unit'}} from OCR text in a single scan
+
+    The first reading of each analyte wins; reference ranges following the
+    result are not picked up because only the number right after the label is.
+    """
+    values = {}
+    for match in _LAB_PATTERN.finditer(text):
+        name = _LABEL_TO_ANALYTE[' '.join(match.group('label').lower().split())]
+        if name not in values:
+            values[name] = {'value': float(match.group('value').replace(',', '.')), 'unit': match.group('unit') or ''}
+    return values
+
+
+def content_hash(data):
+    """sha256 of raw image bytes, or of an array's shape and pixels"""
+    digest = hashlib.sha256()
+    if isinstance(data, np.ndarray):
+        digest.update(repr((data.shape, data.dtype.str)).encode())
+        data = np.ascontiguousarray(data)
+    digest.update(data)
+    return digest.hexdigest()
+
+
+def _read_image(image):
+    """Return (bytes or array to hash, grayscale array) for a path, bytes or array"""
+    if isinstance(image, np.ndarray):
+        gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        return image, gray
+    if isinstance(image, (str, os.PathLike)):
+        with open(image, 'rb') as f:
+            image = f.read()
+    gray = cv2.imdecode(np.frombuffer(image, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        raise ValueError("Could not decode the uploaded image")
+    return image, gray
+
+
+class OCREngine:
+    """Lab-sheet OCR with a persistent worker pool, region splitting and a content-hash cache"""
+
+    def __init__(self, workers=None, cache_dir="ocr_cache", memory_entries=256, min_region_height=300,
+                 lang="eng", config="--psm 6"):
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.cache_dir = cache_dir
+        self.memory_entries = memory_entries
+        self.min_region_height = min_region_height
+        self.lang = lang
+        self.config = config
+        # Cached results are only reused by an engine with the same recognition settings
+        self.signature = f"{lang}|{config}|{min_region_height}"
+
+        self._executor = None
+        self._local = threading.local()
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.regions = 0
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    if self.workers > 1:
+                        # Tesseract's own OpenMP threads would compete with the region workers. Read by the
+                        # tesseract processes pytesseract starts and by tesserocr's first API, both created later
+                        os.environ.setdefault('OMP_THREAD_LIMIT', '1')
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ocr")
+        return self._executor
+
+    def warm_up(self):
+        """Start every worker before the first upload (and load Tesseract in it with tesserocr)"""
+        blank = np.full((32, 32), 255, dtype=np.uint8)
+        for future in [self.executor.submit(self._recognize_region, blank) for _ in range(self.workers)]:
+            future.result()
+
+    def _recognize_region(self, region):
+        """Run Tesseract on one binarized region (called on a pool thread)"""
+        if tesserocr is not None:
+            api = getattr(self._local, 'api', None)
+            if api is None:
+                api = self._local.api = tesserocr.PyTessBaseAPI(lang=self.lang, psm=tesserocr.PSM.SINGLE_BLOCK)
+            from PIL import Image
+            api.SetImage(Image.fromarray(region))
+            return api.GetUTF8Text()
+
+        import pytesseract
+        try:
+            return pytesseract.image_to_string(region, lang=self.lang, config=self.config)
+        except pytesseract.TesseractNotFoundError:
+            raise RuntimeError("Tesseract OCR is not installed (see 'Installing Tesseract OCR' in README.md)")
+
+    @staticmethod
+    def preprocess(gray):
+        """Binarize a grayscale page for OCR (dark text on white)"""
+        if gray.shape[0] < 1000:
+            # Tesseract prefers ~30 px capital letters; small phone scans are upscaled
+            gray = cv2.resize(gray, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
+        _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        return binary
+
+    def split_regions(self, binary):
+        """Cut the page into up to ``workers`` horizontal bands at blank rows
+
+        Cuts only fall on rows without ink, so no text line is split between
+        two regions. Pages shorter than two minimum regions stay whole.
+        """
+        height = binary.shape[0]
+        n_regions = min(self.workers, height // self.min_region_height)
+        if n_regions < 2:
+            return [binary]
+
+        blank_rows = np.flatnonzero((binary < 128).sum(axis=1) == 0)
+        if len(blank_rows) == 0:
+            return [binary]
+
+        bounds = [0]
+        for target in np.linspace(0, height, n_regions + 1)[1:-1]:
+            cut = blank_rows[np.abs(blank_rows - target).argmin()]
+            if cut - bounds[-1] >= self.min_region_height // 2:
+                bounds.append(int(cut))
+        bounds.append(height)
+        return [binary[top:bottom] for top, bottom in zip(bounds[:-1], bounds[1:])]
+
+    def recognize(self, gray):
+        """OCR text of a grayscale page, regions recognized in parallel and joined in page order"""
+        regions = self.split_regions(self.preprocess(gray))
+        self.regions += len(regions)
+        if len(regions) == 1:
+            return self.executor.submit(self._recognize_region, regions[0]).result()
+        return "\n".join(self.executor.map(self._recognize_region, regions))
+
+    def _cache_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".json")
+
+    def _cache_get(self, key):
+        with self._lock:
+            result = self._memory.get(key)
+            if result is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return result
+        if self.cache_dir:
+            try:
+                with open(self._cache_path(key)) as f:
+                    result = json.load(f)
+            except (OSError, ValueError):
+                return None
+            self._cache_put(key, result, persist=False)
+            self.disk_hits += 1
+            return result
+        return None
+
+    def _cache_put(self, key, result, persist=True):
+        with self._lock:
+            self._memory[key] = result
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+        if persist and self.cache_dir:
+            path = self._cache_path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(result, f)
+            os.replace(tmp_path, path)
+
+    def process(self, image):
+        """OCR a lab image (path, bytes or array) into {'text', 'lab_values', 'hash', 'cached'}"""
+        raw, gray = _read_image(image)
+        key = content_hash(raw)
+        cache_key = hashlib.sha256(f"{key}|{self.signature}".encode()).hexdigest()
+
+        result = self._cache_get(cache_key)
+        if result is not None:
+            return dict(result, cached=True)
+
+        self.misses += 1
+        with span('ocr.recognize'):
+            text = self.recognize(gray)
+        result = {'text': text, 'lab_values': parse_lab_values(text), 'hash': key}
+        self._cache_put(cache_key, result)
+        return dict(result, cached=False)
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            'workers': self.workers,
+            'backend': 'tesserocr' if tesserocr is not None else 'pytesseract',
+            'memory_hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            'regions': self.regions,
+            'cached_entries': len(self._memory),
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine(**kwargs):
+    """Process-wide OCREngine (created on first use)"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = OCREngine(**kwargs)
+        return _engine
+
+
+def ocr_lab_image(image):
+    """Top-level OCR function, usable as the ChatPipeline ``ocr`` stage"""
+    return get_engine().process(image)
@@ -0,0 +1,13 @@
+"""Errors shared by the /chat pipeline stages and the clients they call.
+
+Kept apart from chat_pipeline.py so clients (llm_client.py) can raise them
+without importing the server module.
+"""
+
+
+class StageOverloaded(Exception):
+    """A stage is at capacity"""
+
+
+class StageTimeout(Exception):
+    """A stage did not finish within its timeout"""
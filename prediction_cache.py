@@ -0,0 +1,257 @@
+"""LRU + TTL cache for /chat disease predictions, keyed on normalized patient_data.
+
+Clinicians and the UI often resend the same labs/vitals while only the chat
+text changes. The prediction step only depends on ``lab_results`` and
+``signals``, so those are normalized (canonical names, canonical units,
+values rounded to SIGNIFICANT_DIGITS significant figures, sorted keys) and
+hashed into the cache key. Rounding only absorbs float noise from unit
+conversion: creatinine 0.96 and 1.04, or troponin 0.01 and 0.04, stay
+distinct. Cached entries are dropped automatically when any model artifact on
+disk changes, and are stored and returned as copies.
+"""
+import os
+import re
+import copy
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from model_registry import DEFAULT_ARTIFACTS, registry
+
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_TTL = 600.0  # seconds
+SIGNIFICANT_DIGITS = 4
+
+# Alternative spellings sent by the UI, mapped to the names in sample_patient_data.json
+ALIASES = {
+    'wbc': 'white_blood_cells',
+    'white_blood_cell_count': 'white_blood_cells',
+    'glu': 'glucose',
+    'blood_glucose': 'glucose',
+    'creat': 'creatinine',
+    'sgpt': 'ALT',
+    'alt': 'ALT',
+    'sgot': 'AST',
+    'ast': 'AST',
+    'sbp': 'blood_pressure_systolic',
+    'systolic_bp': 'blood_pressure_systolic',
+    'dbp': 'blood_pressure_diastolic',
+    'diastolic_bp': 'blood_pressure_diastolic',
+    'hr': 'heart_rate',
+    'pulse': 'heart_rate',
+    'rr': 'respiratory_rate',
+    'resp_rate': 'respiratory_rate',
+    'temp': 'temperature',
+    'spo2': 'oxygen_saturation',
+    'o2_sat': 'oxygen_saturation',
+}
+
+
+def _fahrenheit_to_celsius(value):
+    return (value - 32) * 5 / 9
+
+
+# (canonical name, unit as sent) -> conversion into the canonical unit
+UNIT_CONVERSIONS = {
+    ('temperature', 'f'): _fahrenheit_to_celsius,
+    ('temperature', '°f'): _fahrenheit_to_celsius,
+    ('glucose', 'mmol/l'): lambda v: v * 18.016,            # -> mg/dL
+    ('creatinine', 'umol/l'): lambda v: v / 88.42,          # -> mg/dL
+    ('creatinine', 'µmol/l'): lambda v: v / 88.42,
+    ('white_blood_cells', '/ul'): lambda v: v / 1000,       # -> 10^3/uL
+    ('white_blood_cells', 'cells/ul'): lambda v: v / 1000,
+    ('oxygen_saturation', 'fraction'): lambda v: v * 100,   # -> %
+}
+
+_NUMBER_WITH_UNIT = re.compile(r'^\s*([-+]?\d*\.?\d+(?:[eE][-+]?\d+)?)\s*(.*?)\s*$')
+
+
+def canonical_name(name):
+    """Canonical field name: lowercase snake_case with aliases resolved"""
+    key = re.sub(r'[\s\-]+', '_', str(name).strip()).lower()
+    return ALIASES.get(key, key)
+
+
+def canonical_value(name, value):
+    """Convert a value (number, "98.6 F" string or {'value', 'unit'} dict) to the canonical unit"""
+    unit = ''
+    if isinstance(value, dict):
+        value, unit = value.get('value'), value.get('unit') or ''
+    if isinstance(value, str):
+        match = _NUMBER_WITH_UNIT.match(value)
+        if not match:
+            return value.strip().lower()
+        value, unit = match.group(1), match.group(2) or unit
+    if value is None or isinstance(value, bool):
+        return value
+
+    value = float(value)
+    unit = unit.strip().lower()
+    convert = UNIT_CONVERSIONS.get((name, unit))
+    if convert is not None:
+        value = convert(value)
+    elif name == 'temperature' and value > 45:
+        value = _fahrenheit_to_celsius(value)  # No unit given, but clearly Fahrenheit
+    elif name == 'oxygen_saturation' and 0 < value <= 1:
+        value *= 100
+    return round_significant(value)
+
+
+def round_significant(value, digits=SIGNIFICANT_DIGITS):
+    """Round to ``digits`` significant figures, whatever the analyte's magnitude"""
+    return float(f"{value:.{digits}g}")
+
+
+def normalize_patient_data(patient_data):
+    """The part of patient_data the prediction step depends on, in canonical form"""
+    patient_data = patient_data or {}
+    normalized = {}
+    for section in ('lab_results', 'signals'):
+        values = patient_data.get(section) or {}
+        normalized[section] = {
+            canonical_name(name): canonical_value(canonical_name(name), value)
+            for name, value in values.items()
+        }
+    return normalized
+
+
+def cache_key(patient_data, namespace="disease"):
+    """Canonical hash of the normalized lab_results/signals"""
+    payload = json.dumps(normalize_patient_data(patient_data), sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(f"{namespace}|{payload}".encode("utf-8")).hexdigest()
+
+
+def artifact_paths():
+    """Model artifact files whose changes invalidate cached predictions"""
+    paths = {path for path, _ in DEFAULT_ARTIFACTS.values()}
+    paths.update(stat['path'] for stat in registry.stats().values())
+    return sorted(paths)
+
+
+def artifacts_signature(paths):
+    """(path, mtime, size) for each artifact that exists"""
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        signature.append((path, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+class PredictionCache:
+    """Bounded LRU cache with per-entry TTL, invalidated when model artifacts change"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL, check_interval=5.0, watch_paths=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self.watch_paths = watch_paths
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._signature = None
+        self._last_checked = 0.0
+        self._generation = 0  # Bumped on every invalidation
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _check_artifacts(self, now):
+        """Clear the cache when a model artifact changed since the last check"""
+        if now - self._last_checked < self.check_interval:
+            return
+        self._last_checked = now
+        signature = artifacts_signature(self.watch_paths or artifact_paths())
+        if self._signature is not None and signature != self._signature:
+            self._entries.clear()
+            self._generation += 1
+            self.invalidations += 1
+            print("✓ Model artifacts changed, prediction cache cleared")
+        self._signature = signature
+
+    def get(self, key):
+        """Return a copy of the cached value for a key, or None"""
+        now = time.monotonic()
+        with self._lock:
+            self._check_artifacts(now)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] < now:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return copy.deepcopy(entry[1])
+
+    def put(self, key, value, generation=None):
+        """Store a value, evicting the least recently used entry when full
+
+        ``generation`` (from ``generation()`` before computing the value) drops
+        results computed with models that were replaced in the meantime.
+        """
+        now = time.monotonic()
+        value = copy.deepcopy(value)  # Later changes to the caller's result must not reach the cache
+        with self._lock:
+            self._check_artifacts(now)
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[key] = (now + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def key(self, patient_data, namespace="disease"):
+        return cache_key(patient_data, namespace)
+
+    def get_or_compute(self, patient_data, compute, namespace="disease"):
+        """Return the cached prediction for patient_data, running ``compute(patient_data)`` on a miss"""
+        key = self.key(patient_data, namespace)
+        generation = self.generation()
+        value = self.get(key)
+        if value is None:
+            value = compute(patient_data)
+            self.put(key, value, generation)
+        return value
+
+    def generation(self):
+        return self._generation
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+    def stats(self):
+        """Hit/miss/eviction counters and current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
+
+
+# Shared cache for this process
+prediction_cache = PredictionCache()
+
+
+def cached_prediction(patient_data, compute, namespace="disease"):
+    """Disease predictions for patient_data through the process-wide cache"""
+    return prediction_cache.get_or_compute(patient_data, compute, namespace)
@@ -3,25 +3,44 @@ import sys
 import platform
 import subprocess
 import shutil
-import importlib.util
-import uvicorn
 from dotenv import load_dotenv
 
+from warmup import SERVER_DEPENDENCIES, missing_dependencies
+
 # Load environment variables
 load_dotenv()
 
+def check_dependencies():
+    """Check the server's dependencies exist without importing them."""
+    missing = missing_dependencies(SERVER_DEPENDENCIES)
+    if missing:
+        print(f"✗ Missing dependencies: {', '.join(missing)}")
+        print("Please run: pip install -r requirements.txt")
+        return False
+    optional = missing_dependencies()
+    if optional:
+        print(f"Warning: {', '.join(optional)} not installed; the features using them will be unavailable")
+    return True
+
 def main():
     """Main entry point for running the API server."""
+    if not check_dependencies():
+        return 1
+
+    import uvicorn
+
     # Get configuration from environment variables
     host = os.getenv("API_HOST", "127.0.0.1")
     port = int(os.getenv("API_PORT", "8090"))
+    # The reloader watches the source tree and re-imports the app on every change; development only
+    reload = os.getenv("API_RELOAD", "0").lower() in ("1", "true", "yes")
     
     # Start the server
     uvicorn.run(
         "backend.main:app",
         host=host,
         port=port,
-        reload=True,
+        reload=reload,
         log_level="info"
     )
     
@@ -32,6 +32,7 @@ def install_python_dependencies(venv_path):
     requirements = [
         "fastapi==0.109.0",
         "uvicorn==0.27.0",
+        "httpx==0.26.0",
         "python-multipart==0.0.6",
         "numpy==1.24.3",
         "pandas==2.0.3",
@@ -6,23 +6,19 @@ import signal
 import atexit
 from pathlib import Path
 
+from warmup import FRONTEND_DEPENDENCIES, SERVER_DEPENDENCIES, missing_dependencies
+
 def check_dependencies():
-    """Check if all required dependencies are installed."""
-    try:
-        import numpy
-        import pandas
-        import torch
-        import transformers
-        import streamlit
-        import fastapi
-        import uvicorn
-        import spacy
-        import nltk
-        print("✓ All Python dependencies are installed")
-    except ImportError as e:
-        print(f"✗ Missing dependency: {e}")
+    """Check if all required dependencies are installed (without importing them)."""
+    missing = missing_dependencies([*SERVER_DEPENDENCIES, *FRONTEND_DEPENDENCIES])
+    if missing:
+        print(f"✗ Missing dependencies: {', '.join(missing)}")
         print("Please run setup_chatbot.ps1 first")
         sys.exit(1)
+    optional = missing_dependencies()
+    if optional:
+        print(f"Warning: {', '.join(optional)} not installed; the features using them will be unavailable")
+    print("✓ All Python dependencies are installed")
 
 def check_model_files():
     """Check if all required model files exist."""
@@ -0,0 +1,120 @@
+import os
+import json
+import pickle
+import sqlite3
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+import batch_score
+
+class StubECGModel:
+    """Keras-style predict over (N, 1000, 12) signals: class 1 when the mean amplitude is positive."""
+
+    def predict(self, X, batch_size=None, verbose=0):
+        positive = X.mean(axis=(1, 2)) > 0
+        return np.column_stack([np.where(positive, 0.2, 0.8), np.where(positive, 0.8, 0.2)])
+
+def write_records(record_dir, offsets):
+    """Tiny 100 Hz, 12-lead WFDB records named 00001, 00002, ... shifted by each offset."""
+    import wfdb
+
+    os.makedirs(record_dir)
+    rng = np.random.default_rng(len(offsets))
+    for i, offset in enumerate(offsets, start=1):
+        wfdb.wrsamp(f"{i:05d}", fs=100, units=['mV'] * 12, sig_name=[f"lead{j}" for j in range(12)],
+                    p_signal=rng.normal(offset, 0.1, size=(1000, 12)), write_dir=record_dir)
+
+def train_disease_model(path):
+    """A small forest fitted like Merged_signals.ipynb, saved with joblib."""
+    import joblib
+    from sklearn.ensemble import RandomForestClassifier
+    from disease_dataset import load_training_data
+
+    X, y, _, merged = load_training_data()
+    model = RandomForestClassifier(n_estimators=20, class_weight="balanced", random_state=42).fit(X, y)
+    joblib.dump(model, path)
+    return model, X, merged
+
+def read_parts(output_dir):
+    parts = sorted(name for name in os.listdir(output_dir) if name.startswith("part-"))
+    return pd.concat([pd.read_csv(os.path.join(output_dir, name)) for name in parts], ignore_index=True)
+
+def count_rows(db_path, table):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+def test_batch_score():
+    """Sharded admission and ECG scoring match the models, resume after a stop and never duplicate rows."""
+    print("Testing batch scoring...")
+    n_admissions = len(pd.read_csv("master_features.csv", usecols=["hadm_id"]))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        model_path = os.path.join(tmp_dir, "disease_model.pkl")
+        db_path = os.path.join(tmp_dir, "medical_chatbot.db")
+        model, X, merged = train_disease_model(model_path)
+
+        def score(output, *extra):
+            return batch_score.main(["admissions", "--model", model_path, "--output", os.path.join(tmp_dir, output),
+                                     "--format", "csv", "--workers", "2", "--shard-size", "32", *extra])
+
+        assert score("full") == 0
+        full = read_parts(os.path.join(tmp_dir, "full"))
+        assert len(full) == n_admissions and full['hadm_id'].is_unique
+        print(f"✓ {len(full)} admissions scored in {-(-n_admissions // 32)} shards")
+
+        # Training admissions encode exactly as in the notebook (dummies, column order, SimpleImputer means)
+        expected = model.predict_proba(X)
+        scored = full.set_index("hadm_id").loc[merged['hadm_id']]
+        np.testing.assert_allclose(scored[[c for c in full.columns if c.startswith("p_")]].to_numpy(),
+                                   np.column_stack([p[:, 1] for p in expected]))
+        print(f"✓ Probabilities match the sklearn model on all {len(merged)} training admissions")
+
+        # Stop after two shards, then resume into the database
+        assert score("resumed", "--db", db_path, "--max-shards", "2") == 0
+        with open(os.path.join(tmp_dir, "resumed", "checkpoint.json")) as f:
+            checkpoint = json.load(f)
+        assert checkpoint['completed'] == [0, 1] and count_rows(db_path, "predictions") == 64
+        assert score("resumed", "--db", db_path, "--resume") == 0
+        resumed = read_parts(os.path.join(tmp_dir, "resumed"))
+        pd.testing.assert_frame_equal(resumed, full)
+        assert count_rows(db_path, "predictions") == n_admissions
+        print("✓ Resumed run skips finished shards and matches an uninterrupted run")
+
+        # A crash after a shard was written but before it was checkpointed: it is scored again without duplicates
+        checkpoint_path = os.path.join(tmp_dir, "resumed", "checkpoint.json")
+        with open(checkpoint_path) as f:
+            checkpoint = json.load(f)
+        checkpoint['completed'].remove(3)
+        with open(checkpoint_path, 'w') as f:
+            json.dump(checkpoint, f)
+        assert score("resumed", "--db", db_path, "--resume") == 0
+        assert count_rows(db_path, "predictions") == n_admissions
+        pd.testing.assert_frame_equal(read_parts(os.path.join(tmp_dir, "resumed")), full)
+        with sqlite3.connect(db_path) as conn:
+            data = json.loads(conn.execute("SELECT prediction_data FROM predictions LIMIT 1").fetchone()[0])
+        assert data['hadm_id'] in set(full['hadm_id'])
+        print("✓ Re-scoring a shard replaces its part file and database rows")
+
+        # ECG archives: records with the same name in two --input directories keep separate rows
+        ecg_dirs = [os.path.join(tmp_dir, "ward_a", "records100"), os.path.join(tmp_dir, "ward_b", "records100")]
+        write_records(ecg_dirs[0], [1.0, -1.0])
+        write_records(ecg_dirs[1], [-1.0])
+        stub_path = os.path.join(tmp_dir, "ecg_stub.pkl")
+        with open(stub_path, 'wb') as f:
+            pickle.dump(StubECGModel(), f)
+        assert batch_score.main(["ecg", "--input", *ecg_dirs, "--model", stub_path, "--output",
+                                 os.path.join(tmp_dir, "ecg"), "--format", "csv", "--workers", "1",
+                                 "--shard-size", "2", "--db", db_path]) == 0
+        ecg = read_parts(os.path.join(tmp_dir, "ecg"))
+        assert ecg['loaded'].all() and list(ecg['code']) == ["CLASS_1", "CLASS_0", "CLASS_0"]
+        with sqlite3.connect(db_path) as conn:
+            stored = conn.execute("SELECT patient_id, results FROM analysis_results WHERE analysis_type = 'ecg'"
+                                  ).fetchall()
+        assert len(stored) == 3 and len({patient_id for patient_id, _ in stored}) == 3
+        assert sorted(json.loads(results)['record'] for _, results in stored) == ["00001", "00001", "00002"]
+        print("✓ ECG records scored in shards; same-named records in two directories keep their own rows")
+
+if __name__ == "__main__":
+    test_batch_score()
@@ -0,0 +1,75 @@
+import json
+import time
+
+import httpx
+
+from chat_pipeline import ChatPipeline, create_app
+from llm_client import OllamaClient
+from llm_stub import REPORT, BackgroundServer, StubLLMServer
+
+PAYLOAD = {
+    "messages": [{"role": "user", "content": "I have chest pain and shortness of breath for 3 days."}],
+    "patient_data": {"lab_results": {"glucose": 130}, "symptoms_text": "chest pain and shortness of breath"},
+}
+
+def tabular(patient_data):
+    return [{'name': "Hypertension", 'probability': 0.72, 'summary': "Elevated blood pressure"}]
+
+def read_events(response):
+    """Yield (event, data, seconds since the request) from an SSE response."""
+    event = None
+    for line in response.iter_lines():
+        if line.startswith("event: "):
+            event = line[len("event: "):]
+        elif line.startswith("data: "):
+            yield event, json.loads(line[len("data: "):]), time.perf_counter()
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        assert time.perf_counter() < deadline, "condition not reached in time"
+        time.sleep(0.02)
+
+def test_chat_streaming():
+    """Predictions before the first token, full report, keep-alive reuse and cancellation on disconnect."""
+    print("Testing streaming /chat...")
+
+    with StubLLMServer(first_token_delay=0.5, token_delay=0.02) as llm_server:
+        llm = OllamaClient(llm_server.url, model="stub", max_concurrent=1)
+        with BackgroundServer(create_app(ChatPipeline(tabular=tabular, llm=llm))) as chat_server:
+            with httpx.Client(base_url=chat_server.url, timeout=30.0) as http:
+                start = time.perf_counter()
+                with http.stream("POST", "/chat/stream", json=PAYLOAD) as response:
+                    assert response.status_code == 200
+                    assert response.headers['content-type'].startswith("text/event-stream")
+                    events = list(read_events(response))
+                names = [event for event, _, _ in events]
+                assert names[0] == 'predictions' and names[-1] == 'done' and set(names[1:-1]) == {'token'}
+                assert events[0][1]['predictions'][0]['name'] == "Hypertension"
+                assert events[0][2] - start < 0.4, "predictions waited for the LLM"
+                assert events[1][2] - start >= 0.5
+                assert "".join(data['text'] for _, data, _ in events[1:-1]) == REPORT == events[-1][1]['report']
+                print(f"✓ Predictions after {(events[0][2] - start) * 1000:.0f} ms, "
+                      f"first token after {(events[1][2] - start) * 1000:.0f} ms, {len(events) - 2} tokens")
+
+                assert http.post("/chat", json=PAYLOAD).json()['report'] == REPORT
+                print("✓ Non-streaming /chat returns the whole report")
+
+                # Disconnect after the first token: the generation slot must free up at once
+                with http.stream("POST", "/chat/stream", json=PAYLOAD) as response:
+                    for event, _, _ in read_events(response):
+                        if event == 'token':
+                            break
+                wait_for(lambda: llm_server.stats()['abandoned'] == 1)
+                assert http.get("/pipeline/stats").json()['llm']['in_flight'] == 0
+                start = time.perf_counter()
+                assert http.post("/chat", json=PAYLOAD).json()['report'] == REPORT
+                assert time.perf_counter() - start < 2.0, "the slot was held by the abandoned generation"
+                print("✓ Client disconnect cancels the generation and frees the slot")
+
+                stats = llm_server.stats()
+                assert stats['requests'] == 4 and stats['connections'] <= 2, stats
+                print(f"✓ {stats['requests']} generations over {stats['connections']} keep-alive connection(s)")
+
+if __name__ == "__main__":
+    test_chat_streaming()
@@ -0,0 +1,70 @@
+import os
+import asyncio
+import tempfile
+
+from chat_database import ChatDatabase
+from conversation_context import ContextManager, extractive_summary
+
+def test_conversation_context():
+    """Check the rolling window, incremental summary, persistence and legacy bootstrap."""
+    print("Testing conversation context manager...")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = ChatDatabase(os.path.join(tmp_dir, "chat.db"))
+        assert db.version >= 3
+        manager = ContextManager(db, window_messages=4, summarize_batch=2)
+
+        async def converse(turns):
+            for i in range(turns):
+                context = manager.load("conv-1")
+                messages = [{'role': 'user', 'content': f"Turn {i}: my glucose was {100 + i}. Anything else?"},
+                            {'role': 'assistant', 'content': f"Answer {i}. Keep monitoring."}]
+                await manager.update(context, messages)
+                db.save_turns([{'conversation_id': "conv-1", 'messages': messages, 'context': context.state()}])
+            return context
+
+        context = asyncio.run(converse(20))
+        assert context.message_count == 40
+        assert 4 <= len(context.recent_messages) < 4 + 2
+        assert context.summarized_messages + len(context.recent_messages) == 40
+        assert context.recent_messages[-1]['content'] == "Answer 19. Keep monitoring."
+        assert "user: Turn 0: my glucose was 100." in context.summary
+        assert "Anything else" not in context.summary, "summary keeps more than the first sentence"
+        assert manager.stats()['summaries'] == 18
+        print(f"✓ Window of {len(context.recent_messages)} messages, {context.summarized_messages} summarized")
+
+        reloaded = ContextManager(db).load("conv-1")
+        assert reloaded.state() == context.state()
+        assert reloaded.render().startswith("Summary of earlier conversation (36 messages):")
+        print("✓ Context persisted on the conversation row and reloaded in one lookup")
+
+        db.save_turn("legacy", messages=[{'role': 'user', 'content': f"old message {i}."} for i in range(10)])
+        legacy = manager.load("legacy")
+        assert [m['content'] for m in legacy.recent_messages] == [f"old message {i}." for i in range(6, 10)]
+        assert legacy.message_count == 10 and legacy.summarized_messages == 6
+        assert "user: old message 0." in legacy.summary and "old message 6" not in legacy.summary
+        assert manager.stats()['bootstraps'] == 1
+        print("✓ Conversations without stored context start from their latest messages, older ones summarized")
+
+        # A failing summarizer keeps the turn and retries the fold on the next one
+        failures = []
+
+        async def flaky_summarize(summary, messages):
+            if not failures:
+                failures.append(messages)
+                raise RuntimeError("LLM overloaded")
+            return extractive_summary(summary, messages)
+
+        flaky = ContextManager(summarize=flaky_summarize, window_messages=4, summarize_batch=2)
+        context = flaky.load("conv-2")
+        for i in range(4):
+            asyncio.run(flaky.update(context, [{'role': 'user', 'content': f"Turn {i}."},
+                                               {'role': 'assistant', 'content': f"Answer {i}."}]))
+        assert len(failures) == 1 and flaky.stats()['summary_failures'] == 1
+        assert context.message_count == 8 and context.summarized_messages == 4 and len(context.recent_messages) == 4
+        assert context.summary.startswith("user: Turn 0.")
+        print("✓ A failed summary leaves the window unfolded and is retried on the next turn")
+        db.close()
+
+if __name__ == "__main__":
+    test_conversation_context()
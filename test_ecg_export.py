@@ -0,0 +1,61 @@
+import os
+import tempfile
+
+import numpy as np
+import tensorflow as tf
+
+from ecg_export import TFLiteModel, export_tflite, inference_model, parity_report
+
+def build_model():
+    """A small Conv1D/LSTM stack shaped like the ECG detector (12 leads, recurrent dropout)."""
+    layers = tf.keras.layers
+    return tf.keras.Sequential([
+        layers.Input(shape=(100, 12)),
+        layers.Conv1D(8, 5, activation='relu', padding='same'),
+        layers.BatchNormalization(),
+        layers.MaxPooling1D(2),
+        layers.LSTM(8, recurrent_dropout=0.3),
+        layers.Dense(4, activation='softmax'),
+    ])
+
+class Keras2Config:
+    """The model's config as Keras 2 (TF 2.15) writes it: the input shape under batch_input_shape."""
+
+    def __init__(self, model):
+        self.model = model
+
+    def get_config(self):
+        config = self.model.get_config()
+        for layer in config['layers']:
+            if 'batch_shape' in layer['config']:
+                layer['config']['batch_input_shape'] = layer['config'].pop('batch_shape')
+        return config
+
+    def get_weights(self):
+        return self.model.get_weights()
+
+def test_ecg_export():
+    """Inference clones accept both Keras config layouts; exported TFLite files match Keras predictions."""
+    print("Testing ECG TFLite export...")
+
+    model = build_model()
+    assert inference_model(model).input_shape == (1, 100, 12)
+    assert inference_model(Keras2Config(model)).input_shape == (1, 100, 12)
+    print("✓ Single-sample clone built from batch_shape and batch_input_shape configs")
+
+    X = np.random.default_rng(0).normal(size=(16, 100, 12)).astype(np.float32)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        candidates = {}
+        for name in ['float32', 'float16']:
+            path = os.path.join(tmp_dir, f"ecg_{name}.tflite")
+            export_tflite(model, path, None if name == 'float32' else name)
+            candidates[name] = TFLiteModel(path)
+        rows = {row['name']: row for row in parity_report(model, candidates, X)}
+
+    assert rows['float32']['max_prob_diff'] < 1e-5 and rows['float32']['agreement'] == 1.0
+    assert rows['float16']['max_prob_diff'] < 1e-2
+    print(f"✓ TFLite predictions match Keras (float32 max diff {rows['float32']['max_prob_diff']:.1e}, "
+          f"float16 {rows['float16']['max_prob_diff']:.1e})")
+
+if __name__ == "__main__":
+    test_ecg_export()
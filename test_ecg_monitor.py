@@ -0,0 +1,88 @@
+import time
+
+import numpy as np
+
+from ecg_monitor import ECGMonitor, PatientStream, add_monitor_routes
+
+CLASSES = ['NORM', 'MI', 'STTC', 'AFIB']
+
+def synthetic_ecg(seconds, heart_rate, sampling_rate, seed=0):
+    """12-lead beats with noise and baseline wander."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sampling_rate)) / sampling_rate
+    phase = (t * heart_rate / 60) % 1.0
+    beat = np.exp(-((phase - 0.3) / 0.015) ** 2) + 0.2 * np.exp(-((phase - 0.6) / 0.05) ** 2)
+    wander = 0.3 * np.sin(2 * np.pi * 0.2 * t)
+    signal = beat[:, None] * rng.uniform(0.5, 1.5, 12) + wander[:, None] + rng.normal(0, 0.03, (len(t), 12))
+    return signal.astype(np.float32)
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        assert time.perf_counter() < deadline, "condition not reached in time"
+        time.sleep(0.02)
+
+def test_ecg_monitor():
+    """Chunked ingestion matches whole-record processing; model and heart-rate alerts fire once per episode."""
+    print("Testing streaming ECG monitor...")
+
+    # Windows are exact slices of the stream, every stride, whatever the chunk size
+    signal = synthetic_ecg(30, 70, 100)
+    stream = PatientStream("p", sampling_rate=100, stride_seconds=2.5)
+    windows = []
+    for start in range(0, len(signal), 37):
+        windows += stream.ingest(signal[start:start + 37])[1]
+    assert [end for end, _ in windows] == list(range(1000, 3001, 250))
+    for end, window in windows:
+        np.testing.assert_array_equal(window, signal[end - 1000:end])
+    print(f"✓ {len(windows)} overlapping windows, identical to slices of the stream")
+
+    # Carried filter state: a 500 Hz stream in 20-sample chunks decimates like the whole stream at once
+    signal = synthetic_ecg(20, 70, 500)
+    chunked, whole = PatientStream("p", sampling_rate=500), PatientStream("p", sampling_rate=500)
+    for start in range(0, len(signal), 20):
+        chunked.ingest(signal[start:start + 20])
+    whole.ingest(signal)
+    assert chunked.n_samples == whole.n_samples == 2000
+    np.testing.assert_allclose(chunked.window_at(2000), whole.window_at(2000), atol=1e-4)
+    assert chunked.tracker.n_peaks == whole.tracker.n_peaks
+    print(f"✓ Chunked decimation and filtering match the whole stream ({chunked.tracker.n_peaks} R-peaks)")
+
+    # The model says MI from the 20th second of signal on
+    def predict_batch(batch):
+        mi = batch[:, :, 0].mean(axis=1) > 5.0
+        return np.where(mi[:, None], [0.1, 0.8, 0.05, 0.05], [0.9, 0.05, 0.03, 0.02])
+
+    alerts = []
+    monitor = ECGMonitor(predict_batch, CLASSES, stride_seconds=1.0, confirm_windows=2, max_wait_ms=1.0)
+    monitor.subscribe(alerts.append)
+    signal = np.concatenate([synthetic_ecg(30, 70, 500), synthetic_ecg(25, 170, 500, seed=1)])
+    signal[20 * 500:30 * 500, 0] += 20.0
+    for start in range(0, len(signal), 20):
+        monitor.ingest("bed-1", signal[start:start + 20], sampling_rate=500)
+    wait_for(lambda: monitor.stats()['batcher']['samples'] == monitor.windows)
+
+    codes = [alert['code'] for alert in alerts]
+    assert codes.count('MI') == 1 and codes.count('TACHY') == 1, alerts
+    mi = next(alert for alert in alerts if alert['code'] == 'MI')
+    tachy = next(alert for alert in alerts if alert['code'] == 'TACHY')
+    assert mi['source'] == 'model' and 20 < mi['stream_time'] <= 27, mi
+    assert tachy['source'] == 'rhythm' and 30 < tachy['stream_time'] < 36, tachy
+    status = monitor.status("bed-1")
+    assert abs(status['heart_rate'] - 170) < 5 and status['last_prediction']['code'] == 'NORM'
+    print(f"✓ MI alert at {mi['stream_time']:.1f}s, TACHY alert at {tachy['stream_time']:.1f}s, "
+          f"no repeats within the cooldown")
+
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    with TestClient(add_monitor_routes(FastAPI(), monitor)) as http:
+        chunk = synthetic_ecg(3, 60, 100)
+        assert http.post("/monitor/bed-2/samples", json={'samples': chunk.tolist()}).json()['stream_seconds'] == 3.0
+        assert http.get("/monitor/bed-2").json()['heart_rate'] is not None
+        assert http.post("/monitor/bed-2/samples", json={'samples': [[0.0] * 5]}).status_code == 422
+        assert http.delete("/monitor/bed-2").status_code == 200
+        assert http.get("/monitor/bed-2").status_code == 404
+    print("✓ HTTP ingestion and status routes")
+
+if __name__ == "__main__":
+    test_ecg_monitor()
@@ -0,0 +1,68 @@
+import zlib
+import asyncio
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from embedding_service import EmbeddingService, normalize_text
+
+class CountingEncoder:
+    """Deterministic stand-in for the sentence encoder that records every call."""
+
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, texts):
+        with self.lock:
+            self.calls.append(list(texts))
+        return np.stack([np.random.default_rng(zlib.crc32(text.encode())).normal(size=16) for text in texts])
+
+def test_embedding_service():
+    """Check normalization, both cache tiers, model-version keys and cross-request batching."""
+    print("Testing embedding service...")
+
+    assert normalize_text("  Chest PAIN\tand  shortness of breath. ") == "chest pain and shortness of breath"
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        encoder = CountingEncoder()
+        service = EmbeddingService(encoder, "fake-v1", cache_dir=cache_dir, max_wait_ms=20)
+        vectors = service.encode(["Chest pain and shortness of breath", "chest pain and shortness of breath!", "Fever"])
+        assert vectors.shape == (3, 16) and vectors.dtype == np.float32
+        assert np.array_equal(vectors[0], vectors[1])
+        assert encoder.calls == [["chest pain and shortness of breath", "fever"]]
+        service.encode("fever")
+        assert len(encoder.calls) == 1 and service.stats()['memory_hits'] == 1
+        print("✓ Near-identical phrasings share one encode and the memory tier")
+
+        with ThreadPoolExecutor(8) as executor:
+            list(executor.map(service.encode, [f"symptom {i % 12}" for i in range(48)]))
+        assert sum(len(call) for call in encoder.calls[1:]) == 12, "a phrase was encoded twice"
+        assert len(encoder.calls) - 1 < 12, "concurrent misses were not batched"
+        print(f"✓ 12 concurrent phrases encoded in {len(encoder.calls) - 1} batched calls")
+
+        restarted = EmbeddingService(encoder, "fake-v1", cache_dir=cache_dir)
+        assert np.array_equal(restarted.encode("FEVER"), vectors[2])
+        assert restarted.stats()['disk_hits'] == 1 and len(encoder.calls) < 13
+        print("✓ Disk tier survives a restart")
+
+        calls = len(encoder.calls)
+        EmbeddingService(encoder, "fake-v2", cache_dir=cache_dir).encode("fever")
+        assert len(encoder.calls) == calls + 1, "cache reused across model versions"
+        print("✓ New model version misses the cache")
+
+        async def cancel_one_of_two():
+            shared = EmbeddingService(encoder, "fake-v1", cache_dir=None, max_wait_ms=100)
+            first = asyncio.ensure_future(shared.encode_async("palpitations"))
+            second = asyncio.ensure_future(shared.encode_async("palpitations"))
+            await asyncio.sleep(0.01)
+            first.cancel()
+            return await second
+
+        assert asyncio.run(cancel_one_of_two()).shape == (16,)
+        print("✓ Cancelling one awaiter leaves the shared in-flight encode to the other")
+
+if __name__ == "__main__":
+    test_embedding_service()
@@ -0,0 +1,59 @@
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from disease_dataset import build_training_data, latest_lab_values
+from feature_store import FeatureStore
+
+def test_feature_store():
+    """Check incremental feature store builds against the Merged_signals pandas pipeline."""
+    print("Testing incremental feature store...")
+
+    signals_df = pd.read_csv("master_features.csv")
+    diagnoses_df = pd.read_csv("DIAGNOSES_ICD.csv", dtype={"icd9_code": str})
+
+    # OCR lab results with repeated measurements; only the latest charttime should be kept
+    rng = np.random.default_rng(0)
+    ocr_data = [
+        {'hadm_id': int(hadm_id), 'lab_results': [
+            {'label': label, 'value': float(rng.normal(10, 2)), 'charttime': f"2130-01-0{day} 08:00:00"}
+            for label in ['WBC', 'Hemoglobin', 'Glucose'] for day in (3, 1, 2) if rng.random() > 0.2
+        ]}
+        for hadm_id in signals_df["hadm_id"]
+    ]
+    X_ref, y_ref, mlb_ref, merged = build_training_data(
+        signals_df, diagnoses_df, latest_lab_values(ocr_data), min_label_count=30)
+
+    with tempfile.TemporaryDirectory() as store_dir:
+        # Ingest in interleaved appends, then reopen from disk
+        half = len(signals_df) // 2
+        store = FeatureStore(store_dir)
+        store.ingest_labs(ocr_data[half:])
+        store.ingest_features(signals_df.iloc[:half])
+        store.ingest_diagnoses(diagnoses_df)
+        store.ingest_features(signals_df.iloc[half:])
+        store.ingest_labs(ocr_data[:half])
+        store.ingest_labs(ocr_data)  # Re-ingesting the same results changes nothing
+
+        X, y, mlb, hadm_ids = FeatureStore(store_dir).training_data(min_label_count=30)
+
+        order = pd.Series(np.arange(len(hadm_ids)), index=hadm_ids)[merged["hadm_id"]].to_numpy()
+        assert list(X.columns) == list(X_ref.columns), "columns differ"
+        assert list(mlb.classes_) == list(mlb_ref.classes_), "label classes differ"
+        max_diff = np.abs(X.to_numpy()[order] - X_ref.to_numpy(dtype=np.float64)).max()
+        assert max_diff < 1e-9, f"features differ by {max_diff}"
+        assert (y[order] == y_ref).all(), "labels differ"
+        print(f"✓ {X.shape[0]} admissions x {X.shape[1]} features match the pandas pipeline")
+
+        # Single-admission update: a newer lab result replaces the stored value
+        hadm_id = int(signals_df["hadm_id"][0])
+        store.ingest_labs([{'hadm_id': hadm_id, 'lab_results': [
+            {'label': 'WBC', 'value': 42.0, 'charttime': "2130-02-01 08:00:00"}]}])
+        store.ingest_labs([{'hadm_id': hadm_id, 'lab_results': [
+            {'label': 'WBC', 'value': 1.0, 'charttime': "2130-01-15 08:00:00"}]}])
+        assert FeatureStore(store_dir).get(hadm_id)["WBC"].item() == 42.0, "latest lab value not kept"
+        print("✓ Latest lab value kept across appends")
+
+if __name__ == "__main__":
+    test_feature_store()
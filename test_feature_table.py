@@ -0,0 +1,32 @@
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from feature_table import build_cache, load_master_features
+
+def test_feature_table():
+    """The columnar cache round-trips master_features.csv and refuses to binarize non-flag columns."""
+    print("Testing feature table cache...")
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        expected = pd.read_csv("master_features.csv")
+        loaded = load_master_features("master_features.csv", cache_dir=cache_dir, images=False)
+        for name in expected.columns.drop(["gender", "ethnicity", "image_path"], errors="ignore"):
+            np.testing.assert_allclose(loaded[name].to_numpy(dtype=np.float64),
+                                       expected[name].to_numpy(dtype=np.float64), rtol=1e-6, err_msg=name)
+        print(f"✓ {len(loaded)} rows x {loaded.shape[1]} columns read back from the cache")
+
+        csv_path = os.path.join(cache_dir, "new_column.csv")
+        expected.head(20).assign(bmi=np.linspace(18.5, 31.0, 20)).to_csv(csv_path, index=False)
+        try:
+            build_cache(csv_path, cache_dir)
+            assert False, "a numeric column was bit-packed as an indicator"
+        except ValueError as e:
+            assert "'bmi'" in str(e)
+        assert not [name for name in os.listdir(cache_dir) if name.startswith("new_column_")]
+        print("✓ Undeclared numeric column rejected instead of reduced to 0/1")
+
+if __name__ == "__main__":
+    test_feature_table()
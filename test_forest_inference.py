@@ -0,0 +1,38 @@
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import train_test_split
+
+from disease_dataset import load_training_data, threshold_predictions
+from forest_inference import FlatForest
+
+def test_forest_parity():
+    """Check the compiled forest against sklearn's predict_proba on master_features.csv."""
+    print("Testing compiled RandomForest inference...")
+
+    X, y, mlb, _ = load_training_data()
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+
+    model = RandomForestClassifier(n_estimators=100, class_weight="balanced", random_state=42)
+    model.fit(X_train, y_train)
+    forest = FlatForest.from_sklearn(model)
+
+    for name, rows in [("train", X_train), ("test", X_test), ("single row", X_test.iloc[:1])]:
+        probs_list = model.predict_proba(rows)
+        expected = np.column_stack([p[:, 1] for p in probs_list])
+        proba, labels = forest.predict(rows)
+
+        max_diff = np.abs(proba - expected).max()
+        assert max_diff < 1e-9, f"{name}: probabilities differ by {max_diff}"
+        assert (labels == threshold_predictions(probs_list, 0.3)).all(), f"{name}: labels differ"
+        print(f"✓ {name}: {len(rows)} rows x {len(mlb.classes_)} labels match (max diff {max_diff:.2e})")
+
+    # Per-label thresholds
+    thresholds = np.linspace(0.2, 0.6, len(mlb.classes_))
+    forest.set_thresholds(thresholds)
+    probs_list = model.predict_proba(X_test)
+    _, labels = forest.predict(X_test)
+    assert (labels == threshold_predictions(probs_list, thresholds)).all(), "per-label thresholds differ"
+    print("✓ Per-label thresholds match")
+
+if __name__ == "__main__":
+    test_forest_parity()
@@ -0,0 +1,85 @@
+import os
+import json
+import tempfile
+
+import numpy as np
+from sklearn.metrics import f1_score
+
+import forest_tuning
+from forest_inference import FlatForest, load_thresholds
+
+SMALL_SPACE = {'n_estimators': [10, 20], 'max_depth': [None, 4], 'min_samples_leaf': [1, 3]}
+
+def test_forest_tuning():
+    """Threshold sweeps match sklearn; the search prunes, reuses cached folds and writes loadable versions."""
+    print("Testing forest tuning...")
+
+    # Vectorized sweep == per-threshold sklearn F1 (labels without positives keep 0.3)
+    rng = np.random.default_rng(0)
+    y = rng.random((300, 5)) < [0.1, 0.3, 0.5, 0.05, 0.0]
+    proba = np.clip(y * 0.3 + rng.random(y.shape) * 0.7, 0, 1)
+    thresholds, f1 = forest_tuning.sweep_thresholds(proba, y, chunk_rows=64)
+    for j in range(4):
+        scores = [f1_score(y[:, j], proba[:, j] > t, zero_division=0) for t in forest_tuning.THRESHOLD_GRID]
+        assert np.isclose(f1[j], max(scores)) and np.isclose(scores[list(forest_tuning.THRESHOLD_GRID).index(
+            thresholds[j])], max(scores))
+    assert thresholds[4] == forest_tuning.DEFAULT_THRESHOLD
+    print(f"✓ Swept thresholds match sklearn: {thresholds}")
+
+    # A space smaller than --configs yields each distinct point once (with or without the notebook's)
+    assert len(forest_tuning.sample_configs(5, 42, {'n_estimators': [100, 200]})) == 2
+    assert len(forest_tuning.sample_configs(5, 42, {'n_estimators': [50, 200]})) == 3
+    assert len(forest_tuning.sample_configs(500, 42)) == len(forest_tuning.sample_configs(300, 42))
+    print("✓ Configuration sampling stops at the number of distinct grid points")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        def tune(*extra):
+            return forest_tuning.main(["--configs", "6", "--folds", "3", "--workers", "2", "--space",
+                                       json.dumps(SMALL_SPACE), "--cache-dir", os.path.join(tmp_dir, "cache"),
+                                       "--output", os.path.join(tmp_dir, "models"), *extra])
+
+        assert tune() == 0
+        fold_dirs = os.listdir(os.path.join(tmp_dir, "cache"))
+        with open(os.path.join(tmp_dir, "models", "v1", "tuning.json")) as f:
+            tuning = json.load(f)
+        search = tuning['search']
+        assert len(search) == 6 and search[0]['folds'] == 3 and search[0]['params'] == tuning['params']
+        pruned = [trial for trial in search if trial['pruned_after_fold'] is not None]
+        assert pruned and all(trial['folds'] < 3 for trial in pruned)
+        assert any(trial['trial'] == 0 and trial['folds'] == 3 for trial in search)
+        print(f"✓ {len(pruned)} of 6 configurations pruned early; best {tuning['params']}")
+
+        # Folds are imputed with training-fold means only
+        fold_dir = os.path.join(tmp_dir, "cache", fold_dirs[0])
+        folds = np.load(os.path.join(fold_dir, "folds.npy"))
+        assert len(folds) == tuning['data']['n_rows'] and set(folds) == {0, 1, 2}
+        assert not np.isnan(np.load(os.path.join(fold_dir, "fold0_val.npy"))).any()
+
+        # The artifact serves: labels and thresholds line up with the forest's outputs
+        import joblib
+        model_path = os.path.join(tmp_dir, "models", "v1", "disease_model.joblib")
+        forest = FlatForest.from_sklearn(joblib.load(model_path))
+        forest.set_thresholds(load_thresholds(os.path.join(tmp_dir, "models", "v1", "tuning.json"),
+                                              forest.n_labels, model_path))
+        assert forest.n_labels == len(tuning['labels']) == len(tuning['thresholds'])
+        assert forest.feature_names is not None and list(tuning['imputer_means']) == forest.feature_names
+        print(f"✓ v1 loads with thresholds {tuning['thresholds']} (macro F1 {tuning['macro_f1']:.3f}, "
+              f"{tuning['macro_f1_at_default']:.3f} at 0.3)")
+
+        # Second run reuses the cached folds and publishes the next version
+        assert tune() == 0
+        assert os.listdir(os.path.join(tmp_dir, "cache")) == fold_dirs
+        assert os.path.isdir(os.path.join(tmp_dir, "models", "v2"))
+        installed = {name: os.path.join(tmp_dir, os.path.basename(path))
+                     for name, path in forest_tuning.INSTALL_PATHS.items()}
+        forest_tuning.install(os.path.join(tmp_dir, "models", "v2"), installed['model'], installed['tuning'])
+        assert len(load_thresholds(installed['tuning'], forest.n_labels, installed['model'])) == forest.n_labels
+        try:
+            load_thresholds(installed['tuning'], forest.n_labels, installed['tuning'])
+            assert False, "thresholds accepted for another file"
+        except ValueError:
+            pass
+        print("✓ Cached folds reused, v2 written and installed; thresholds refuse a different model file")
+
+if __name__ == "__main__":
+    test_forest_tuning()
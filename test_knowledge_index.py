@@ -0,0 +1,56 @@
+import zlib
+import tempfile
+
+import numpy as np
+
+from knowledge_index import KnowledgeIndex
+
+def hash_encoder(texts):
+    """Deterministic stand-in for the sentence encoder: one random vector per text."""
+    return np.stack([np.random.default_rng(zlib.crc32(text.encode())).normal(size=32) for text in texts])
+
+def test_knowledge_index():
+    """Check incremental add/delete, reopening and index-type switches against exact search."""
+    print("Testing disease knowledge index...")
+
+    texts = [f"chunk {i} on disease {i % 13}: " + "symptom " * (i % 7) for i in range(600)]
+    metadata = [{'disease': f"disease_{i % 13}", 'chunk': i} for i in range(600)]
+
+    for index_type in ('flat', 'ivf', 'hnsw'):
+        with tempfile.TemporaryDirectory() as index_dir:
+            index = KnowledgeIndex(index_dir, dim=32, index_type=index_type, encoder=hash_encoder,
+                                   ivf_min_train=400, nprobe=64)
+            index.add(texts[:300], metadata[:300])
+            index.add(texts[300:], metadata[300:])
+            if index_type == 'ivf':
+                assert index.stats()['nlist'] is not None, "IVF was not trained once enough chunks arrived"
+
+            results = index.search([texts[5], texts[450]], k=3)
+            assert [hits[0]['id'] for hits in results] == [5, 450]
+            assert results[0][0]['text'] == texts[5] and results[0][0]['metadata'] == metadata[5]
+
+            assert index.delete([5, 450, 450]) == 2
+            results = index.search([texts[5], texts[450]], k=3)
+            assert all(len(hits) == 3 for hits in results)
+            assert not {5, 450} & {hit['id'] for hits in results for hit in hits}, "deleted chunk returned"
+
+            index.save()
+            reopened = KnowledgeIndex(index_dir, encoder=hash_encoder)
+            assert reopened.search(texts[123], k=1)[0]['id'] == 123
+            assert reopened.store.get(5) is None and len(reopened.store) == 598
+
+            reopened.rebuild('flat')
+            assert reopened.search(texts[450], k=1)[0]['id'] != 450
+
+            # Changes made after the last save(): the reopened index is rebuilt from the chunk store
+            unsaved = KnowledgeIndex(index_dir, encoder=hash_encoder)
+            new_id = int(unsaved.add(["late chunk"], [{'disease': "late"}])[0])
+            unsaved.delete([7])
+            reopened = KnowledgeIndex(index_dir, encoder=hash_encoder)
+            assert reopened.stats()['indexed'] - reopened.stats()['tombstones'] == len(reopened.store) == 598
+            assert reopened.search("late chunk", k=1)[0]['id'] == new_id
+            assert 7 not in {hit['id'] for hit in reopened.search(texts[7], k=5)}
+            print(f"✓ {index_type}: incremental add/delete, reopen (saved and unsaved) and rebuild")
+
+if __name__ == "__main__":
+    test_knowledge_index()
@@ -0,0 +1,42 @@
+import numpy as np
+
+from micro_batching import MicroBatcher, get_batcher
+
+def double(batch):
+    return batch * 2
+
+def test_micro_batching():
+    """Rows go back to their callers; a short batch fails every caller; conflicting settings are refused."""
+    print("Testing micro-batching...")
+
+    batcher = MicroBatcher(double, max_batch_size=8, max_wait_ms=50, name="double")
+    futures = [batcher.submit(np.full(3, i, dtype=np.float32)) for i in range(5)]
+    for i, future in enumerate(futures):
+        np.testing.assert_array_equal(future.result(timeout=5), np.full(3, 2 * i))
+    assert batcher.stats()['batches'] == 1
+    print("✓ 5 concurrent samples scored in one batch, each row returned to its caller")
+
+    # One row short: no row can be trusted to belong to its caller, so every caller gets the error
+    short = MicroBatcher(lambda batch: batch[:-1], max_batch_size=8, max_wait_ms=50, name="short")
+    futures = [short.submit(np.zeros(3)) for _ in range(4)]
+    for future in futures:
+        try:
+            future.result(timeout=5)
+            assert False, "a caller got a row from a short batch"
+        except ValueError as e:
+            assert "3 rows for 4 samples" in str(e)
+    print("✓ Short batch fails all 4 callers instead of leaving one waiting")
+
+    shared = get_batcher("test-shared", double, max_batch_size=4, max_wait_ms=2.0)
+    assert get_batcher("test-shared", double) is shared
+    assert get_batcher("test-shared", double, max_batch_size=4, max_wait_ms=2.0) is shared
+    for settings in [{'max_batch_size': 16}, {'max_wait_ms': 10.0}]:
+        try:
+            get_batcher("test-shared", double, **settings)
+            assert False, f"conflicting {settings} accepted"
+        except ValueError as e:
+            assert "test-shared" in str(e)
+    print("✓ Named batcher reused with matching settings, conflicting ones rejected")
+
+if __name__ == "__main__":
+    test_micro_batching()
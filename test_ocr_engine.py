@@ -0,0 +1,63 @@
+import cv2
+import numpy as np
+
+from ocr_engine import OCREngine, parse_lab_values
+
+def test_lab_parsing():
+    """Check the single-pass lab matcher on lab-sheet rows and typed-in values."""
+    print("Testing lab value parsing...")
+
+    text = """Hematology
+TEST RESULT UNIT NORMAL RANGE RESULT STATUS
+White Blood Cell Count 7.2 x10^9/L 4 - 11 Normal
+Hemoglobin 13.5 g/dL 13.2 - 16.6 Normal
+Hematocrit 40.1 % 38.3 - 48.6 Normal
+Alanine Aminotransferase (ALT) 25 U/L 7 - 56 Normal
+Aspartate Aminotransferase
+(AST) 30 U/L 8 - 48 Normal
+Age: 30
+"""
+    values = parse_lab_values(text)
+    expected = {
+        'white_blood_cells': (7.2, "x10^9/L"),
+        'hemoglobin': (13.5, "g/dL"),
+        'hematocrit': (40.1, "%"),
+        'ALT': (25.0, "U/L"),
+        'AST': (30.0, "U/L"),
+    }
+    assert set(values) == set(expected), f"unexpected analytes: {sorted(values)}"
+    for name, (value, unit) in expected.items():
+        assert values[name] == {'value': value, 'unit': unit}, f"{name}: {values[name]}"
+    print(f"✓ Lab sheet rows: {len(values)} values, reference ranges ignored")
+
+    # The README's manual fallback, plus spellings that share a prefix
+    values = parse_lab_values("Glucose: 120\nHemoglobin: 13.5, HbA1c 6.1 %\nWhite blood cells: 7,2")
+    assert values['glucose']['value'] == 120.0
+    assert values['hemoglobin']['value'] == 13.5
+    assert values['hba1c'] == {'value': 6.1, 'unit': '%'}
+    assert values['white_blood_cells']['value'] == 7.2
+    print("✓ Typed-in values and overlapping spellings")
+
+def test_region_splitting():
+    """Regions must cover the page and only be cut on blank rows."""
+    print("Testing page region splitting...")
+
+    page = np.full((1400, 900), 255, dtype=np.uint8)
+    for i in range(30):
+        cv2.putText(page, f"Glucose {90 + i} mg/dL", (40, 40 + i * 45), cv2.FONT_HERSHEY_SIMPLEX, 1.0, 0, 2)
+
+    engine = OCREngine(workers=4, cache_dir=None)
+    binary = engine.preprocess(page)
+    regions = engine.split_regions(binary)
+    assert len(regions) == 4, f"expected 4 regions, got {len(regions)}"
+    assert sum(len(region) for region in regions) == binary.shape[0]
+    for region in regions[1:]:
+        assert (region[0] == 255).all(), "a region starts inside a text line"
+    print(f"✓ {len(regions)} regions of {[len(region) for region in regions]} rows")
+
+    assert len(OCREngine(workers=4, cache_dir=None).split_regions(binary[:400])) == 1
+    print("✓ Short pages stay whole")
+
+if __name__ == "__main__":
+    test_lab_parsing()
+    test_region_splitting()
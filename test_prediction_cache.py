@@ -0,0 +1,60 @@
+import time
+import asyncio
+
+from chat_pipeline import ChatPipeline
+from prediction_cache import PredictionCache, cache_key
+
+def labs(**values):
+    return {'lab_results': values, 'signals': {'heart_rate': 88}}
+
+def test_prediction_cache():
+    """Keys separate clinically different values; TTL, LRU eviction, copies and the /chat tabular stage."""
+    print("Testing prediction cache...")
+
+    # Same measurement in other units or spellings shares a key; different values never do
+    assert cache_key(labs(temperature="98.6 F")) == cache_key(labs(temp=37.0))
+    assert cache_key(labs(glucose={'value': 5.55, 'unit': "mmol/L"})) == cache_key(labs(glucose=99.99))
+    assert cache_key(labs(creatinine=1.04)) != cache_key(labs(creatinine=0.96))
+    assert cache_key(labs(troponin=0.04)) != cache_key(labs(troponin=0.01))
+    assert cache_key(labs(white_blood_cells=9.5)) != cache_key(labs(white_blood_cells=9.6))
+    print("✓ Unit and alias variants collide; creatinine 1.04/0.96 and troponin 0.04/0.01 do not")
+
+    cache = PredictionCache(max_entries=2, ttl=0.2, watch_paths=[])
+    cache.put("a", [{'name': "Hypertension"}])
+    cache.put("b", [{'name': "Diabetes"}])
+    assert cache.get("a") is not None  # "b" is now least recently used
+    cache.put("c", [{'name': "Sepsis"}])
+    assert cache.get("b") is None and cache.get("a") is not None and cache.stats()['evictions'] == 1
+    hit = cache.get("c")
+    hit[0]['name'] = "changed by the caller"
+    assert cache.get("c") == [{'name': "Sepsis"}]
+    time.sleep(0.25)
+    assert cache.get("a") is None and cache.stats()['expirations'] == 1
+    print("✓ LRU eviction, TTL expiry, and returned values are copies")
+
+    # Wired into the pipeline: same labs with new chat text skip the tabular model
+    calls = []
+
+    def tabular(patient_data):
+        calls.append(patient_data)
+        return [{'name': "Hypertension", 'probability': 0.72, 'summary': "Elevated blood pressure"}]
+
+    async def chat():
+        pipeline = ChatPipeline(tabular=tabular, prediction_cache=PredictionCache(watch_paths=[]))
+        try:
+            responses = []
+            for message, patient_data in [("chest pain", labs(creatinine=1.04)), ("and now?", labs(creat=1.04)),
+                                          ("new labs", labs(creatinine=0.96))]:
+                request = {'messages': [{'role': 'user', 'content': message}], 'patient_data': patient_data}
+                responses.append(await pipeline.predict(request))
+            return responses, pipeline.stats()['prediction_cache']
+        finally:
+            await pipeline.stop()
+
+    responses, stats = asyncio.run(chat())
+    assert len(calls) == 2 and stats['hits'] == 1 and stats['misses'] == 2
+    assert responses[0]['predictions'] == responses[1]['predictions']
+    print(f"✓ Tabular stage ran {len(calls)} times for 3 requests ({stats['hits']} cache hit)")
+
+if __name__ == "__main__":
+    test_prediction_cache()
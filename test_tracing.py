@@ -0,0 +1,124 @@
+import os
+import re
+import json
+import time
+import tempfile
+
+from chat_pipeline import ChatPipeline, create_app
+from llm_client import OllamaClient
+from llm_stub import StubLLMServer
+from tracing import Tracer, span, tracer
+
+PAYLOAD = {
+    "messages": [{"role": "user", "content": "I have chest pain and shortness of breath for 3 days."}],
+    "patient_data": {"lab_results": {"glucose": 130}, "ecg_signal": [[0.0] * 12] * 10},
+}
+
+SAMPLE_LINE = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{([a-zA-Z_]+="([^"\\]|\\.)*",?)*\})? \S+$')
+
+def tabular(patient_data):
+    with span('forest.predict'):
+        time.sleep(0.03)
+    return [{'name': "Hypertension", 'probability': 0.72, 'summary': "Elevated blood pressure"}]
+
+def ocr(image):
+    """Process-stage OCR: its span and cache flag have to travel back to the parent."""
+    with span('ocr.recognize'):
+        time.sleep(0.01)
+    return {'text': "Glucose 130", 'lab_values': {'glucose': 130.0}, 'hash': image, 'cached': image == "seen"}
+
+def ecg(signal):
+    time.sleep(0.02)
+    return {'name': "Normal sinus rhythm", 'probability': 0.9, 'summary': "ECG"}
+
+def parse_metrics(text):
+    """{(name, labels string): value} after checking every line is valid exposition format."""
+    samples = {}
+    for line in text.splitlines():
+        if line.startswith("#"):
+            assert line.startswith(("# HELP ", "# TYPE ")), line
+            continue
+        assert SAMPLE_LINE.match(line), line
+        series, value = line.rsplit(" ", 1)
+        name, _, labels = series.partition("{")
+        samples[(name, labels.rstrip("}"))] = float(value)
+    return samples
+
+def test_tracing():
+    """Disabled spans are near-free; traced requests feed /metrics and the slow-request log."""
+    print("Testing tracing and metrics...")
+
+    # Disabled: a shared no-op, nothing recorded
+    assert not tracer.enabled
+    start = time.perf_counter()
+    for _ in range(100000):
+        with span('forest.predict'):
+            pass
+    per_span_us = (time.perf_counter() - start) * 10
+    assert per_span_us < 2.0 and not tracer.stage_seconds._series
+    print(f"✓ Disabled span costs {per_span_us * 1000:.0f} ns")
+
+    # Histogram exposition: cumulative buckets ending in +Inf == count
+    histogram = Tracer(enabled=True).stage_seconds
+    for value in [0.0001, 0.003, 0.003, 0.2, 50.0]:
+        histogram.observe(value, 'ocr')
+    samples = parse_metrics("\n".join(histogram.render()))
+    buckets = [v for (name, _), v in samples.items() if name.endswith("_bucket")]
+    assert buckets == sorted(buckets) and buckets[-1] == 5
+    assert samples[("chatbot_stage_duration_seconds_bucket", 'stage="ocr",le="0.005"')] == 3
+    print("✓ Histogram buckets are cumulative and end in +Inf")
+
+    with tempfile.TemporaryDirectory() as tmp_dir, StubLLMServer(first_token_delay=0.05, token_delay=0.001) as llm:
+        slow_log = os.path.join(tmp_dir, "slow_requests.log")
+        previous_threshold = tracer.slow_threshold_ms
+        tracer.configure(slow_threshold_ms=40, slow_log_path=slow_log)
+        metadata = os.path.join(tmp_dir, "metadata.json")
+        with open(metadata, 'w') as f:
+            json.dump({'version': 1}, f)
+        from model_registry import registry
+        registry.get(metadata)
+
+        from fastapi.testclient import TestClient
+        pipeline = ChatPipeline(ocr=ocr, ecg=ecg, tabular=tabular, llm=OllamaClient(llm.url, model="stub"))
+        app = create_app(pipeline, metrics=True)
+        assert not tracer.enabled, "constructing the app must not switch tracing on"
+        try:
+            with TestClient(app) as http:
+                for _ in range(3):
+                    assert http.post("/chat", json=PAYLOAD).status_code == 200
+                with http.stream("POST", "/chat/stream", json=PAYLOAD) as response:
+                    assert response.status_code == 200 and "event: done" in response.read().decode()
+                assert http.post("/chat", json=dict(PAYLOAD, images=["seen", "new"])).status_code == 200
+                text = http.get("/metrics").text
+                slow = http.get("/metrics/slow").json()
+            assert not tracer.enabled, "tracing left on after the app shut down"
+        finally:
+            tracer.configure(enabled=False, slow_threshold_ms=previous_threshold)
+            tracer.slow_log_path = None
+        with open(slow_log) as f:
+            logged = [json.loads(line) for line in f]
+
+    samples = parse_metrics(text)
+    assert samples[("chatbot_request_duration_seconds_count", 'route="/chat",status="200"')] == 4
+    assert samples[("chatbot_request_duration_seconds_count", 'route="/chat/stream",status="200"')] == 1
+    for stage in ['ecg', 'tabular', 'forest.predict', 'llm']:
+        assert samples[("chatbot_stage_duration_seconds_count", f'stage="{stage}"')] == 5, stage
+    assert samples[("chatbot_stage_duration_seconds_count", 'stage="ocr.recognize"')] == 2
+    assert samples[("chatbot_cache_hits_total", 'cache="ocr"')] == 1
+    assert samples[("chatbot_cache_misses_total", 'cache="ocr"')] == 1
+    assert samples[("chatbot_queue_depth", 'queue="tabular"')] == 0
+    assert samples[("chatbot_stage_in_flight", 'stage="llm"')] == 0
+    assert samples[("chatbot_model_load_seconds", f'model="{metadata}"')] >= 0
+    print(f"✓ /metrics: {len(samples)} samples; spans from the thread pool and the OCR process pool")
+
+    entry = slow['requests'][0]
+    assert len(slow['requests']) == 5 and entry['route'] == "/chat" and entry['duration_ms'] >= 40
+    assert set(entry['stages']) == {'ecg', 'tabular', 'forest.predict', 'llm'}
+    assert entry['stages']['tabular'] >= entry['stages']['forest.predict'] >= 25
+    assert entry['stages']['llm'] > 0
+    assert [e['route'] for e in logged] == ["/chat"] * 3 + ["/chat/stream", "/chat"]
+    assert {'ocr', 'ocr.recognize'} <= set(slow['requests'][-1]['stages'])
+    print(f"✓ Slow requests logged with their breakdown: {entry['stages']}")
+
+if __name__ == "__main__":
+    test_tracing()
@@ -0,0 +1,396 @@
+"""Span-based request tracing and Prometheus metrics for the chat backend.
+
+Backend stages time themselves with ``with span("ocr.recognize"):``. While
+tracing is disabled (the default) ``span`` returns a shared no-op context
+manager, so instrumented code pays one attribute check per call. Once
+enabled, every span is observed in the ``chatbot_stage_duration_seconds``
+histogram and, inside a traced request, added to that request's trace.
+
+``create_app(pipeline, metrics=True)`` (chat_pipeline.py) enables tracing,
+traces every /chat and /chat/stream request and serves:
+
+- GET /metrics: Prometheus text format with request and stage latency
+  histograms, stage and queue depths, cache hit rates and model load times
+- GET /metrics/slow: the latest requests slower than the threshold, with their
+  per-stage breakdown
+
+A slow request is printed with its breakdown and, with a slow log path,
+appended to it as one JSON line. Environment variables configure the
+process-wide tracer: CHATBOT_TRACING=1, CHATBOT_SLOW_REQUEST_MS (default
+1000) and CHATBOT_SLOW_REQUEST_LOG.
+
+Spans in pool threads join the request's trace when the work was submitted
+with ``propagate(func)`` (ChatPipeline's thread stages and ``asyncio.to_thread``
+do this). Work sent to a process pool as ``call_traced(func, *args)`` returns
+its spans with the result, and ``tracer.record_spans`` adds them to the
+parent's histograms and trace (ChatPipeline's process stages, i.e. OCR, do
+this). Spans in other threads and processes are not seen by /metrics.
+"""
+import os
+import sys
+import json
+import time
+import bisect
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from functools import partial
+
+# Seconds; stage calls range from sub-millisecond forest predictions to LLM reports
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_current_trace = contextvars.ContextVar('chatbot_trace', default=None)
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + "}"
+
+
+class Histogram:
+    """Prometheus histogram with one label set per distinct label values"""
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((labels, [list(counts), total, count]) for labels, (counts, total, count)
+                            in self._series.items())
+        for labelvalues, (counts, total, count) in series:
+            labels = dict(zip(self.labelnames, labelvalues))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(dict(labels, le=_format_value(bound)))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+def render_family(name, kind, help, samples):
+    """Prometheus text lines for a gauge or counter given [(labels dict, value)]"""
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    lines += [f"{name}{_format_labels(labels)} {_format_value(value)}" for labels, value in samples
+              if value is not None]
+    return lines
+
+
+class Trace:
+    """Spans of one request: (name, start offset, duration) in seconds"""
+
+    __slots__ = ('route', 'start', 'spans', 'status')
+
+    def __init__(self, route):
+        self.route = route
+        self.start = time.perf_counter()
+        self.spans = []
+        self.status = None
+
+    def breakdown(self):
+        """Total milliseconds per span name, in order of first start"""
+        stages = {}
+        for name, _, duration in sorted(self.spans, key=lambda s: s[1]):
+            stages[name] = stages.get(name, 0.0) + duration * 1000
+        return stages
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ('tracer', 'name', 'start')
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.tracer.record(self.name, self.start, time.perf_counter() - self.start, exc_type is not None)
+        return False
+
+
+class Tracer:
+    """Process-wide span recorder, request traces and the slow-request log"""
+
+    def __init__(self, enabled=False, slow_threshold_ms=1000.0, slow_log_path=None, slow_entries=100,
+                 buckets=DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.slow_threshold_ms = slow_threshold_ms
+        self.slow_log_path = slow_log_path
+        self.stage_seconds = Histogram("chatbot_stage_duration_seconds", "Time spent in each backend stage span",
+                                       ("stage",), buckets)
+        self.request_seconds = Histogram("chatbot_request_duration_seconds", "End-to-end traced request latency",
+                                         ("route", "status"), buckets)
+        self.stage_errors = {}
+        self.slow_requests = {}
+        self.recent_slow = deque(maxlen=slow_entries)
+        self._lock = threading.Lock()
+
+    def configure(self, enabled=None, slow_threshold_ms=None, slow_log_path=None):
+        if enabled is not None:
+            self.enabled = enabled
+        if slow_threshold_ms is not None:
+            self.slow_threshold_ms = slow_threshold_ms
+        if slow_log_path is not None:
+            self.slow_log_path = slow_log_path
+
+    def record(self, name, start, duration, failed=False):
+        self.stage_seconds.observe(duration, name)
+        if failed:
+            with self._lock:
+                self.stage_errors[name] = self.stage_errors.get(name, 0) + 1
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.spans.append((name, start - trace.start, duration))
+
+    def record_spans(self, spans, start):
+        """Record spans returned by ``call_traced``, offsets taken from ``start`` (when the work was submitted)"""
+        for name, offset, duration in spans:
+            self.record(name, start + offset, duration)
+
+    @contextmanager
+    def request(self, route):
+        """Trace the enclosed request; spans recorded in this context join it"""
+        trace = Trace(route)
+        token = _current_trace.set(trace)
+        try:
+            yield trace
+        finally:
+            _current_trace.reset(token)
+            self.finish(trace, time.perf_counter() - trace.start)
+
+    def finish(self, trace, duration):
+        self.request_seconds.observe(duration, trace.route, str(trace.status or 500))
+        if duration * 1000 >= self.slow_threshold_ms:
+            self._log_slow(trace, duration)
+
+    def _log_slow(self, trace, duration):
+        entry = {
+            'time': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'route': trace.route,
+            'status': trace.status,
+            'duration_ms': round(duration * 1000, 1),
+            'stages': {name: round(ms, 1) for name, ms in trace.breakdown().items()},
+            'spans': [{'name': name, 'start_ms': round(start * 1000, 1), 'duration_ms': round(d * 1000, 1)}
+                      for name, start, d in sorted(trace.spans, key=lambda s: s[1])],
+        }
+        with self._lock:
+            self.recent_slow.append(entry)
+            self.slow_requests[trace.route] = self.slow_requests.get(trace.route, 0) + 1
+        stages = ", ".join(f"{name} {ms:.0f} ms" for name, ms in entry['stages'].items()) or "no spans"
+        print(f"✗ Slow {trace.route} request: {entry['duration_ms']:.0f} ms ({stages})")
+        if self.slow_log_path:
+            try:
+                with open(self.slow_log_path, 'a') as f:
+                    f.write(json.dumps(entry) + "\n")
+            except OSError as e:
+                print(f"✗ Could not write the slow request log: {e}")
+
+    def render(self, pipeline=None):
+        """Prometheus text exposition of the histograms and the process's component stats"""
+        lines = self.stage_seconds.render() + self.request_seconds.render()
+        with self._lock:
+            errors = [({'stage': name}, count) for name, count in sorted(self.stage_errors.items())]
+            slow = [({'route': route}, count) for route, count in sorted(self.slow_requests.items())]
+        lines += render_family("chatbot_stage_errors_total", "counter", "Stage spans that raised", errors)
+        lines += render_family("chatbot_slow_requests_total", "counter",
+                               "Requests slower than the slow-request threshold", slow)
+        lines += render_family("chatbot_slow_request_threshold_seconds", "gauge", "Slow-request log threshold",
+                               [({}, self.slow_threshold_ms / 1000)])
+        for name, (kind, help, samples) in collect(pipeline).items():
+            lines += render_family(name, kind, help, samples)
+        return "\n".join(lines) + "\n"
+
+
+tracer = Tracer(enabled=os.environ.get('CHATBOT_TRACING') == '1',
+                slow_threshold_ms=float(os.environ.get('CHATBOT_SLOW_REQUEST_MS', 1000)),
+                slow_log_path=os.environ.get('CHATBOT_SLOW_REQUEST_LOG'))
+
+
+def span(name):
+    """Time the enclosed block as stage ``name`` (a shared no-op while tracing is disabled)"""
+    if not tracer.enabled:
+        return _NOOP
+    return _Span(tracer, name)
+
+
+def propagate(func):
+    """``func`` bound to the caller's context, so spans it records in a pool thread join the current trace"""
+    if not tracer.enabled or _current_trace.get() is None:
+        return func
+    return partial(contextvars.copy_context().run, func)
+
+
+def call_traced(func, *args):
+    """Run ``func(*args)`` in a worker process, returning (result, spans) for ``tracer.record_spans``"""
+    tracer.enabled = True  # In this worker process only; its spans are reported back, not served
+    trace = Trace(None)
+    token = _current_trace.set(trace)
+    try:
+        result = func(*args)
+    finally:
+        _current_trace.reset(token)
+    return result, trace.spans
+
+
+def collect(pipeline=None):
+    """{metric name: (type, help, [(labels, value)])} from the components loaded in this process
+
+    Modules that were never imported are skipped rather than imported here.
+    """
+    families = {
+        'chatbot_stage_in_flight': ('gauge', "Calls running or queued per pipeline stage", []),
+        'chatbot_queue_depth': ('gauge', "Work waiting for a worker, per queue", []),
+        'chatbot_stage_rejected_total': ('counter', "Calls rejected by a full stage (HTTP 503)", []),
+        'chatbot_stage_timeouts_total': ('counter', "Calls that exceeded the stage timeout (HTTP 504)", []),
+        'chatbot_cache_hits_total': ('counter', "Cache lookups served from the cache", []),
+        'chatbot_cache_misses_total': ('counter', "Cache lookups that had to compute", []),
+        'chatbot_cache_hit_ratio': ('gauge', "Hits over lookups since start", []),
+        'chatbot_model_load_seconds': ('gauge', "Duration of the last load of each model artifact", []),
+        'chatbot_model_version': ('gauge', "Times each model artifact was (re)loaded", []),
+        'chatbot_model_resident_bytes': ('gauge', "Resident memory added by loading each model artifact", []),
+        'chatbot_batches_total': ('counter', "Micro-batches run per batcher", []),
+        'process_resident_memory_bytes': ('gauge', "Resident memory size in bytes", []),
+    }
+
+    def add(name, labels, value):
+        families[name][2].append((labels, value))
+
+    def add_cache(cache, hits, misses):
+        add('chatbot_cache_hits_total', {'cache': cache}, hits)
+        add('chatbot_cache_misses_total', {'cache': cache}, misses)
+        add('chatbot_cache_hit_ratio', {'cache': cache}, hits / (hits + misses) if hits + misses else 0.0)
+
+    if pipeline is not None:
+        stats = pipeline.stats()
+        for name, stage in pipeline.stages.items():
+            add('chatbot_stage_in_flight', {'stage': name}, stage.in_flight)
+            add('chatbot_queue_depth', {'queue': name}, max(0, stage.in_flight - stage.workers))
+            add('chatbot_stage_rejected_total', {'stage': name}, stage.rejected)
+            add('chatbot_stage_timeouts_total', {'stage': name}, stage.timeouts)
+        if 'db_writer' in stats:
+            add('chatbot_queue_depth', {'queue': 'db_writer'}, stats['db_writer']['queued'])
+            add('chatbot_stage_rejected_total', {'stage': 'db_writer'}, stats['db_writer']['rejected'])
+        if 'llm' in stats and 'waiting' in stats['llm']:
+            add('chatbot_stage_in_flight', {'stage': 'llm'}, stats['llm']['in_flight'])
+            add('chatbot_queue_depth', {'queue': 'llm'}, stats['llm']['waiting'])
+            add('chatbot_stage_rejected_total', {'stage': 'llm'}, stats['llm'].get('rejected', 0))
+        if 'context' in stats:
+            add_cache('conversation_context', stats['context']['memory_hits'],
+                      stats['context']['db_loads'] + stats['context']['bootstraps'])
+
+    micro_batching = sys.modules.get('micro_batching')
+    if micro_batching is not None:
+        for name, batcher in list(micro_batching._batchers.items()):
+            add('chatbot_queue_depth', {'queue': f"batcher:{name}"}, batcher._queue.qsize())
+            add('chatbot_batches_total', {'batcher': name}, batcher.batches)
+
+    prediction_cache = sys.modules.get('prediction_cache')
+    if getattr(pipeline, 'prediction_cache', None) is not None:
+        stats = pipeline.prediction_cache.stats()
+        add_cache('prediction', stats['hits'], stats['misses'])
+    elif prediction_cache is not None:
+        stats = prediction_cache.prediction_cache.stats()
+        add_cache('prediction', stats['hits'], stats['misses'])
+
+    ocr_engine = sys.modules.get('ocr_engine')
+    if getattr(pipeline, 'stages', {}).get('ocr') is not None:
+        # Counted from the OCR stage's results: the engine may live in the stage's worker processes
+        add_cache('ocr', pipeline.ocr_cache['hits'], pipeline.ocr_cache['misses'])
+    elif ocr_engine is not None and ocr_engine._engine is not None:
+        engine = ocr_engine._engine
+        add_cache('ocr', engine.hits + engine.disk_hits, engine.misses)
+
+    embedding_service = sys.modules.get('embedding_service')
+    if embedding_service is not None:
+        for service in list(embedding_service._services.values()):
+            add_cache(f"embedding:{service.model_version}", service.hits + service.disk_hits, service.misses)
+            add('chatbot_queue_depth', {'queue': f"batcher:{service.batcher.name}"}, service.batcher._queue.qsize())
+            add('chatbot_batches_total', {'batcher': service.batcher.name}, service.batcher.batches)
+
+    model_registry = sys.modules.get('model_registry')
+    if model_registry is not None:
+        for name, stat in model_registry.registry.stats().items():
+            if stat['loaded']:
+                add('chatbot_model_load_seconds', {'model': name}, stat['load_seconds'])
+                add('chatbot_model_version', {'model': name}, stat['version'])
+                add('chatbot_model_resident_bytes', {'model': name}, stat['resident_bytes'])
+        add('process_resident_memory_bytes', {}, model_registry.resident_memory())
+
+    return families
+
+
+class TracingMiddleware:
+    """ASGI middleware tracing requests to ``paths``, streamed bodies included"""
+
+    def __init__(self, app, tracer=tracer, paths=("/chat", "/chat/stream")):
+        self.app = app
+        self.tracer = tracer
+        self.paths = set(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not self.tracer.enabled or scope['path'] not in self.paths:
+            return await self.app(scope, receive, send)
+
+        with self.tracer.request(scope['path']) as trace:
+            async def send_traced(message):
+                if message['type'] == 'http.response.start':
+                    trace.status = message['status']
+                await send(message)
+
+            await self.app(scope, receive, send_traced)
+
+
+def add_metrics_routes(app, pipeline=None, tracer=tracer):
+    """GET /metrics (Prometheus text) and GET /metrics/slow on a FastAPI app"""
+    from fastapi.responses import PlainTextResponse
+
+    @app.get("/metrics")
+    async def metrics():
+        return PlainTextResponse(tracer.render(pipeline), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+    @app.get("/metrics/slow")
+    async def slow_requests():
+        return {'threshold_ms': tracer.slow_threshold_ms, 'requests': list(tracer.recent_slow)}
+
+    return app
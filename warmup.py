@@ -0,0 +1,207 @@
+"""Fast cold start: dependency checks without imports and background warmup.
+
+The server process binds its port and answers liveness checks right away.
+Heavy frameworks (TensorFlow, torch) and model artifacts are loaded by a
+background Warmup, and /health/ready returns 503 until it has finished, so
+an autoscaler only routes traffic to replicas that can serve it. Anything
+not covered by the warmup still loads lazily on first use.
+"""
+import time
+import threading
+import importlib.util
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def _process_start_time():
+    """Wall-clock time this process started (import time of this module without psutil)"""
+    if psutil is not None:
+        try:
+            return psutil.Process().create_time()
+        except Exception:
+            pass
+    return time.time()
+
+
+PROCESS_START = _process_start_time()
+
+# Import name -> pip package, for every backend dependency. The launchers
+# (run.py, start_unified_chatbot.py) require SERVER_DEPENDENCIES and warn about the rest.
+BACKEND_DEPENDENCIES = {
+    'numpy': 'numpy',
+    'pandas': 'pandas',
+    'sklearn': 'scikit-learn',
+    'fastapi': 'fastapi',
+    'uvicorn': 'uvicorn',
+    'httpx': 'httpx',
+    'cv2': 'opencv-python',
+    'pytesseract': 'pytesseract',
+    'PIL': 'pillow',
+    'joblib': 'joblib',
+    'tensorflow': 'tensorflow',
+    'torch': 'torch',
+    'transformers': 'transformers',
+    'faiss': 'faiss-cpu',
+    'wfdb': 'wfdb',
+}
+
+# What the API server needs to import and start; the other backend dependencies
+# (TensorFlow, torch, OCR, ...) load lazily, and features using them stay
+# unavailable when they are missing
+SERVER_DEPENDENCIES = ['fastapi', 'uvicorn', 'numpy', 'pandas', 'sklearn']
+
+# Started next to the backend by start_unified_chatbot.py
+FRONTEND_DEPENDENCIES = {
+    'streamlit': 'streamlit',
+}
+
+
+def is_installed(name):
+    """True if a module can be imported, without importing it"""
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+def missing_dependencies(names=None):
+    """Import names (from BACKEND_DEPENDENCIES by default) that are not installed"""
+    return [name for name in (names or BACKEND_DEPENDENCIES) if not is_installed(name)]
+
+
+class Warmup:
+    """Named initialization tasks run once on a background thread
+
+    A failing required task marks the process as not ready. A failing optional
+    task is recorded and its work is left to lazy loading on first use.
+    """
+
+    def __init__(self):
+        self.tasks = []
+        self.results = {}
+        self.state = 'pending'
+        self.started_at = None
+        self.finished_at = None
+        self.time_to_first_request = None
+        self._ready = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def add(self, name, func, required=True):
+        self.tasks.append((name, func, required))
+        return self
+
+    def start(self):
+        """Run the tasks in the background; returns immediately"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.state = 'warming'
+            self.started_at = time.time()
+            self._thread = threading.Thread(target=self._run, name="warmup", daemon=True)
+            self._thread.start()
+
+    def run(self):
+        """Run the tasks in the calling thread (eager startup)"""
+        self.state = 'warming'
+        self.started_at = time.time()
+        self._run()
+
+    def _run(self):
+        failed = False
+        for name, func, required in self.tasks:
+            start = time.perf_counter()
+            try:
+                func()
+                error = None
+            except Exception as e:
+                error = str(e)
+                failed = failed or required
+                print(f"✗ Warmup task {name} failed: {e}")
+            self.results[name] = {'seconds': time.perf_counter() - start, 'required': required, 'error': error}
+            if error is None:
+                print(f"✓ Warmup task {name} done in {self.results[name]['seconds']:.2f}s")
+
+        self.finished_at = time.time()
+        self.state = 'failed' if failed else 'ready'
+        if not failed:
+            self._ready.set()
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def wait(self, timeout=None):
+        """Block until ready; returns False on timeout or failure"""
+        return self._ready.wait(timeout)
+
+    def mark_request(self):
+        """Record time-to-first-request (seconds since process start) on the first call"""
+        if self.time_to_first_request is None:
+            self.time_to_first_request = time.time() - PROCESS_START
+
+    def status(self):
+        return {
+            'state': self.state,
+            'ready': self.ready,
+            'uptime_seconds': time.time() - PROCESS_START,
+            'warmup_seconds': (self.finished_at - self.started_at) if self.finished_at else None,
+            'time_to_ready_seconds': (self.finished_at - PROCESS_START) if self.ready else None,
+            'time_to_first_request_seconds': self.time_to_first_request,
+            'tasks': self.results,
+        }
+
+
+def _import_module(name):
+    return lambda: importlib.import_module(name)
+
+
+def default_warmup(models=None, ocr=False):
+    """Warmup for the backend: heavy frameworks that are installed, model artifacts, OCR workers
+
+    Only frameworks that are installed are imported. Model files that are
+    missing are skipped by the registry. The OCR warmup is optional, so a
+    host without Tesseract still becomes ready.
+    """
+    warmup = Warmup()
+    for name in ('tensorflow', 'torch'):
+        if is_installed(name):
+            warmup.add(f"import {name}", _import_module(name))
+
+    def preload_models():
+        from model_registry import registry
+        registry.preload(models)
+
+    warmup.add("models", preload_models)
+
+    if ocr:
+        def warm_ocr():
+            from ocr_engine import get_engine
+            get_engine().warm_up()
+
+        warmup.add("ocr", warm_ocr, required=False)
+    return warmup
+
+
+def add_health_routes(app, warmup):
+    """/health/live (process is up) and /health/ready (503 until warmup is done) on a FastAPI app"""
+    from fastapi.responses import JSONResponse
+
+    @app.middleware("http")
+    async def first_request(request, call_next):
+        if not request.url.path.startswith("/health"):
+            warmup.mark_request()
+        return await call_next(request)
+
+    @app.get("/health/live")
+    async def live():
+        return {'status': 'alive', 'uptime_seconds': time.time() - PROCESS_START}
+
+    @app.get("/health/ready")
+    async def ready():
+        return JSONResponse(warmup.status(), status_code=200 if warmup.ready else 503)
+
+    return app